@@ -0,0 +1,50 @@
+import os
+import shutil
+import statistics
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment,
+    teardown_databases, teardown_test_environment,
+)
+
+
+@contextmanager
+def benchmark_environment():
+    """
+    Временная база и MEDIA_ROOT для бенчмарков: рабочая база не затрагивается.
+
+    Для SQLite используется файл, а не база в памяти, чтобы фоновые потоки
+    работали с той же базой через обычные блокировки.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='bench_')
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tmp_dir, 'bench.sqlite3')
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        with override_settings(MEDIA_ROOT=tmp_dir):
+            yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def latency_summary(samples):
+    """Сводка по задержкам в миллисекундах: среднее и перцентили p50/p95/p99."""
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(50), 3),
+        "p95_ms": round(percentile(95), 3),
+        "p99_ms": round(percentile(99), 3),
+    }
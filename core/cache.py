@@ -0,0 +1,140 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+
+_stats = {"hits": 0, "misses": 0, "not_modified": 0}
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _version_key(namespace, obj_id):
+    return f"api:ver:{namespace}:{obj_id}"
+
+
+def get_versions(dependencies):
+    """
+    Текущие версии объектов, от которых зависит ответ.
+
+    Версия — метка времени последнего изменения. Если версия вытеснена из кэша,
+    создаётся новая, поэтому старые записи никогда не переиспользуются.
+    """
+    keys = [_version_key(namespace, obj_id) for namespace, obj_id in dependencies]
+    versions = _cache().get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        _cache().set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(dependencies):
+    keys = [_version_key(namespace, obj_id) for namespace, obj_id in dependencies]
+    versions = await _cache().aget_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        await _cache().aset_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(namespace, ids):
+    """
+    Инвалидирует кэш объектов: сразу и ещё раз после коммита.
+
+    Повтор после коммита нужен, чтобы ответ, прочитанный другим запросом
+    до коммита, не остался в кэше под новой версией.
+    """
+    keys = [_version_key(namespace, obj_id) for obj_id in ids]
+    if not keys:
+        return
+
+    def bump():
+        _cache().set_many({key: time.time_ns() for key in keys}, timeout=None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def _etag(key, versions):
+    return hashlib.sha1(f"{key}|{versions}".encode()).hexdigest()
+
+
+def _not_modified(request, etag):
+    if etag not in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+        return None
+    _count("not_modified")
+    not_modified = HttpResponse(status=304)
+    not_modified['ETag'] = etag
+    return not_modified
+
+
+async def acached_response(request, response, key, dependencies, producer):
+    """
+    Read-through кэш для async GET-эндпоинтов; producer — корутинная функция.
+
+    Ключ записи и ETag строятся из key и версий зависимостей, поэтому после
+    изменения объекта старая запись просто перестаёт использоваться.
+    На совпадающий If-None-Match возвращается 304 без обращения к базе.
+    """
+    tag = _etag(key, await aget_versions(dependencies))
+    not_modified = _not_modified(request, f'"{tag}"')
+    if not_modified:
+        return not_modified
+
+    response['ETag'] = f'"{tag}"'
+    value = await _cache().aget(f"api:data:{tag}")
+    if value is None:
+        _count("misses")
+        value = await producer()
+        await _cache().aset(f"api:data:{tag}", value, timeout=getattr(settings, 'API_CACHE_TIMEOUT', 300))
+    else:
+        _count("hits")
+    return value
+
+
+def cached_buckets(namespace, buckets, producer, cacheable=lambda bucket: True):
+    """
+    Кэш агрегатов по временным корзинам (например, по дням).
+
+    Каждая корзина хранится отдельно под своей версией (namespace, bucket) и
+    общей версией (namespace, '*'), поэтому изменение данных одного дня
+    пересчитывает только этот день. producer(missing) считает недостающие
+    корзины за один раз и возвращает {bucket: value}. Корзины, для которых
+    cacheable(bucket) ложно (например, текущий день), считаются всегда.
+    """
+    versions = get_versions([(namespace, bucket) for bucket in buckets] + [(namespace, '*')])
+    epoch = versions.pop()
+    keys = {
+        bucket: f"api:bucket:{namespace}:{bucket}:{version}:{epoch}"
+        for bucket, version in zip(buckets, versions)
+    }
+    found = _cache().get_many([keys[bucket] for bucket in buckets if cacheable(bucket)])
+    result = {bucket: found[keys[bucket]] for bucket in buckets if keys[bucket] in found}
+
+    missing = [bucket for bucket in buckets if bucket not in result]
+    _count("misses" if missing else "hits")
+    if missing:
+        computed = producer(missing)
+        _cache().set_many(
+            {keys[bucket]: computed[bucket] for bucket in missing if cacheable(bucket)}, timeout=None,
+        )
+        result.update(computed)
+    return [result[bucket] for bucket in buckets]
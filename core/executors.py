@@ -0,0 +1,132 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.http import FileResponse, StreamingHttpResponse
+
+# Сколько частей потока может ждать отправки клиенту
+STREAM_BUFFER = 4
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name):
+    """
+    Именованный пул потоков для блокирующей работы.
+
+    Размер пула задаётся в settings.BLOCKING_EXECUTORS, поэтому тяжёлые задачи
+    (рендер QR, сборка XLSX) не могут занять больше потоков, чем выделено.
+    """
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BLOCKING_EXECUTORS', {}).get(name, 2),
+                thread_name_prefix=name,
+            )
+        return _executors[name]
+
+
+def _call_and_close_connection(func, args):
+    try:
+        return func(*args)
+    finally:
+        connection.close()
+
+
+async def run_blocking(name, func, *args):
+    """
+    Выполняет func(*args) в пуле name, не блокируя цикл событий.
+
+    Соединение с базой, открытое в потоке пула, закрывается после вызова.
+    Контекст (contextvars) передаётся в поток, как в asyncio.to_thread,
+    поэтому запросы к базе попадают в метрики исходного запроса.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_executor(name), context.run, _call_and_close_connection, func, args,
+    )
+
+
+async def aiter_blocking(name, iterable, buffer=STREAM_BUFFER):
+    """
+    Async-итератор по блокирующему iterable.
+
+    iterable целиком читается одной задачей пула name, то есть в одном потоке
+    с одним соединением с базой, а части передаются в цикл событий через
+    очередь на buffer элементов: память не растёт с размером потока, а чтение
+    остаётся в ограниченном пуле. Если клиент отключился, задача прекращает чтение.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=buffer)
+    stopped = threading.Event()
+    end = object()
+
+    def put(item):
+        if stopped.is_set():
+            return False
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+        return True
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for part in iterator:
+                if not put((part, None)):
+                    return
+        except Exception as e:
+            put((end, e))
+            return
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close:
+                close()
+        put((end, None))
+
+    context = contextvars.copy_context()
+    loop.run_in_executor(get_executor(name), context.run, _call_and_close_connection, produce, ())
+    try:
+        while True:
+            part, error = await queue.get()
+            if part is end:
+                if error:
+                    raise error
+                return
+            yield part
+    finally:
+        stopped.set()
+        # Освобождает задачу, если она ждёт места в очереди
+        while not queue.empty():
+            queue.get_nowait()
+
+
+class _PooledStreamMixin:
+    """
+    Под ASGI Django читает синхронный поток через sync_to_async(list), то есть
+    целиком в память. Здесь поток читается по частям в пуле executor;
+    под WSGI ответ по-прежнему отдаётся синхронным итератором.
+    """
+
+    def __init__(self, *args, executor, **kwargs):
+        self.executor = executor
+        super().__init__(*args, **kwargs)
+
+    async def __aiter__(self):
+        if self.is_async:
+            async for part in super().__aiter__():
+                yield part
+            return
+        async for part in aiter_blocking(self.executor, self.streaming_content):
+            yield part
+
+
+class PooledStreamingHttpResponse(_PooledStreamMixin, StreamingHttpResponse):
+    pass
+
+
+class PooledFileResponse(_PooledStreamMixin, FileResponse):
+    pass
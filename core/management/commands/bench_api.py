@@ -0,0 +1,277 @@
+import itertools
+import json
+import random
+import subprocess
+import time
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.benchmark import benchmark_environment, latency_summary
+from core.metrics import reset_metrics, route_metrics
+from orderApp.models import Order, OrderItem
+from orderApp.utils import wait_for_qr_jobs
+from productApp.models import Product, Stock
+from warehouseApp.models import Warehouse
+
+# Доли сценариев в смеси запросов: чтение преобладает, отчёты редки, но тяжёлые
+MIX = {
+    "product_list": 30,
+    "product_detail": 20,
+    "order_list": 15,
+    "order_detail": 10,
+    "order_create": 15,
+    "stock_transfer": 8,
+    "orders_report_csv": 1,
+    "stock_report_csv": 1,
+}
+SEED_BATCH_SIZE = 5000
+# Сравнение с базовым прогоном: какие показатели эндпоинта считаются регрессией при росте
+COMPARED = ("p95_ms", "queries_per_request")
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный бенчмарк API: наполняет временную базу и прогоняет смесь запросов "
+        "в процессе; JSON с p50/p95/p99, пропускной способностью и числом запросов к базе по эндпоинтам"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--warehouses', type=int, default=10)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--days', type=int, default=90, help="Период истории заказов")
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--warmup', type=int, default=100, help="Запросы прогрева, не входят в результат")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help="Сохранить результат в файл")
+        parser.add_argument('--baseline', help="JSON прошлого прогона для сравнения")
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help="Допустимый относительный рост p95 и числа запросов к базе",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        self.rng = random.Random(options['seed'])
+        self.client = Client()
+        with benchmark_environment(), override_settings(ORDER_QR_MODE='background'):
+            started = time.perf_counter()
+            self.seed(options)
+            seed_seconds = time.perf_counter() - started
+
+            self.replay(options['warmup'])
+            wait_for_qr_jobs()
+            reset_metrics()
+            samples, errors, routes, elapsed = self.replay(options['requests'])
+            wait_for_qr_jobs()
+            measured = route_metrics()
+
+        results = {
+            "commit": _git_commit(),
+            "dataset": {
+                "warehouses": options['warehouses'],
+                "products": options['products'],
+                "orders": options['orders'],
+                "seed": options['seed'],
+                "seed_seconds": round(seed_seconds, 2),
+            },
+            "requests": options['requests'],
+            "seconds": round(elapsed, 3),
+            "requests_per_second": round(options['requests'] / elapsed, 1),
+            "endpoints": {},
+        }
+        for name in MIX:
+            if not samples[name]:
+                continue
+            route = measured.get(routes[name], {})
+            count = route.get("count") or 1
+            results["endpoints"][name] = {
+                "route": " ".join(routes[name]),
+                "errors": errors[name],
+                # Последовательная пропускная способность: запросов в секунду одного клиента
+                "requests_per_second": round(len(samples[name]) / sum(samples[name]), 1),
+                **latency_summary(samples[name]),
+                "queries_per_request": round(route.get("queries", 0) / count, 2),
+                "query_ms_per_request": round(route.get("query_seconds", 0) * 1000 / count, 3),
+                "n_plus_one_requests": route.get("n_plus_one", 0),
+            }
+
+        regressions = compare(results, baseline, options['tolerance']) if baseline else []
+        if baseline:
+            results["baseline_commit"] = baseline.get("commit")
+            results["regressions"] = regressions
+
+        output = json.dumps(results, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        self.stdout.write(output)
+        if regressions:
+            raise CommandError(f"Регрессий относительно базового прогона: {len(regressions)}")
+
+    def seed(self, options):
+        """Склады, товары, остатки на каждом складе и история заказов — bulk_create пачками."""
+        rng = self.rng
+        self.warehouses = Warehouse.objects.bulk_create(
+            Warehouse(name=f"Склад {n}", address=f"ул. Складская, {n}") for n in range(options['warehouses'])
+        )
+        self.products = Product.objects.bulk_create(
+            (
+                Product(name=f"Товар {n}", product_type=f"Тип {n % 20}", price=rng.randint(10, 5000))
+                for n in range(options['products'])
+            ),
+            batch_size=SEED_BATCH_SIZE,
+        )
+        Stock.objects.bulk_create(
+            (
+                Stock(product=product, warehouse=warehouse, quantity=10 ** 6)
+                for warehouse in self.warehouses for product in self.products
+            ),
+            batch_size=SEED_BATCH_SIZE,
+        )
+        # Популярность товаров по Ципфу: первые товары заказывают чаще
+        self.cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(self.products) + 1)))
+
+        now = timezone.now()
+        orders = []
+        items = []
+        created = []
+        for n in range(options['orders']):
+            lines = self.order_lines()
+            order = Order(
+                warehouse=rng.choice(self.warehouses),
+                client_name=f"Клиент {rng.randint(1, options['orders'] // 5 + 1)}",
+                destination_address="ул. Доставки, 1",
+                total_price=sum((product.price * quantity for product, quantity in lines), Decimal(0)),
+                status=rng.choice(('new', 'processing', 'shipped', 'completed', 'completed', 'cancelled')),
+            )
+            orders.append(order)
+            items.append(lines)
+            created.append(now - timedelta(seconds=rng.randint(0, options['days'] * 86400)))
+        Order.objects.bulk_create(orders, batch_size=SEED_BATCH_SIZE)
+        # auto_now_add перезаписывает created_at при вставке, поэтому дата задаётся после
+        for order, created_at in zip(orders, created):
+            order.created_at = created_at
+        Order.objects.bulk_update(orders, ['created_at'], batch_size=SEED_BATCH_SIZE)
+        OrderItem.objects.bulk_create(
+            (
+                OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+                for order, lines in zip(orders, items) for product, quantity in lines
+            ),
+            batch_size=SEED_BATCH_SIZE,
+        )
+        self.order_ids = [order.id for order in orders]
+        self.report_since = (now - timedelta(days=7)).date().isoformat()
+
+    def order_lines(self):
+        chosen = set(self.rng.choices(self.products, cum_weights=self.cum_weights, k=self.rng.randint(1, 4)))
+        return [(product, self.rng.randint(1, 3)) for product in chosen]
+
+    def replay(self, count):
+        """Прогоняет count запросов смеси MIX; возвращает задержки, ошибки и маршруты по сценариям."""
+        names = list(MIX)
+        weights = list(MIX.values())
+        samples = {name: [] for name in names}
+        errors = dict.fromkeys(names, 0)
+        routes = {}
+        started = time.perf_counter()
+        for name in self.rng.choices(names, weights=weights, k=count):
+            method, path, body = getattr(self, f"request_{name}")()
+            request_started = time.perf_counter()
+            if method == 'GET':
+                response = self.client.get(path)
+            else:
+                response = self.client.post(path, body, content_type='application/json')
+            if response.streaming:
+                # Потоковые выгрузки учитываются целиком, до последнего байта
+                for _ in response.streaming_content:
+                    pass
+                response.close()
+            samples[name].append(time.perf_counter() - request_started)
+            if response.status_code != 200 or _is_error(response):
+                errors[name] += 1
+            routes.setdefault(name, (method, response.resolver_match.route))
+        return samples, errors, routes, time.perf_counter() - started
+
+    def request_product_list(self):
+        cursor = self.rng.choice(self.products).id
+        return 'GET', f"/api/products/product_list_get?{urlencode({'limit': 50, 'cursor': cursor})}", None
+
+    def request_product_detail(self):
+        product = self.rng.choices(self.products, cum_weights=self.cum_weights)[0]
+        return 'GET', f"/api/products/product_detail_get?product_id={product.id}", None
+
+    def request_order_list(self):
+        params = {'limit': 20}
+        if self.rng.random() < 0.5:
+            params['warehouse_id'] = self.rng.choice(self.warehouses).id
+        return 'GET', f"/api/orders/order?{urlencode(params)}", None
+
+    def request_order_detail(self):
+        return 'GET', f"/api/orders/order/{self.rng.choice(self.order_ids)}", None
+
+    def request_order_create(self):
+        return 'POST', '/api/orders/order_create', {
+            "warehouse_id": self.rng.choice(self.warehouses).id,
+            "client_name": "Клиент бенчмарка",
+            "destination_address": "ул. Доставки, 1",
+            "items": [{"product_id": product.id, "quantity": quantity} for product, quantity in self.order_lines()],
+        }
+
+    def request_stock_transfer(self):
+        source, target = self.rng.sample(self.warehouses, 2)
+        params = {
+            'product_id': self.rng.choice(self.products).id,
+            'from_warehouse_id': source.id,
+            'to_warehouse_id': target.id,
+            'quantity': 1,
+        }
+        return 'POST', f"/api/products/products/product_stock_transfer?{urlencode(params)}", None
+
+    def request_orders_report_csv(self):
+        return 'GET', f"/api/report/orders_report?format=csv&start={self.report_since}", None
+
+    def request_stock_report_csv(self):
+        return 'GET', "/api/report/stock_report?format=csv", None
+
+
+def _is_error(response):
+    # Операции со складом сообщают об ошибке в теле ответа со статусом 200
+    if response.streaming or not response['Content-Type'].startswith('application/json'):
+        return False
+    body = response.json()
+    return isinstance(body, dict) and body.get("status") == "error"
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Эндпоинты, у которых p95 или число запросов к базе выросли больше чем на tolerance."""
+    regressions = []
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            continue
+        for metric in COMPARED:
+            before, after = previous.get(metric), current[metric]
+            # Абсолютный порог отсекает шум на очень быстрых эндпоинтах
+            if before is not None and after > before * (1 + tolerance) and after - before > 0.5:
+                regressions.append({"endpoint": name, "metric": metric, "baseline": before, "current": after})
+    return regressions
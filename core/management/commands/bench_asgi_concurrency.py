@@ -0,0 +1,162 @@
+import asyncio
+import json
+import threading
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+
+from core.benchmark import benchmark_environment, latency_summary
+from orderApp.models import Order, OrderItem
+from productApp.models import Product, Stock
+from warehouseApp.models import Warehouse
+
+
+class QuietWSGIServer(ThreadedWSGIServer):
+    # Очередь на accept должна вместить всех клиентов сразу
+    request_queue_size = 1024
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Пропускная способность read-эндпоинтов при N одновременных клиентах: "
+        "потоковый WSGI-сервер против uvicorn (ASGI)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=20, help="Запросов на клиента")
+        parser.add_argument('--orders', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            import uvicorn
+        except ImportError:
+            raise CommandError("Для бенчмарка нужен uvicorn: pip install uvicorn")
+
+        with benchmark_environment():
+            paths = self.seed(options['orders'])
+            results = {"clients": options['clients'], "requests_per_client": options['requests']}
+            for name, serve in (("wsgi_threads", self.serve_wsgi), ("asgi_uvicorn", self.serve_asgi)):
+                with serve(uvicorn) as port:
+                    results[name] = asyncio.run(
+                        self.load(port, paths, options['clients'], options['requests'])
+                    )
+            results["throughput_ratio"] = round(
+                results["asgi_uvicorn"]["requests_per_second"] / results["wsgi_threads"]["requests_per_second"], 2
+            )
+
+        self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+
+    def seed(self, count):
+        warehouses = Warehouse.objects.bulk_create(
+            Warehouse(name=f"Склад {i}", address="—") for i in range(5)
+        )
+        products = Product.objects.bulk_create(
+            Product(name=f"Товар {i}", product_type="Бенчмарк", price=100) for i in range(200)
+        )
+        Stock.objects.bulk_create(
+            Stock(product=p, warehouse=w, quantity=100) for p in products for w in warehouses
+        )
+        orders = Order.objects.bulk_create(
+            Order(warehouse=warehouses[n % 5], client_name=f"Клиент {n}", destination_address="—", total_price=300)
+            for n in range(count)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=o, product=products[(n + i) % len(products)], quantity=1, price=100)
+            for n, o in enumerate(orders) for i in range(3)
+        )
+        return [
+            '/api/products/product_list_get?limit=50',
+            '/api/warehouses/warehouse_list',
+            '/api/orders/order?limit=20',
+            *[f'/api/orders/order/{o.id}' for o in orders[:50]],
+        ]
+
+    def serve_wsgi(self, uvicorn):
+        return _ServerThread(
+            start=lambda: self._start_wsgi(),
+        )
+
+    def _start_wsgi(self):
+        server = QuietWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+        server.set_app(WSGIHandler())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server.server_address[1], server.shutdown
+
+    def serve_asgi(self, uvicorn):
+        def start():
+            from core.asgi import application
+
+            config = uvicorn.Config(
+                application, host='127.0.0.1', port=0, lifespan='off', log_level='warning', backlog=2048,
+            )
+            server = uvicorn.Server(config)
+            thread = threading.Thread(target=server.run, daemon=True)
+            thread.start()
+            while not server.started:
+                time.sleep(0.05)
+            port = server.servers[0].sockets[0].getsockname()[1]
+
+            def stop():
+                server.should_exit = True
+                thread.join()
+            return port, stop
+
+        return _ServerThread(start=start)
+
+    async def load(self, port, paths, clients, requests):
+        samples = []
+        errors = 0
+
+        async def fetch(path):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: testserver\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            await writer.wait_closed()
+            return response.split(b" ", 2)[1]
+
+        async def client(index):
+            nonlocal errors
+            for n in range(requests):
+                path = paths[(index + n) % len(paths)]
+                started = time.perf_counter()
+                try:
+                    status = await fetch(path)
+                except OSError:
+                    status = b"error"
+                samples.append(time.perf_counter() - started)
+                if status != b"200":
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(i) for i in range(clients)))
+        elapsed = time.perf_counter() - started
+        return {
+            "requests_per_second": round(len(samples) / elapsed, 1),
+            "errors": errors,
+            "latency": latency_summary(samples),
+        }
+
+
+class _ServerThread:
+    """Контекстный менеджер: сервер в фоновом потоке, на выходе — остановка."""
+
+    def __init__(self, start):
+        self.start = start
+
+    def __enter__(self):
+        port, self.stop = self.start()
+        return port
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,394 @@
+import bisect
+import itertools
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import django
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.cache import bump_versions
+from orderApp.models import Order, OrderItem
+from orderApp.signals import orders_changed
+from productApp.models import Product, Stock, StockMovement
+from productApp.search import rebuild_search_index
+from warehouseApp.models import Warehouse
+
+# Заказы делятся на партиции постоянного размера: состав данных зависит только
+# от seed, а не от числа воркеров, которые эти партиции обрабатывают
+PARTITION_ORDERS = 20000
+BATCH_SIZE = 5000
+# Доля заказов с 1, 2, ... позициями убывает геометрически; в среднем ~2.4 позиции
+ITEMS_RATIO = 0.6
+QUANTITY_WEIGHTS = (50, 25, 12, 8, 5)
+# Недельная сезонность (пн..вс) и распределение заказов по часам суток
+WEEKDAY_FACTORS = (0.95, 0.95, 1.0, 1.0, 1.1, 1.25, 1.15)
+HOUR_WEIGHTS = (1, 1, 1, 1, 1, 2, 4, 6, 8, 9, 10, 10, 11, 11, 10, 10, 10, 11, 12, 12, 10, 7, 4, 2)
+# Пик годового сезона — середина декабря
+SEASON_PEAK_DAY = 350
+
+PRODUCT_TYPES = [
+    "Фрукты", "Овощи", "Молочное", "Бакалея", "Напитки", "Сладости", "Выпечка", "Заморозка",
+    "Мясо", "Рыба", "Бытовая химия", "Косметика", "Детское", "Зоотовары", "Канцелярия",
+    "Посуда", "Текстиль", "Электроника", "Инструменты", "Сад",
+]
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Екатеринбург", "Новосибирск", "Самара", "Тверь", "Сочи"]
+STREETS = ["Ленина", "Мира", "Садовая", "Лесная", "Центральная", "Школьная", "Новая", "Полевая"]
+
+_plan = None
+
+
+def _rng(seed, *parts):
+    # Строковый seed детерминирован между процессами, в отличие от hash()
+    return random.Random(":".join(str(part) for part in (seed, *parts)))
+
+
+def zipf_cum_weights(count, exponent):
+    """Накопленные веса рангов 1..count по закону Ципфа: вес ранга r — 1 / r**exponent."""
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def seasonal_day_counts(start, end, total, seasonality):
+    """
+    Распределяет total заказов по дням [start, end] с годовой и недельной сезонностью.
+
+    Вес дня — (1 + seasonality * cos(расстояние до пика сезона)) * множитель дня недели;
+    округление — методом наибольших остатков, поэтому сумма ровно total.
+    """
+    days = [start + timedelta(days=n) for n in range((end - start).days + 1)]
+    weights = [
+        (1 + seasonality * math.cos(2 * math.pi * (day.timetuple().tm_yday - SEASON_PEAK_DAY) / 365.25))
+        * WEEKDAY_FACTORS[day.weekday()]
+        for day in days
+    ]
+    scale = total / sum(weights)
+    exact = [weight * scale for weight in weights]
+    counts = [int(value) for value in exact]
+    by_remainder = sorted(range(len(days)), key=lambda n: (counts[n] - exact[n], n))
+    for n in by_remainder[:total - sum(counts)]:
+        counts[n] += 1
+    return list(zip(days, counts))
+
+
+def item_counts(seed, partition, size, max_items):
+    weights = list(itertools.accumulate(ITEMS_RATIO ** n for n in range(max_items)))
+    return _rng(seed, 'items', partition).choices(range(1, max_items + 1), cum_weights=weights, k=size)
+
+
+def _init_worker(plan):
+    global _plan
+    if not apps.ready:
+        django.setup()
+    _plan = plan
+
+
+def insert_rows(model, fields, rows):
+    """
+    Вставляет кортежи значений полей fields пачками executemany.
+
+    bulk_create готовит каждое значение через поле модели, и на миллионах
+    строк это основная часть времени; здесь значения уже в формате базы.
+    """
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(model._meta.get_field(name).column) for name in fields)
+    sql = (
+        f"INSERT INTO {qn(model._meta.db_table)} ({columns}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))})"
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), BATCH_SIZE):
+            cursor.executemany(sql, rows[start:start + BATCH_SIZE])
+
+
+def generate_stock(warehouse_index):
+    """Остатки одного склада и движения 'opening' к ним; id выводятся из индексов товара и склада."""
+    plan = _plan
+    rng = _rng(plan['seed'], 'stock', warehouse_index)
+    warehouse_id = plan['warehouse_ids'][warehouse_index]
+    product_count = len(plan['product_ids'])
+    opened_at = connection.ops.adapt_datetimefield_value(plan['history_start'])
+    stocks = []
+    movements = []
+    for index, product_id in enumerate(plan['product_ids']):
+        if rng.random() >= plan['stock_coverage']:
+            continue
+        # Популярные товары хранятся в большем количестве
+        mean = 20 + 2000 / plan['popularity_rank'][index] ** plan['zipf']
+        quantity = max(0, int(rng.gauss(mean, mean / 3)))
+        offset = warehouse_index * product_count + index + 1
+        stocks.append((plan['stock_base'] + offset, product_id, warehouse_id, quantity))
+        if quantity:
+            movements.append((
+                plan['movement_base'] + offset, product_id, warehouse_id, quantity,
+                'opening', 'generate_dataset', opened_at,
+            ))
+    with transaction.atomic():
+        insert_rows(Stock, ('id', 'product', 'warehouse', 'quantity'), stocks)
+        insert_rows(
+            StockMovement, ('id', 'product', 'warehouse', 'delta', 'kind', 'reference', 'created_at'), movements,
+        )
+    connection.close()
+    return 'stock', len(stocks)
+
+
+def _order_status(roll, age_days):
+    # Старые заказы завершены или отменены, свежие ещё в работе
+    if age_days > 14:
+        return 'completed' if roll < 0.93 else 'cancelled'
+    if age_days > 3:
+        return 'shipped' if roll < 0.3 else 'completed' if roll < 0.93 else 'cancelled'
+    return 'new' if roll < 0.5 else 'processing' if roll < 0.9 else 'cancelled'
+
+
+def generate_orders(partition):
+    """Заказы партиции с позициями. Строки собираются до транзакции, чтобы не держать блокировку записи."""
+    plan = _plan
+    seed = plan['seed']
+    rng = _rng(seed, 'orders', partition)
+    first = partition * PARTITION_ORDERS
+    last = min(plan['orders'], first + PARTITION_ORDERS)
+    size = last - first
+    counts = item_counts(seed, partition, size, plan['max_items'])
+    tz = timezone.get_current_timezone()
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+
+    product_ids = plan['product_ids']
+    prices = plan['prices']
+    by_rank = plan['by_rank']
+    cum_weights = plan['cum_weights']
+    day_ends = plan['day_ends']
+    days = plan['days']
+    quantity_weights = list(itertools.accumulate(QUANTITY_WEIGHTS))
+    quantities = range(1, len(QUANTITY_WEIGHTS) + 1)
+    # Поля заказа, не зависящие от состава, выбираются сразу на всю партицию
+    hours = rng.choices(range(24), cum_weights=list(itertools.accumulate(HOUR_WEIGHTS)), k=size)
+    warehouses = rng.choices(plan['warehouse_ids'], cum_weights=plan['warehouse_weights'], k=size)
+
+    orders = []
+    items = []
+    item_id = plan['item_base'] + plan['item_offsets'][partition]
+    day_index = bisect.bisect_right(day_ends, first)
+    for offset, count in enumerate(counts):
+        number = first + offset
+        while day_ends[day_index] <= number:
+            day_index += 1
+        day = days[day_index]
+        created_at = datetime(day.year, day.month, day.day, hours[offset], rng.randrange(60), rng.randrange(60))
+        order_id = plan['order_base'] + number + 1
+
+        chosen = dict.fromkeys(rng.choices(by_rank, cum_weights=cum_weights, k=min(count, len(product_ids))))
+        while len(chosen) < min(count, len(product_ids)):
+            chosen.setdefault(rng.choices(by_rank, cum_weights=cum_weights)[0])
+        total = Decimal(0)
+        for index, quantity in zip(chosen, rng.choices(quantities, cum_weights=quantity_weights, k=len(chosen))):
+            item_id += 1
+            items.append((item_id, order_id, product_ids[index], quantity, prices[index]))
+            total += prices[index] * quantity
+
+        status = _order_status(rng.random(), (plan['end'] - day).days)
+        orders.append((
+            order_id,
+            adapt_datetime(timezone.make_aware(created_at, tz)),
+            status,
+            warehouses[offset],
+            f"Клиент {rng.randint(1, plan['customers'])}",
+            f"г. {rng.choice(CITIES)}, ул. {rng.choice(STREETS)}, д. {rng.randint(1, 150)}",
+            '',
+            "Отменён клиентом" if status == 'cancelled' else None,
+            total,
+        ))
+
+    with transaction.atomic():
+        insert_rows(Order, (
+            'id', 'created_at', 'status', 'warehouse', 'client_name', 'destination_address',
+            'comment', 'cancellation_reason', 'total_price',
+        ), orders)
+        insert_rows(OrderItem, ('id', 'order', 'product', 'quantity', 'price'), items)
+    connection.close()
+    return 'orders', len(orders), len(items)
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует большой детерминированный набор данных: склады, товары, остатки и историю "
+        "заказов с популярностью товаров по Ципфу и сезонностью. Около 10 млн позиций — "
+        "--orders 4200000; данные добавляются к существующим"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--warehouses', type=int, default=20)
+        parser.add_argument('--products', type=int, default=50000)
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--customers', type=int, help="Число клиентов, по умолчанию — заказов / 10")
+        parser.add_argument('--max-items', type=int, default=8, help="Наибольшее число позиций в заказе")
+        parser.add_argument('--days', type=int, default=730, help="Длина истории заказов в днях")
+        parser.add_argument('--end', type=parse_date, help="Последний день истории, по умолчанию — сегодня")
+        parser.add_argument('--zipf', type=float, default=1.1, help="Показатель распределения Ципфа")
+        parser.add_argument('--seasonality', type=float, default=0.35, help="Амплитуда годового сезона, 0..1")
+        parser.add_argument('--stock-coverage', type=float, default=0.8, help="Доля товаров на каждом складе")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Процессы-генераторы")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help="Не пересобирать витрину продаж и поисковый индекс",
+        )
+
+    def handle(self, *args, **options):
+        if options['orders'] < 0 or options['products'] < 1 or options['warehouses'] < 1 or options['days'] < 1:
+            raise CommandError("Нужны хотя бы один товар, склад и день истории")
+        if not 0 <= options['seasonality'] < 1:
+            raise CommandError("--seasonality должен быть от 0 до 1")
+
+        started = time.perf_counter()
+        plan = self.plan(options)
+        self.stdout.write(
+            f"Склады: {len(plan['warehouse_ids'])}, товары: {len(plan['product_ids'])}, "
+            f"заказы: {plan['orders']} в {len(plan['item_offsets'])} партициях"
+        )
+
+        tasks = [(generate_stock, index) for index in range(len(plan['warehouse_ids']))]
+        tasks += [(generate_orders, partition) for partition in range(len(plan['item_offsets']))]
+        totals = {'stock': 0, 'orders': 0, 'items': 0}
+        for result in self.run(tasks, plan, options['workers']):
+            if result[0] == 'stock':
+                totals['stock'] += result[1]
+            else:
+                totals['orders'] += result[1]
+                totals['items'] += result[2]
+                self.stdout.write(
+                    f"  заказов {totals['orders']}/{plan['orders']}, позиций {totals['items']}, "
+                    f"{totals['items'] / (time.perf_counter() - started):.0f} позиций/с"
+                )
+
+        self.reset_sequences()
+        # Массовая вставка не отправляет сигналы: кэш отчётов и аналитики сбрасывается явно
+        orders_changed.send(sender=Order, order_ids=None)
+        bump_versions('report', ['stock'])
+        if not options['skip_derived']:
+            call_command(
+                'rollup_daily_sales', start=plan['days'][0], end=plan['end'],
+                workers=options['workers'], stdout=self.stdout,
+            )
+            rebuild_search_index()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Остатков: {totals['stock']}, заказов: {totals['orders']}, позиций: {totals['items']} "
+            f"за {time.perf_counter() - started:.1f} с"
+        ))
+
+    def plan(self, options):
+        """
+        Склады и товары создаются сразу; для остальных таблиц — всё, что нужно
+        воркерам: явные id, цены, веса популярности и число заказов по дням.
+        """
+        seed = options['seed']
+        rng = _rng(seed, 'catalog')
+        bases = {
+            model: model.objects.aggregate(top=Max('id'))['top'] or 0
+            for model in (Warehouse, Product, Stock, StockMovement, Order, OrderItem)
+        }
+
+        warehouse_ids = [bases[Warehouse] + n + 1 for n in range(options['warehouses'])]
+        Warehouse.objects.bulk_create(
+            Warehouse(id=warehouse_id, name=f"Склад {n + 1}", address=f"г. {rng.choice(CITIES)}, ул. {rng.choice(STREETS)}, д. {n + 1}")
+            for n, warehouse_id in enumerate(warehouse_ids)
+        )
+
+        product_ids = [bases[Product] + n + 1 for n in range(options['products'])]
+        # Цены распределены логарифмически равномерно: от 10 до 10 000
+        prices = [Decimal(round(10 ** rng.uniform(1, 4), 2)).quantize(Decimal('0.01')) for _ in product_ids]
+        Product.objects.bulk_create(
+            (
+                Product(
+                    id=product_id,
+                    name=f"{PRODUCT_TYPES[n % len(PRODUCT_TYPES)]} {n + 1}",
+                    product_type=PRODUCT_TYPES[n % len(PRODUCT_TYPES)],
+                    price=price,
+                    product_description=f"Артикул {seed}-{n + 1}",
+                )
+                for n, (product_id, price) in enumerate(zip(product_ids, prices))
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+        # Ранг популярности не совпадает с порядком id
+        by_rank = list(range(len(product_ids)))
+        rng.shuffle(by_rank)
+        popularity_rank = [0] * len(by_rank)
+        for rank, index in enumerate(by_rank, start=1):
+            popularity_rank[index] = rank
+
+        end = options['end'] or timezone.localdate()
+        start = end - timedelta(days=options['days'] - 1)
+        day_counts = seasonal_day_counts(start, end, options['orders'], options['seasonality'])
+
+        partitions = math.ceil(options['orders'] / PARTITION_ORDERS)
+        item_offsets = []
+        offset = 0
+        for partition in range(partitions):
+            item_offsets.append(offset)
+            size = min(PARTITION_ORDERS, options['orders'] - partition * PARTITION_ORDERS)
+            offset += sum(
+                min(count, len(product_ids))
+                for count in item_counts(seed, partition, size, options['max_items'])
+            )
+
+        return {
+            'seed': seed,
+            'orders': options['orders'],
+            'customers': options['customers'] or max(1, options['orders'] // 10),
+            'max_items': options['max_items'],
+            'zipf': options['zipf'],
+            'stock_coverage': options['stock_coverage'],
+            'warehouse_ids': warehouse_ids,
+            # Склады тоже неравны: у крупных больше заказов
+            'warehouse_weights': zipf_cum_weights(len(warehouse_ids), 0.5),
+            'product_ids': product_ids,
+            'prices': prices,
+            'by_rank': by_rank,
+            'popularity_rank': popularity_rank,
+            'cum_weights': zipf_cum_weights(len(product_ids), options['zipf']),
+            'days': [day for day, _ in day_counts],
+            'day_ends': list(itertools.accumulate(count for _, count in day_counts)),
+            'end': end,
+            'history_start': timezone.make_aware(datetime(start.year, start.month, start.day)),
+            'stock_base': bases[Stock],
+            'movement_base': bases[StockMovement],
+            'order_base': bases[Order],
+            'item_base': bases[OrderItem],
+            'item_offsets': item_offsets,
+        }
+
+    def run(self, tasks, plan, workers):
+        """Выполняет задачи в процессах; при одном воркере — в текущем процессе."""
+        if workers <= 1:
+            _init_worker(plan)
+            for func, arg in tasks:
+                yield func(arg)
+            return
+        # Дочерние процессы не должны унаследовать открытые соединения
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(plan,)) as executor:
+            futures = [executor.submit(func, arg) for func, arg in tasks]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def reset_sequences(self):
+        # Строки вставлены с явными id: последовательности PostgreSQL нужно сдвинуть
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Warehouse, Product, Stock, StockMovement, Order, OrderItem],
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,143 @@
+import pstats
+import threading
+import time
+from collections import Counter, deque
+from io import StringIO
+
+from core.cache import cache_stats
+
+# Границы гистограммы задержек в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_KEEP = 20
+PROFILE_LINES = 40
+
+_lock = threading.Lock()
+_routes = {}
+_profiles = deque(maxlen=PROFILE_KEEP)
+
+
+class RouteStats:
+    __slots__ = ('buckets', 'count', 'seconds', 'queries', 'query_seconds', 'n_plus_one', 'statuses')
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.n_plus_one = 0
+        self.statuses = Counter()
+
+
+def observe_request(method, route, status, seconds, queries, query_seconds, n_plus_one):
+    """Учитывает запрос в метриках маршрута. Метрики живут в памяти процесса."""
+    with _lock:
+        stats = _routes.get((method, route))
+        if stats is None:
+            stats = _routes[(method, route)] = RouteStats()
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                stats.buckets[index] += 1
+                break
+        stats.count += 1
+        stats.seconds += seconds
+        stats.queries += queries
+        stats.query_seconds += query_seconds
+        stats.n_plus_one += int(n_plus_one)
+        stats.statuses[status] += 1
+
+
+def route_metrics():
+    """Снимок метрик: {(метод, маршрут): {"count", "seconds", "queries", "query_seconds", "n_plus_one"}}."""
+    with _lock:
+        return {
+            key: {
+                "count": stats.count,
+                "seconds": stats.seconds,
+                "queries": stats.queries,
+                "query_seconds": stats.query_seconds,
+                "n_plus_one": stats.n_plus_one,
+            }
+            for key, stats in _routes.items()
+        }
+
+
+def reset_metrics():
+    with _lock:
+        _routes.clear()
+        _profiles.clear()
+
+
+def record_profile(method, route, seconds, profile):
+    """Сохраняет сводку cProfile медленного запроса: первые PROFILE_LINES строк по cumulative."""
+    out = StringIO()
+    pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    with _lock:
+        _profiles.append({
+            "method": method,
+            "route": route,
+            "duration_ms": round(seconds * 1000, 1),
+            "captured_at": time.time(),
+            "stats": out.getvalue(),
+        })
+
+
+def recent_profiles():
+    with _lock:
+        return list(reversed(_profiles))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def render_prometheus():
+    """Метрики в текстовом формате Prometheus 0.0.4."""
+    with _lock:
+        routes = sorted(
+            (key, stats.buckets[:], stats.count, stats.seconds, stats.queries,
+             stats.query_seconds, stats.n_plus_one, dict(stats.statuses))
+            for key, stats in _routes.items()
+        )
+
+    lines = [
+        "# HELP http_request_duration_seconds Длительность запроса по маршруту",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route), buckets, count, seconds, *_ in routes:
+        cumulative = 0
+        for bound, observed in zip(LATENCY_BUCKETS, buckets):
+            cumulative += observed
+            lines.append(f"http_request_duration_seconds_bucket{_labels(method=method, route=route, le=bound)} {cumulative}")
+        lines.append(f"http_request_duration_seconds_bucket{_labels(method=method, route=route, le='+Inf')} {count}")
+        lines.append(f"http_request_duration_seconds_sum{_labels(method=method, route=route)} {seconds:.6f}")
+        lines.append(f"http_request_duration_seconds_count{_labels(method=method, route=route)} {count}")
+
+    lines += [
+        "# HELP http_responses_total Ответы по маршруту и коду статуса",
+        "# TYPE http_responses_total counter",
+    ]
+    for (method, route), *_, statuses in routes:
+        for status, total in sorted(statuses.items()):
+            lines.append(f"http_responses_total{_labels(method=method, route=route, status=status)} {total}")
+
+    counters = (
+        ("db_queries_total", "Запросы к базе по маршруту", 4),
+        ("db_query_duration_seconds_total", "Время запросов к базе по маршруту", 5),
+        ("db_n_plus_one_requests_total", "Запросы, в которых один SQL повторился N и более раз", 6),
+    )
+    for name, help_text, index in counters:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for row in routes:
+            method, route = row[0]
+            value = f"{row[index]:.6f}" if isinstance(row[index], float) else row[index]
+            lines.append(f"{name}{_labels(method=method, route=route)} {value}")
+
+    lines += ["# HELP api_cache_events_total События read-through кэша (core.cache)", "# TYPE api_cache_events_total counter"]
+    for event, total in sorted(cache_stats().items()):
+        lines.append(f"api_cache_events_total{_labels(event=event)} {total}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,208 @@
+import cProfile
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import FileResponse
+
+from core.metrics import observe_request, record_profile
+
+logger = logging.getLogger(__name__)
+
+# Одновременно может работать только один cProfile на процесс
+_profile_lock = threading.Lock()
+# Счётчик текущего запроса; contextvars переходят в потоки sync_to_async
+_recorder = ContextVar('query_recorder', default=None)
+
+
+class QueryRecorder:
+    """execute_wrapper: считает запросы к базе, их время и повторы одного SQL."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def repeated(self, threshold):
+        """SQL, выполненные threshold и более раз, — признак N+1."""
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+def _record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder():
+    """
+    Подключает счётчик к соединению текущего потока.
+
+    Соединения у каждого потока свои, а ORM в async-коде работает в потоке
+    sync_to_async, поэтому обёртка ставится постоянно и сама находит счётчик
+    запроса через contextvar, а не через with connection.execute_wrapper().
+    """
+    _install(connection)
+
+
+def _install(conn):
+    if _record_query not in conn.execute_wrappers:
+        conn.execute_wrappers.append(_record_query)
+
+
+def _install_on_connect(sender, connection, **kwargs):
+    # Соединения потоков пулов core.executors открываются заново на каждую задачу
+    _install(connection)
+
+
+connection_created.connect(_install_on_connect, dispatch_uid='core.middleware.query_recorder')
+
+
+def _record_stream(chunks, recorder, observe):
+    try:
+        iterator = iter(chunks)
+        while True:
+            token = _recorder.set(recorder)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _recorder.reset(token)
+            yield chunk
+    finally:
+        observe()
+
+
+async def _arecord_stream(chunks, recorder, observe):
+    try:
+        iterator = aiter(chunks)
+        while True:
+            token = _recorder.set(recorder)
+            try:
+                chunk = await anext(iterator)
+            except StopAsyncIteration:
+                return
+            finally:
+                _recorder.reset(token)
+            yield chunk
+    finally:
+        observe()
+
+
+class MetricsMiddleware:
+    """
+    Метрики запросов к API: гистограмма задержек по маршруту, число и время
+    запросов к базе, поиск N+1. Метрики отдаёт /api/metrics.
+
+    При PROFILE_SAMPLE_RATE > 0 доля запросов профилируется cProfile; профиль
+    сохраняется, если запрос шёл дольше PROFILE_THRESHOLD_MS (/api/profiles).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        install_query_recorder()
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        profile = self._start_profile()
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            self._stop_profile(profile)
+            _recorder.reset(token)
+            if response is None:
+                self._observe(request, 500, time.perf_counter() - started, recorder, profile)
+        return self._finish(request, response, started, recorder, profile)
+
+    async def __acall__(self, request):
+        await sync_to_async(install_query_recorder)()
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        profile = self._start_profile()
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._stop_profile(profile)
+            _recorder.reset(token)
+            if response is None:
+                self._observe(request, 500, time.perf_counter() - started, recorder, profile)
+        return self._finish(request, response, started, recorder, profile)
+
+    def _finish(self, request, response, started, recorder, profile):
+        """
+        Учитывает ответ в метриках. Потоковые выгрузки читают базу уже после
+        выхода из view, поэтому их запросы и время считаются до конца потока.
+        FileResponse не оборачивается, чтобы сервер мог отдать файл через sendfile.
+        """
+        def observe():
+            self._observe(request, response.status_code, time.perf_counter() - started, recorder, profile)
+
+        if not response.streaming or isinstance(response, FileResponse):
+            observe()
+        elif response.is_async:
+            response.streaming_content = _arecord_stream(response.streaming_content, recorder, observe)
+        else:
+            response.streaming_content = _record_stream(response.streaming_content, recorder, observe)
+        return response
+
+    def _start_profile(self):
+        # В async-режиме в профиль попадают и корутины других запросов этого цикла событий
+        rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        if rate <= 0 or random.random() >= rate or not _profile_lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Активен другой профилировщик, например запущенный вручную
+            _profile_lock.release()
+            return None
+        return profile
+
+    def _stop_profile(self, profile):
+        if profile is not None:
+            profile.disable()
+            _profile_lock.release()
+
+    def _observe(self, request, status, seconds, recorder, profile):
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match else 'unmatched'
+        threshold = getattr(settings, 'METRICS_N_PLUS_ONE_THRESHOLD', 5)
+        repeated = recorder.repeated(threshold)
+        if repeated:
+            sql, count = repeated[0]
+            logger.warning("Возможный N+1 в %s %s: %d раз %s", request.method, route, count, sql)
+        observe_request(request.method, route, status, seconds, recorder.count, recorder.seconds, bool(repeated))
+        if profile is not None and seconds * 1000 >= getattr(settings, 'PROFILE_THRESHOLD_MS', 500):
+            record_profile(request.method, route, seconds, profile)
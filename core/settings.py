@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,6 +48,7 @@ INSTALLED_APPS = [
     'warehouseApp',
     'userApp',
     'orderApp',
+    'reportApp',
     'corsheaders',
     'ninja',
 ]
@@ -56,6 +60,7 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,13 +94,105 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# Профиль базы выбирается переменной DB_ENGINE: sqlite (по умолчанию, для
+# разработки) или postgres (продакшен).
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DB_POOL = os.environ.get('DB_POOL', '1') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'order_manager'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Пул psycopg несовместим с постоянными соединениями Django:
+            # с пулом соединение возвращается в пул после каждого запроса
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '20')),
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+                } if DB_POOL else False,
+            },
+        }
+    }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Транзакция сразу берёт блокировку записи: чтение с последующим
+                # UPDATE не падает с "database is locked" при параллельной записи
+                'transaction_mode': 'IMMEDIATE',
+                # Ожидание блокировки писателем (busy_timeout), секунды
+                'timeout': int(os.environ.get('DB_BUSY_TIMEOUT', '20')),
+                # WAL: читатели не ждут писателя; NORMAL безопасен в режиме WAL
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            },
+            # Тестовая база — файл: в общей базе в памяти параллельные транзакции
+            # сразу падают с "database table is locked", не дожидаясь busy_timeout
+            'TEST': {'NAME': os.environ.get('DB_TEST_NAME', BASE_DIR / 'test_db.sqlite3')},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Неизвестный DB_ENGINE: {DB_ENGINE}")
+
+
+# Кэш чтения товаров и складов (core.cache). По умолчанию — в памяти процесса;
+# для нескольких воркеров нужен общий FileBasedCache или RedisCache: в нём же
+# хранятся версии данных, по которым фоновые отчёты ищут готовый артефакт.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'locmem')],
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'order-manager'),
     }
 }
 
+API_CACHE_TIMEOUT = 300
+
+# QR-код нового заказа (orderApp.utils.schedule_order_qr): 'background' — в пуле 'qr'
+# после коммита, 'after_commit' — синхронно после коммита, 'inline' — прямо в транзакции
+# создания заказа (прежнее поведение, для сравнения в bench_order_create).
+ORDER_QR_MODE = os.environ.get('ORDER_QR_MODE', 'background')
+
+# Фоновые отчёты (reportApp): при False задача выполняется сразу после коммита.
+# Задача в running дольше REPORT_JOB_TIMEOUT секунд считается брошенной
+# и возвращается в очередь командой process_report_jobs.
+REPORT_JOBS_ASYNC = True
+REPORT_JOB_TIMEOUT = int(os.environ.get('REPORT_JOB_TIMEOUT', '1800'))
+
+# Компакция журнала остатков (productApp.utils.compact_stock_ledger) берёт только движения
+# старше LEDGER_COMPACTION_GRACE секунд: id выдаётся при INSERT, а виден после коммита,
+# поэтому запас должен превышать самую долгую транзакцию.
+LEDGER_COMPACTION_GRACE = int(os.environ.get('LEDGER_COMPACTION_GRACE', '900'))
+
+# Ограниченные пулы потоков для блокирующей работы async-эндпоинтов (core.executors)
+BLOCKING_EXECUTORS = {
+    'qr': int(os.environ.get('QR_WORKERS', '2')),
+    'reports': int(os.environ.get('REPORT_WORKERS', '2')),
+}
+
+# Метрики API (core.middleware): N+1 — один SQL повторился за запрос столько раз и более.
+# Профилирование включается долей запросов PROFILE_SAMPLE_RATE (0..1);
+# сохраняются профили запросов дольше PROFILE_THRESHOLD_MS и видны группе admin.
+# /api/metrics и /api/cache_stats отдаются только адресам METRICS_ALLOWED_IPS (через запятую).
+METRICS_N_PLUS_ONE_THRESHOLD = int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', '5'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_THRESHOLD_MS = int(os.environ.get('PROFILE_THRESHOLD_MS', '500'))
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -1,13 +1,19 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
+from django.http import HttpResponse
 from django.urls import path
 from ninja import NinjaAPI
+from ninja.errors import HttpError
+
+from core.cache import cache_stats
+from core.metrics import recent_profiles, render_prometheus
 
 from orderApp.api import order_router
 from productApp.api import product_router
 from reportApp.api import report_router
 from userApp.api import auth_router
+from userApp.utils import group_required
 from warehouseApp.api import warehouse_router
 
 api = NinjaAPI(
@@ -21,6 +27,33 @@ api.add_router('/auth/', auth_router)
 api.add_router('/orders/', order_router)
 api.add_router('/report/', report_router)
 
+
+def check_metrics_access(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise HttpError(403, "Доступ к метрикам запрещён")
+
+
+@api.get('/cache_stats', tags=['Служебное'])
+def get_cache_stats(request):
+    """Счётчики попаданий кэша API; доступны только адресам METRICS_ALLOWED_IPS."""
+    check_metrics_access(request)
+    return cache_stats()
+
+
+@api.get('/metrics', tags=['Служебное'])
+def get_metrics(request):
+    """Метрики процесса в текстовом формате Prometheus; доступны только адресам METRICS_ALLOWED_IPS."""
+    check_metrics_access(request)
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api.get('/profiles', tags=['Служебное'])
+@group_required("admin")
+def get_profiles(request):
+    """Последние профили cProfile медленных запросов (при PROFILE_SAMPLE_RATE > 0)."""
+    return recent_profiles()
+
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', api.urls),
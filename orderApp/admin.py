@@ -1,14 +1,57 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.db import transaction
 from unfold.admin import ModelAdmin
 from .models import Order, OrderItem, Return, ReturnItem
+from .utils import transition_orders
 from warehouseApp.models import Warehouse
 from productApp.models import Product
 
 
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = "__all__"
+
+    def clean_status(self):
+        status = self.cleaned_data["status"]
+        if self.instance.pk and status != self.instance.status:
+            if not self.instance.can_transition_to(status):
+                raise forms.ValidationError(
+                    f"Переход из статуса '{self.instance.get_status_display()}' недопустим"
+                )
+            if status == 'cancelled':
+                raise forms.ValidationError("Отменяйте заказ действием в списке, чтобы вернуть товар на склад")
+        return status
+
+
+def status_action(status, label):
+    def action(modeladmin, request, queryset):
+        with transaction.atomic():
+            updated, rejected = transition_orders(
+                list(queryset.values_list('id', flat=True)), status, reason="Отменён в админке",
+            )
+        modeladmin.message_user(request, f"Переведено заказов: {len(updated)}")
+        if rejected:
+            modeladmin.message_user(
+                request, f"Недопустимый переход для заказов: {', '.join(map(str, rejected))}", messages.WARNING,
+            )
+    action.__name__ = f"mark_{status}"
+    action.short_description = label
+    return action
+
+
 @admin.register(Order)
 class OrderAdmin(ModelAdmin):
+    form = OrderAdminForm
     list_display = ["id", "client_name", "status", "warehouse", "total_price", "created_at"]
-    list_editable = ["status"]  # Делаем поле status редактируемым в списке
+    # Статусы меняются пакетно действиями по графу переходов, а не построчным сохранением
+    actions = [
+        status_action('processing', "Перевести в обработку"),
+        status_action('shipped', "Отметить отправленными"),
+        status_action('completed', "Завершить"),
+        status_action('cancelled', "Отменить и вернуть товар на склад"),
+    ]
     list_filter = ["status", "warehouse", "created_at"]
     search_fields = ["client_name", "destination_address", "comment"]
     list_select_related = ["warehouse"]  # Оптимизация запросов
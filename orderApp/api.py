@@ -1,141 +1,262 @@
-from django.shortcuts import get_object_or_404
+import sys
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Optional
+
+from django.db.models import Q
+from django.shortcuts import aget_object_or_404, get_object_or_404
 from ninja import Router
 from orderApp.models import Order, OrderItem, Return, ReturnItem
+from orderApp.signals import orders_changed, orders_placed
 from orderApp.schemas import (
-    OrderOut, OrderIn, OrderItemOut,
-    OrderStatusIn, ReturnOut, ReturnIn, ReturnItemOut, ReturnItemIn, OrderCancellationIn
+    OrderOut, OrderIn, OrderBulkIn, OrderBulkResultOut,
+    OrderStatusIn, ReturnOut, ReturnIn, ReturnItemOut, ReturnItemIn, OrderCancellationIn,
+    ReturnBulkIn, ReturnBulkResultOut, OrderCancelStaleIn, OrderCancelStaleOut,
+    OrderBulkStatusIn, OrderBulkStatusOut,
 )
 from productApp.models import Product, Stock
+from productApp.utils import (
+    InsufficientStock, Shortage, StockConflict, decrement_stock, merge_lines, record_movements,
+    reserve_stock,
+)
+from orderApp.utils import (
+    aattach_order_qr, aserialize_orders, day_start, decode_order_cursor, encode_order_cursor,
+    order_qr_payload,
+    cancel_orders, cancel_stale_orders, orders_response, register_returns, schedule_order_qr,
+    serialize_orders, transition_orders, ReturnOrderNotFound, ReturnRejected,
+)
 from warehouseApp.models import Warehouse
-import qrcode
-from io import BytesIO
-from django.core.files import File
 from ninja.errors import HttpError
-from django.db import transaction
+from django.db import connection, transaction
+from django.http import FileResponse, HttpResponse
+from django.utils import timezone
 
 order_router = Router(tags=['Заказы'])
 
+ORDER_PAGE_SIZE = 50
+ORDER_MAX_PAGE_SIZE = 500
+RETURN_PAGE_SIZE = 50
+
+def shortage_message(shortages, products, warehouse):
+    return "; ".join(
+        f"Недостаточно товара '{products[s.product_id].name}' на складе '{warehouse.name}' "
+        f"(запрошено {s.requested}, доступно {s.available})"
+        for s in shortages
+    ) or "Недостаточно товара на складе"
+
 @order_router.post('/order_create', response=OrderOut)
 def create_order(request, data: OrderIn):
     warehouse = get_object_or_404(Warehouse, id=data.warehouse_id)
 
-    # Проверка наличия и достаточности запаса
-    for item in data.items:
-        product = get_object_or_404(Product, id=item.product_id)
-        stock = get_object_or_404(Stock, product=product, warehouse=warehouse)
-        if stock.quantity < item.quantity:
-            raise HttpError(400,
-                            f"Недостаточно товара '{product.name}' на складе '{warehouse.name}'")
+    if any(item.quantity <= 0 for item in data.items):
+        raise HttpError(400, "Количество товара должно быть положительным")
+
+    product_ids = {item.product_id for item in data.items}
+    products = Product.objects.in_bulk(product_ids)
+    if len(products) != len(product_ids):
+        raise HttpError(404, "Товар не найден")
 
-    # Создание заказа и QR-кода
+    # Создание заказа
     with transaction.atomic():
-        order = Order.objects.create(
+        order = Order(
             warehouse=warehouse,
             client_name=data.client_name,                 # NEW
             destination_address=data.destination_address, # NEW
-            comment=data.comment                          # NEW
+            comment=data.comment or ""                    # NEW
         )
-
-        # Генерация QR
-        qr_data = request.build_absolute_uri(f"/api/orders/order/{order.id}")
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        qr_image = qr.make_image(fill='black', back_color='white')
-        buffer = BytesIO()
-        qr_image.save(buffer, format='PNG')
-        file_name = f"order_{order.id}_qr.png"
-        order.qr_code.save(file_name, File(buffer), save=True)
-        buffer.close()
-
-        items_out = []
-        for item in data.items:
-            product = get_object_or_404(Product, id=item.product_id)
-            stock = get_object_or_404(Stock, product=product, warehouse=warehouse)
-            order_item = OrderItem.objects.create(
+        order_items = [
+            OrderItem(
                 order=order,
-                product=product,
+                product=products[item.product_id],
                 quantity=item.quantity,
-                price=product.price                     # NEW: сохраняем цену продукта
+                price=products[item.product_id].price   # NEW: сохраняем цену продукта
             )
-            stock.quantity -= item.quantity
-            stock.save()
-            items_out.append(OrderItemOut(
-                product_id=product.id,
-                name=product.name,
-                quantity=item.quantity,
-                price=product.price                     # NEW
-            ))
-
-        return OrderOut(
-            id=order.id,
-            status=order.status,
-            created_at=order.created_at.isoformat(),
-            warehouse=order.warehouse.id,
-            qr_code=order.qr_code.url if order.qr_code else None,
-            client_name=order.client_name,                 # NEW
-            destination_address=order.destination_address, # NEW
-            comment=order.comment,                         # NEW
-            total_price=order.total_price,                 # NEW
-            items=items_out
+            for item in data.items
+        ]
+        # bulk_create не вызывает сигналы, поэтому сумма заказа записывается сразу
+        order.total_price = sum(i.price * i.quantity for i in order_items)
+        order.save()
+
+        # Резервирование всех строк заказа одним условным UPDATE
+        try:
+            reserve_stock(
+                warehouse.id,
+                [(item.product_id, item.quantity) for item in data.items],
+                reference=f"order:{order.id}",
+            )
+        except InsufficientStock as e:
+            raise HttpError(400, shortage_message(e.shortages, products, warehouse))
+
+        OrderItem.objects.bulk_create(order_items)
+        orders_placed.send(sender=Order, order_ids=[order.id])
+
+        # QR-код генерируется после коммита, вне транзакции
+        schedule_order_qr(order.id, order_qr_payload(request, order.id))
+
+    return orders_response(serialize_orders([order.id])[0])
+
+@order_router.post('/bulk_create', response=list[OrderBulkResultOut])
+def bulk_create_orders(request, data: OrderBulkIn):
+    warehouse_ids = {o.warehouse_id for o in data.orders}
+    product_ids = {item.product_id for o in data.orders for item in o.items}
+    warehouses = Warehouse.objects.in_bulk(warehouse_ids)
+    products = Product.objects.in_bulk(product_ids)
+
+    results = [OrderBulkResultOut(index=index, success=False) for index in range(len(data.orders))]
+    accepted = []
+
+    with transaction.atomic():
+        # Все остатки нужных складов и товаров одним запросом
+        stocks = Stock.objects.filter(warehouse_id__in=warehouse_ids, product_id__in=product_ids)
+        if connection.features.has_select_for_update:
+            stocks = stocks.select_for_update().order_by('id')
+        available = {
+            (warehouse_id, product_id): [stock_id, quantity]
+            for stock_id, warehouse_id, product_id, quantity
+            in stocks.values_list('id', 'warehouse_id', 'product_id', 'quantity')
+        }
+
+        # Заказы резервируются по очереди в памяти; не прошедшие проверку пропускаются
+        decrements = defaultdict(int)
+        for index, order_in in enumerate(data.orders):
+            warehouse = warehouses.get(order_in.warehouse_id)
+            if warehouse is None:
+                results[index].error = "Склад не найден"
+                continue
+            if any(item.product_id not in products for item in order_in.items):
+                results[index].error = "Товар не найден"
+                continue
+            if any(item.quantity <= 0 for item in order_in.items):
+                results[index].error = "Количество товара должно быть положительным"
+                continue
+
+            wanted = merge_lines((item.product_id, item.quantity) for item in order_in.items)
+            shortages = []
+            for product_id, quantity in wanted.items():
+                in_stock = available.get((warehouse.id, product_id), [None, 0])[1]
+                if in_stock < quantity:
+                    shortages.append(Shortage(product_id, quantity, in_stock))
+            if shortages:
+                results[index].error = shortage_message(shortages, products, warehouse)
+                continue
+
+            for product_id, quantity in wanted.items():
+                stock = available[(warehouse.id, product_id)]
+                stock[1] -= quantity
+                decrements[stock[0]] += quantity
+            accepted.append((index, order_in))
+
+        if decrement_stock(Stock.objects.all(), 'id', decrements) != len(decrements):
+            raise HttpError(409, "Остатки изменились во время обработки, повторите запрос")
+
+        orders = []
+        order_items = []
+        for index, order_in in accepted:
+            order = Order(
+                warehouse_id=order_in.warehouse_id,
+                client_name=order_in.client_name,
+                destination_address=order_in.destination_address,
+                comment=order_in.comment or "",
+            )
+            items = [
+                OrderItem(
+                    order=order,
+                    product_id=item.product_id,
+                    quantity=item.quantity,
+                    price=products[item.product_id].price,
+                )
+                for item in order_in.items
+            ]
+            order.total_price = sum(i.price * i.quantity for i in items)
+            orders.append(order)
+            order_items.extend(items)
+
+        Order.objects.bulk_create(orders)
+        OrderItem.objects.bulk_create(order_items)
+        orders_changed.send(sender=Order, order_ids=[order.id for order in orders])
+        orders_placed.send(sender=Order, order_ids=[order.id for order in orders])
+        record_movements(
+            (item.product_id, item.order.warehouse_id, -item.quantity, 'order', f"order:{item.order_id}")
+            for item in order_items
         )
 
+        for (index, _), order in zip(accepted, orders):
+            results[index].success = True
+            results[index].order_id = order.id
+            schedule_order_qr(order.id, order_qr_payload(request, order.id))
+
+    return results
+
 @order_router.get('/order/{order_id}', response=OrderOut)
-def get_order(request, order_id: int):
-    order = get_object_or_404(Order, id=order_id)
-    items_out = [
-        OrderItemOut(
-            product_id=item.product.id,
-            name=item.product.name,
-            quantity=item.quantity,
-            price=item.price                    # NEW
-        )
-        for item in order.items.all()
-    ]
+async def get_order(request, order_id: int):
+    orders = await aserialize_orders([order_id])
+    if not orders:
+        raise HttpError(404, "Заказ не найден")
+    return orders_response(orders[0])
 
-    return OrderOut(
-        id=order.id,
-        status=order.status,
-        created_at=order.created_at.isoformat(),
-        warehouse=order.warehouse.id,
-        qr_code=order.qr_code.url if order.qr_code else None,
-        client_name=order.client_name,                 # NEW
-        destination_address=order.destination_address, # NEW
-        comment=order.comment,                         # NEW
-        total_price=order.total_price,                 # NEW
-        items=items_out,
-        cancellation_reason=order.cancellation_reason
-    )
+@order_router.get('/order/{order_id}/qr')
+async def get_order_qr(request, order_id: int):
+    order = await aget_object_or_404(Order.objects.only('id', 'qr_code'), id=order_id)
+    # Если фоновая генерация ещё не успела, рендерим при первом запросе в пуле 'qr'
+    if not order.qr_code:
+        order.qr_code.name = await aattach_order_qr(order.id, order_qr_payload(request, order.id))
+    return FileResponse(order.qr_code.open('rb'), content_type='image/png')
 
 @order_router.get('/order', response=list[OrderOut])
-def list_orders(request):
-    orders = Order.objects.all().select_related('warehouse').prefetch_related('items__product')
-    result = []
-
-    for order in orders:
-        items_out = [
-            OrderItemOut(
-                product_id=item.product.id,
-                name=item.product.name,
-                quantity=item.quantity,
-                price=item.price              # NEW
-            )
-            for item in order.items.all()
-        ]
+async def list_orders(
+    request,
+    status: Optional[str] = None,
+    warehouse_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    client_name: Optional[str] = None,
+    min_total: Optional[float] = None,
+    max_total: Optional[float] = None,
+    cursor: Optional[str] = None,
+    limit: int = ORDER_PAGE_SIZE,
+    with_count: bool = False,
+):
+    if not 0 < limit <= ORDER_MAX_PAGE_SIZE:
+        raise HttpError(400, f"limit должен быть от 1 до {ORDER_MAX_PAGE_SIZE}")
+
+    orders = Order.objects.all()
+    if status is not None:
+        orders = orders.filter(status=status)
+    if warehouse_id is not None:
+        orders = orders.filter(warehouse_id=warehouse_id)
+    # Диапазон дат переводится в границы created_at, чтобы работал индекс
+    if date_from is not None:
+        orders = orders.filter(created_at__gte=day_start(date_from))
+    if date_to is not None:
+        orders = orders.filter(created_at__lt=day_start(date_to + timedelta(days=1)))
+    if client_name:
+        # Диапазон по индексу client_name + точная проверка префикса
+        orders = orders.filter(client_name__gte=client_name, client_name__startswith=client_name)
+        # После U+10FFFF следующего символа нет — остаётся только нижняя граница
+        if client_name[-1] != chr(sys.maxunicode):
+            orders = orders.filter(client_name__lt=client_name[:-1] + chr(ord(client_name[-1]) + 1))
+    if min_total is not None:
+        orders = orders.filter(total_price__gte=min_total)
+    if max_total is not None:
+        orders = orders.filter(total_price__lte=max_total)
 
-        result.append(OrderOut(
-            id=order.id,
-            status=order.status,
-            created_at=order.created_at.isoformat(),
-            warehouse=order.warehouse.id,
-            qr_code=order.qr_code.url if order.qr_code else None,
-            client_name=order.client_name,                 # NEW
-            destination_address=order.destination_address, # NEW
-            comment=order.comment,                         # NEW
-            total_price=order.total_price,                 # NEW
-            items=items_out
-        ))
+    total_count = await orders.acount() if with_count else None
 
+    # Keyset-пагинация по (created_at, id), новые заказы первыми
+    if cursor:
+        created_at, order_id = decode_order_cursor(cursor)
+        orders = orders.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=order_id))
+    # Лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+    page = [row async for row in orders.order_by('-created_at', '-id').values_list('created_at', 'id')[:limit + 1]]
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    result = orders_response(await aserialize_orders(order_id for _, order_id in page))
+    if total_count is not None:
+        result['X-Total-Count'] = str(total_count)
+    result['X-Has-More'] = 'true' if has_more else 'false'
+    if has_more:
+        result['X-Next-Cursor'] = encode_order_cursor(*page[-1])
     return result
 
 @order_router.patch('/order/{order_id}/status', response=OrderOut)
@@ -145,32 +266,22 @@ def update_order_status(request, order_id: int, data: OrderStatusIn):
     if data.status not in dict(Order.STATUS_CHOICES):
         raise HttpError(400, f"Недопустимый статус: {data.status}")
 
-    order.status = data.status
-    order.save()
-
-    items_out = [
-        OrderItemOut(
-            product_id=item.product.id,
-            name=item.product.name,
-            quantity=item.quantity,
-            price=item.price                # NEW
+    with transaction.atomic():
+        updated, _ = transition_orders([order.id], data.status)
+    if not updated:
+        raise HttpError(
+            400, f"Переход из статуса '{order.get_status_display()}' в '{data.status}' недопустим"
         )
-        for item in order.items.all()
-    ]
+    return orders_response(serialize_orders([order.id])[0])
 
-    return OrderOut(
-        id=order.id,
-        status=order.status,
-        created_at=order.created_at.isoformat(),
-        warehouse=order.warehouse.id,
-        qr_code=order.qr_code.url if order.qr_code else None,
-        client_name=order.client_name,                 # NEW
-        destination_address=order.destination_address, # NEW
-        comment=order.comment,                         # NEW
-        total_price=order.total_price,                 # NEW
-        items=items_out,
-        cancellation_reason=order.cancellation_reason
-    )
+@order_router.post('/bulk_status', response=OrderBulkStatusOut)
+def bulk_update_order_status(request, data: OrderBulkStatusIn):
+    if data.status not in dict(Order.STATUS_CHOICES):
+        raise HttpError(400, f"Недопустимый статус: {data.status}")
+
+    with transaction.atomic():
+        updated, rejected = transition_orders(data.order_ids, data.status, reason=data.reason)
+    return OrderBulkStatusOut(status=data.status, updated=updated, rejected=rejected)
 
 @order_router.patch('/order/{order_id}/cancel', response=OrderOut)
 def cancel_order(request, order_id: int, data: OrderCancellationIn):
@@ -179,30 +290,99 @@ def cancel_order(request, order_id: int, data: OrderCancellationIn):
     if order.status == 'cancelled':
         raise HttpError(400, "Заказ уже отменен")
 
-    order.status = 'cancelled'
-    order.cancellation_reason = data.reason  # 🆕
-    order.save()
+    # Смена статуса и возврат товара на склад — одной транзакцией
+    with transaction.atomic():
+        cancelled = cancel_orders([order.id], data.reason)
+    if not cancelled:
+        order.refresh_from_db()
+        if order.status == 'cancelled':
+            raise HttpError(400, "Заказ уже отменен")
+        raise HttpError(400, f"Заказ в статусе '{order.get_status_display()}' нельзя отменить")
+    return orders_response(serialize_orders([order.id])[0])
 
-    items_out = [
-        OrderItemOut(
-            product_id=item.product.id,
-            name=item.product.name,
-            quantity=item.quantity,
-            price=item.price
-        )
-        for item in order.items.all()
-    ]
+@order_router.post('/cancel_stale', response=OrderCancelStaleOut)
+def cancel_stale(request, data: OrderCancelStaleIn):
+    if data.older_than_hours <= 0:
+        raise HttpError(400, "older_than_hours должен быть положительным")
+    order_ids = cancel_stale_orders(timezone.now() - timedelta(hours=data.older_than_hours), data.reason)
+    return OrderCancelStaleOut(cancelled=len(order_ids), order_ids=order_ids)
 
-    return OrderOut(
-        id=order.id,
-        status=order.status,
-        created_at=order.created_at.isoformat(),
-        warehouse=order.warehouse.id,
-        qr_code=order.qr_code.url if order.qr_code else None,
-        client_name=order.client_name,
-        destination_address=order.destination_address,
-        comment=order.comment,
-        cancellation_reason=order.cancellation_reason,  # 🆕
-        total_price=order.total_price,
-        items=items_out
+def return_out(return_obj):
+    return ReturnOut(
+        order_id=return_obj.order_id,
+        reason=return_obj.reason,
+        created_at=return_obj.created_at.isoformat(),
+        items=[
+            ReturnItemOut(product_id=item.product_id, name=item.product.name, quantity=item.quantity)
+            for item in return_obj.items.all()
+        ],
     )
+
+def save_returns(entries):
+    try:
+        with transaction.atomic():
+            return register_returns(entries)
+    except StockConflict:
+        raise HttpError(409, "Остатки изменились во время обработки, повторите запрос")
+
+@order_router.post('/order/{order_id}/return', response=ReturnOut)
+def create_return(request, order_id: int, data: ReturnIn):
+    result, = save_returns([
+        (order_id, data.reason, [(item.product_id, item.quantity) for item in data.items]),
+    ])
+    if isinstance(result, ReturnRejected):
+        raise HttpError(404 if isinstance(result, ReturnOrderNotFound) else 400, str(result))
+    return return_out(Return.objects.prefetch_related('items__product').get(id=result.id))
+
+@order_router.get('/order/{order_id}/return', response=ReturnOut)
+def get_return(request, order_id: int):
+    return_obj = get_object_or_404(Return.objects.prefetch_related('items__product'), order_id=order_id)
+    return return_out(return_obj)
+
+@order_router.get('/returns', response=list[ReturnOut])
+def list_returns(
+    request,
+    response: HttpResponse,
+    warehouse_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    cursor: Optional[int] = None,
+    limit: int = RETURN_PAGE_SIZE,
+):
+    if not 0 < limit <= ORDER_MAX_PAGE_SIZE:
+        raise HttpError(400, f"limit должен быть от 1 до {ORDER_MAX_PAGE_SIZE}")
+
+    returns = Return.objects.all()
+    if warehouse_id is not None:
+        returns = returns.filter(order__warehouse_id=warehouse_id)
+    if date_from is not None:
+        returns = returns.filter(created_at__gte=day_start(date_from))
+    if date_to is not None:
+        returns = returns.filter(created_at__lt=day_start(date_to + timedelta(days=1)))
+    # Keyset-пагинация по id, новые возвраты первыми
+    if cursor is not None:
+        returns = returns.filter(id__lt=cursor)
+
+    returns = list(returns.order_by('-id').prefetch_related('items__product')[:limit + 1])
+    has_more = len(returns) > limit
+    returns = returns[:limit]
+    response['X-Has-More'] = 'true' if has_more else 'false'
+    if has_more:
+        response['X-Next-Cursor'] = str(returns[-1].id)
+    return [return_out(return_obj) for return_obj in returns]
+
+@order_router.post('/returns/bulk', response=list[ReturnBulkResultOut])
+def bulk_create_returns(request, data: ReturnBulkIn):
+    results = save_returns([
+        (entry.order_id, entry.reason, [(item.product_id, item.quantity) for item in entry.items])
+        for entry in data.returns
+    ])
+    return [
+        ReturnBulkResultOut(
+            index=index,
+            success=not isinstance(result, ReturnRejected),
+            order_id=entry.order_id,
+            error=str(result) if isinstance(result, ReturnRejected) else None,
+        )
+        for index, (entry, result) in enumerate(zip(data.returns, results))
+    ]
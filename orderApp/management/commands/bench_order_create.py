@@ -0,0 +1,59 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+from core.benchmark import benchmark_environment, latency_summary
+from orderApp.utils import wait_for_qr_jobs
+from productApp.models import Product, Stock
+from warehouseApp.models import Warehouse
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер задержки POST /api/orders/order_create: рендер QR-кода внутри транзакции (как было), "
+        "синхронно после коммита и в фоновом пуле"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--items', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with benchmark_environment():
+            warehouse = Warehouse.objects.create(name="Бенчмарк", address="—")
+            products = Product.objects.bulk_create(
+                Product(name=f"Товар {i}", product_type="Бенчмарк", price=100)
+                for i in range(options['items'])
+            )
+            Stock.objects.bulk_create(
+                Stock(product=p, warehouse=warehouse, quantity=10 ** 9) for p in products
+            )
+            payload = {
+                "warehouse_id": warehouse.id,
+                "client_name": "Бенчмарк",
+                "destination_address": "—",
+                "items": [{"product_id": p.id, "quantity": 1} for p in products],
+            }
+
+            results = {}
+            # inline — исходный вариант: рендер и запись пути прямо в transaction.atomic() создания заказа
+            for mode in ('inline', 'after_commit', 'background'):
+                with override_settings(ORDER_QR_MODE=mode):
+                    results[f"{mode}_qr"] = self.run_orders(payload, options['orders'])
+                wait_for_qr_jobs()
+
+        self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+
+    def run_orders(self, payload, count):
+        client = Client()
+        samples = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.post('/api/orders/order_create', payload, content_type='application/json')
+            samples.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(response.content.decode())
+        return latency_summary(samples)
@@ -0,0 +1,69 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from core.benchmark import benchmark_environment
+from orderApp.utils import wait_for_qr_jobs
+from productApp.models import Product, Stock
+from warehouseApp.models import Warehouse
+
+
+class Command(BaseCommand):
+    help = "Сравнение пропускной способности (заказов/с): POST /order_create по одному и POST /bulk_create пачками"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--items', type=int, default=3)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = options['orders']
+        with benchmark_environment():
+            warehouse = Warehouse.objects.create(name="Бенчмарк", address="—")
+            products = Product.objects.bulk_create(
+                Product(name=f"Товар {i}", product_type="Бенчмарк", price=100)
+                for i in range(options['items'] * 10)
+            )
+            Stock.objects.bulk_create(
+                Stock(product=p, warehouse=warehouse, quantity=10 ** 9) for p in products
+            )
+            orders = [
+                {
+                    "warehouse_id": warehouse.id,
+                    "client_name": f"Клиент {n}",
+                    "destination_address": "—",
+                    "items": [
+                        {"product_id": products[(n + i) % len(products)].id, "quantity": 1}
+                        for i in range(options['items'])
+                    ],
+                }
+                for n in range(count)
+            ]
+            client = Client()
+
+            started = time.perf_counter()
+            for order in orders:
+                self.check_response(client.post('/api/orders/order_create', order, content_type='application/json'))
+            single = time.perf_counter() - started
+            wait_for_qr_jobs()
+
+            started = time.perf_counter()
+            for start in range(0, count, options['batch_size']):
+                batch = {"orders": orders[start:start + options['batch_size']]}
+                self.check_response(client.post('/api/orders/bulk_create', batch, content_type='application/json'))
+            bulk = time.perf_counter() - started
+
+            wait_for_qr_jobs()
+
+        self.stdout.write(json.dumps({
+            "orders": count,
+            "single_orders_per_second": round(count / single, 1),
+            "bulk_orders_per_second": round(count / bulk, 1),
+            "speedup": round(single / bulk, 1),
+        }, ensure_ascii=False, indent=2))
+
+    def check_response(self, response):
+        if response.status_code != 200:
+            raise RuntimeError(response.content.decode())
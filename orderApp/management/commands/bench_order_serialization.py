@@ -0,0 +1,106 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from core.benchmark import benchmark_environment
+from orderApp.models import Order, OrderItem
+from orderApp.schemas import OrderItemOut, OrderOut
+from orderApp.utils import serialize_orders
+from productApp.models import Product
+from warehouseApp.models import Warehouse
+
+
+def legacy_serialize(order_ids):
+    """Прежний путь: модели с prefetch, OrderOut/OrderItemOut и валидация схемой ответа."""
+    orders = Order.objects.filter(id__in=order_ids).prefetch_related('items__product')
+    result = [
+        OrderOut(
+            id=order.id,
+            status=order.status,
+            created_at=order.created_at.isoformat(),
+            warehouse=order.warehouse_id,
+            qr_code=order.qr_code.url if order.qr_code else None,
+            client_name=order.client_name,
+            destination_address=order.destination_address,
+            comment=order.comment,
+            total_price=order.total_price,
+            items=[
+                OrderItemOut(
+                    product_id=item.product.id,
+                    name=item.product.name,
+                    quantity=item.quantity,
+                    price=item.price,
+                )
+                for item in order.items.all()
+            ],
+            cancellation_reason=order.cancellation_reason,
+        )
+        for order in orders
+    ]
+    # Так ninja проверяет и сериализует возвращённые объекты
+    return [OrderOut.model_validate(o).model_dump() for o in result]
+
+
+class Command(BaseCommand):
+    help = "Стоимость сериализации заказов: прежний путь через модели и схемы против values() JOIN"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--items', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with benchmark_environment():
+            order_ids = self.seed(options['orders'], options['items'])
+            results = {}
+            for name, serialize in (("legacy", legacy_serialize), ("values_join", serialize_orders)):
+                results[name] = self.measure(serialize, order_ids, options['repeat'])
+            results["speedup"] = round(
+                results["legacy"]["seconds_per_10k"] / results["values_join"]["seconds_per_10k"], 2
+            )
+
+        self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+
+    def seed(self, count, items):
+        warehouse = Warehouse.objects.create(name="Бенчмарк", address="—")
+        products = Product.objects.bulk_create(
+            Product(name=f"Товар {i}", product_type="Бенчмарк", price=100) for i in range(50)
+        )
+        orders = Order.objects.bulk_create(
+            (
+                Order(warehouse=warehouse, client_name=f"Клиент {n}", destination_address="—", total_price=100 * items)
+                for n in range(count)
+            ),
+            batch_size=2000,
+        )
+        OrderItem.objects.bulk_create(
+            (
+                OrderItem(order=order, product=products[(n + i) % len(products)], quantity=1, price=100)
+                for n, order in enumerate(orders)
+                for i in range(items)
+            ),
+            batch_size=2000,
+        )
+        return [order.id for order in orders]
+
+    def measure(self, serialize, order_ids, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            json.dumps(serialize(order_ids))
+            timings.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        json.dumps(serialize(order_ids))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        best = min(timings)
+        return {
+            "orders": len(order_ids),
+            "seconds_per_10k": round(best * 10000 / len(order_ids), 3),
+            "us_per_order": round(best * 1e6 / len(order_ids), 1),
+            "peak_memory_mb": round(peak / 2 ** 20, 1),
+        }
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orderApp.utils import CANCEL_BATCH_SIZE, cancel_stale_orders
+
+
+class Command(BaseCommand):
+    help = "Отменяет новые заказы старше --hours часов и возвращает их товар на склады"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, required=True)
+        parser.add_argument('--reason', default="Заказ не подтверждён вовремя")
+        parser.add_argument('--batch-size', type=int, default=CANCEL_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        cancelled = cancel_stale_orders(
+            timezone.now() - timedelta(hours=options['hours']),
+            options['reason'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Отменено заказов: {len(cancelled)}"))
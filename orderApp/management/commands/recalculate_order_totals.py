@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Max
+
+from orderApp.models import Order
+from orderApp.utils import order_total_expression, recalculate_order_totals
+
+
+class Command(BaseCommand):
+    help = "Заполняет Order.total_price по позициям заказа или проверяет расхождения (--check)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Только найти заказы с неверной суммой")
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check_drift()
+        else:
+            self.backfill(options['batch_size'])
+
+    def backfill(self, batch_size):
+        last_id = Order.objects.aggregate(last=Max('id'))['last'] or 0
+        updated = 0
+        # Пачками по диапазону id, чтобы не держать одну долгую транзакцию
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic():
+                updated += recalculate_order_totals(
+                    Order.objects.filter(id__gt=start, id__lte=start + batch_size)
+                )
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано заказов: {updated}"))
+
+    def check_drift(self):
+        drifted = (
+            Order.objects.annotate(expected_total=order_total_expression())
+            .exclude(total_price=F('expected_total'))
+            .values_list('id', 'total_price', 'expected_total')
+        )
+        count = 0
+        for order_id, stored, expected in drifted.iterator():
+            count += 1
+            self.stdout.write(f"Заказ #{order_id}: сохранено {stored}, по позициям {expected}")
+        if count:
+            raise CommandError(f"Расхождения в {count} заказах, запустите команду без --check")
+        self.stdout.write(self.style.SUCCESS("Расхождений нет"))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 02:14
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_total_price(apps, schema_editor):
+    Order = apps.get_model('orderApp', 'Order')
+    OrderItem = apps.get_model('orderApp', 'OrderItem')
+    items_total = (
+        OrderItem.objects.filter(order_id=OuterRef('pk'))
+        .order_by()
+        .values('order_id')
+        .annotate(total=Sum(F('price') * F('quantity')))
+        .values('total')
+    )
+    Order.objects.update(total_price=Coalesce(
+        Subquery(items_total), Value(0), output_field=models.DecimalField(max_digits=12, decimal_places=2)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orderApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_total_price, migrations.RunPython.noop),
+    ]
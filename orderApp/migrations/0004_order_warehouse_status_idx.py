@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orderApp', '0003_order_list_indexes'),
+        ('warehouseApp', '0002_alter_warehouse_options'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['warehouse', 'status'], name='order_warehouse_status_idx'),
+        ),
+    ]
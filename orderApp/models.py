@@ -10,6 +10,14 @@ class Order(models.Model):
         ('completed', 'Завершен'),
         ('cancelled', 'Отменен'),
     ]
+    # Допустимые переходы статусов; отмена возможна, пока товар не покинул склад
+    STATUS_TRANSITIONS = {
+        'new': ('processing', 'cancelled'),
+        'processing': ('shipped', 'cancelled'),
+        'shipped': ('completed',),
+        'completed': (),
+        'cancelled': (),
+    }
 
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='new')
@@ -20,14 +28,31 @@ class Order(models.Model):
     destination_address = models.TextField()
     comment = models.TextField(blank=True)
     cancellation_reason = models.TextField(blank=True, null=True)
+    # Денормализованная сумма заказа, поддерживается сигналами OrderItem
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0, db_index=True)
 
-    @property
-    def total_price(self):
-        return sum(item.price * item.quantity for item in self.items.all())
+    class Meta:
+        # Индексы под keyset-пагинацию списка заказов и его фильтры
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='order_status_created_idx'),
+            models.Index(fields=['warehouse', '-created_at', '-id'], name='order_warehouse_created_idx'),
+            models.Index(fields=['client_name', '-created_at'], name='order_client_created_idx'),
+            # Открытые заказы склада в сводке складов считаются по индексу
+            models.Index(fields=['warehouse', 'status'], name='order_warehouse_status_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} ({self.get_status_display()})"
 
+    @classmethod
+    def source_statuses(cls, status):
+        """Статусы, из которых разрешён переход в status."""
+        return tuple(source for source, targets in cls.STATUS_TRANSITIONS.items() if status in targets)
+
+    def can_transition_to(self, status):
+        return status in self.STATUS_TRANSITIONS[self.status]
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -15,6 +15,15 @@ class OrderIn(Schema):
     destination_address: str  # 🆕
     comment: Optional[str] = None  # 🆕
 
+class OrderBulkIn(Schema):
+    orders: List[OrderIn]
+
+class OrderBulkResultOut(Schema):
+    index: int
+    success: bool
+    order_id: Optional[int] = None
+    error: Optional[str] = None
+
 
 class OrderItemOut(Schema):
     product_id: int
@@ -40,6 +49,16 @@ class OrderOut(Schema):
 class OrderStatusIn(Schema):
     status: str
 
+class OrderBulkStatusIn(Schema):
+    order_ids: List[int]
+    status: str
+    reason: Optional[str] = None  # причина отмены для status = 'cancelled'
+
+class OrderBulkStatusOut(Schema):
+    status: str
+    updated: List[int]
+    rejected: List[int]
+
 class ReturnItemIn(Schema):
     product_id: int
     quantity: int
@@ -54,6 +73,18 @@ class ReturnIn(Schema):
     reason: Optional[str] = None
     items: List[ReturnItemIn]
 
+class ReturnBulkItemIn(ReturnIn):
+    order_id: int
+
+class ReturnBulkIn(Schema):
+    returns: List[ReturnBulkItemIn]
+
+class ReturnBulkResultOut(Schema):
+    index: int
+    success: bool
+    order_id: int
+    error: Optional[str] = None
+
 class ReturnItemOut(Schema):
     product_id: int
     name: str
@@ -67,3 +98,11 @@ class ReturnOut(Schema):
 
 class OrderCancellationIn(Schema):  # 🆕 NEW
     reason: str
+
+class OrderCancelStaleIn(Schema):
+    older_than_hours: int
+    reason: str = "Заказ не подтверждён вовремя"
+
+class OrderCancelStaleOut(Schema):
+    cancelled: int
+    order_ids: List[int]
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from orderApp.models import OrderItem
+
+# Отправляется при массовых изменениях заказов через bulk_create и queryset.update(),
+# которые не вызывают post_save
+orders_changed = Signal()
+# Продажи появились (order_ids), отменены (order_ids) или оформлены возвраты (return_ids);
+# отправляются в транзакции изменения
+orders_placed = Signal()
+orders_cancelled = Signal()
+returns_registered = Signal()
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def update_order_total(sender, instance, **kwargs):
+    # orderApp.utils сам импортирует этот модуль ради orders_changed
+    from orderApp.utils import recalculate_order_totals
+
+    # Выполняется в той же транзакции, что и изменение позиции
+    recalculate_order_totals([instance.order_id])
@@ -1,3 +1,596 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from orderApp import utils as order_utils
+from orderApp.models import Order, OrderItem, Return, ReturnItem
+from orderApp.schemas import OrderOut
+from productApp.models import Product, Stock, StockMovement
+from warehouseApp.models import Warehouse
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CreateOrderTests(TestCase):
+    url = '/api/orders/order_create'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+        cls.pear = Product.objects.create(name="Груша", product_type="Фрукты", price=12)
+        Stock.objects.create(product=cls.apple, warehouse=cls.warehouse, quantity=10)
+        Stock.objects.create(product=cls.pear, warehouse=cls.warehouse, quantity=3)
+
+    def create_order(self, items):
+        return self.client.post(self.url, {
+            "warehouse_id": self.warehouse.id,
+            "client_name": "Иванов",
+            "destination_address": "ул. Мира, 2",
+            "items": items,
+        }, content_type='application/json')
+
+    def test_creates_order_and_reserves_stock(self):
+        response = self.create_order([
+            {"product_id": self.apple.id, "quantity": 2},
+            {"product_id": self.pear.id, "quantity": 3},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_price'], 56)
+        self.assertEqual(Order.objects.get().total_price, 56)
+        self.assertEqual(
+            dict(Stock.objects.values_list('product_id', 'quantity')),
+            {self.apple.id: 8, self.pear.id: 0},
+        )
+
+    def test_shortage_rolls_back_whole_order(self):
+        response = self.create_order([
+            {"product_id": self.apple.id, "quantity": 2},
+            {"product_id": self.pear.id, "quantity": 4},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Груша", response.json()['detail'])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(
+            dict(Stock.objects.values_list('product_id', 'quantity')),
+            {self.apple.id: 10, self.pear.id: 3},
+        )
+
+    @override_settings(ORDER_QR_MODE='inline')
+    def test_qr_code_inline_mode_attaches_before_commit(self):
+        # Колбэки после коммита не выполняются, путь уже записан в транзакции
+        response = self.create_order([{"product_id": self.apple.id, "quantity": 1}])
+        self.assertTrue(Order.objects.get(id=response.json()['id']).qr_code)
+
+    @override_settings(ORDER_QR_MODE='after_commit')
+    def test_qr_code_is_attached_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_order([{"product_id": self.apple.id, "quantity": 1}])
+        self.assertIsNone(response.json()['qr_code'])
+
+        order = Order.objects.get(id=response.json()['id'])
+        self.assertTrue(order.qr_code.name.startswith('qr_codes/'))
+
+    def test_qr_code_is_rendered_lazily(self):
+        response = self.create_order([{"product_id": self.apple.id, "quantity": 1}])
+        order_id = response.json()['id']
+
+        qr = self.client.get(f'/api/orders/order/{order_id}/qr')
+        self.assertEqual(qr['Content-Type'], 'image/png')
+        self.assertTrue(Order.objects.get(id=order_id).qr_code)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QrCacheTests(TestCase):
+    def test_identical_payload_is_rendered_once(self):
+        with mock.patch.object(order_utils, 'render_qr_png', wraps=order_utils.render_qr_png) as render:
+            first = order_utils.get_or_render_qr("qr-cache-test")
+            second = order_utils.get_or_render_qr("qr-cache-test")
+        self.assertEqual(first, second)
+        self.assertEqual(render.call_count, 1)
+
+    def test_background_failure_is_logged(self):
+        with mock.patch.object(order_utils, 'render_qr_png', side_effect=ValueError("сбой")), \
+                self.assertLogs('orderApp.utils', 'ERROR') as logs:
+            order_utils._submit(42, "qr-failure-test")
+            order_utils.wait_for_qr_jobs()
+        self.assertIn("заказа 42", logs.output[0])
+
+
+class OrderTotalPriceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+        cls.order = Order.objects.create(warehouse=cls.warehouse, client_name="Иванов", destination_address="—")
+
+    def test_total_follows_item_changes(self):
+        item = OrderItem.objects.create(order=self.order, product=self.apple, quantity=2, price=10)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, 20)
+
+        item.quantity = 5
+        item.save()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, 50)
+
+        item.delete()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, 0)
+
+    def test_backfill_and_drift_check(self):
+        OrderItem.objects.bulk_create([OrderItem(order=self.order, product=self.apple, quantity=3, price=10)])
+        with self.assertRaises(CommandError):
+            call_command('recalculate_order_totals', '--check', stdout=StringIO())
+
+        call_command('recalculate_order_totals', stdout=StringIO())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, 30)
+        call_command('recalculate_order_totals', '--check', stdout=StringIO())
+
+
+class ListOrdersTests(TestCase):
+    url = '/api/orders/order'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.other_warehouse = Warehouse.objects.create(name="Запасной", address="ул. Мира, 2")
+        apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+        cls.orders = [
+            Order.objects.create(
+                warehouse=cls.warehouse if i % 2 else cls.other_warehouse,
+                client_name=f"Иванов {i}" if i < 3 else f"Петров {i}",
+                destination_address="—",
+                status='new' if i < 4 else 'shipped',
+            )
+            for i in range(6)
+        ]
+        for order in cls.orders:
+            OrderItem.objects.create(order=order, product=apple, quantity=1, price=10)
+
+    def ids(self, response):
+        return [o['id'] for o in response.json()]
+
+    def test_keyset_pages_cover_all_orders(self):
+        newest_first = [o.id for o in reversed(self.orders)]
+
+        first = self.client.get(self.url, {'limit': 4})
+        self.assertEqual(self.ids(first), newest_first[:4])
+        self.assertEqual(first['X-Has-More'], 'true')
+        self.assertNotIn('X-Total-Count', first)
+
+        second = self.client.get(self.url, {'limit': 4, 'cursor': first['X-Next-Cursor']})
+        self.assertEqual(self.ids(second), newest_first[4:])
+        self.assertEqual(second['X-Has-More'], 'false')
+        self.assertNotIn('X-Next-Cursor', second)
+
+    def test_filters(self):
+        response = self.client.get(self.url, {
+            'status': 'new', 'warehouse_id': self.warehouse.id, 'client_name': 'Иван', 'with_count': True,
+        })
+        self.assertEqual(self.ids(response), [self.orders[1].id])
+        self.assertEqual(response['X-Total-Count'], '1')
+
+        today = self.orders[0].created_at.date().isoformat()
+        response = self.client.get(self.url, {'date_from': today, 'date_to': today})
+        self.assertEqual(len(response.json()), 6)
+
+    def test_client_name_prefix_ending_with_max_code_point(self):
+        name = "Иван" + chr(0x10FFFF)
+        order = Order.objects.create(warehouse=self.warehouse, client_name=name + "ов", destination_address="—")
+        response = self.client.get(self.url, {'client_name': name})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(response), [order.id])
+
+    def test_query_count_is_constant(self):
+        # Страница id и один JOIN заказов, позиций и товаров
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+    def test_serialized_order_matches_schema(self):
+        order = self.orders[0]
+        order.qr_code = 'qr_codes/test.png'
+        order.save()
+        data = self.client.get(f'/api/orders/order/{order.id}').json()
+        self.assertEqual(set(data), set(OrderOut.model_fields))
+        self.assertEqual(OrderOut.model_validate(data).model_dump(), data)
+        self.assertEqual(data['qr_code'], '/media/qr_codes/test.png')
+        self.assertEqual(data['items'][0]['name'], "Яблоко")
+        self.assertEqual(self.client.get('/api/orders/order/999').status_code, 404)
+
+    async def test_served_under_asgi(self):
+        response = await self.async_client.get(self.url, {'limit': 2})
+        self.assertEqual(len(response.json()), 2)
+        order_id = response.json()[0]['id']
+        response = await self.async_client.get(f'/api/orders/order/{order_id}')
+        self.assertEqual(response.json()['items'][0]['name'], "Яблоко")
+
+    def test_bad_cursor(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'garbage'}).status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BulkCreateOrdersTests(TestCase):
+    url = '/api/orders/bulk_create'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+        cls.pear = Product.objects.create(name="Груша", product_type="Фрукты", price=12)
+        Stock.objects.create(product=cls.apple, warehouse=cls.warehouse, quantity=5)
+        Stock.objects.create(product=cls.pear, warehouse=cls.warehouse, quantity=1)
+
+    def order(self, *items, warehouse_id=None):
+        return {
+            "warehouse_id": warehouse_id or self.warehouse.id,
+            "client_name": "Иванов",
+            "destination_address": "ул. Мира, 2",
+            "items": [{"product_id": p.id, "quantity": q} for p, q in items],
+        }
+
+    def post(self, orders):
+        return self.client.post(self.url, {"orders": orders}, content_type='application/json')
+
+    def test_reports_result_per_order(self):
+        response = self.post([
+            self.order((self.apple, 3), (self.pear, 1)),
+            self.order((self.pear, 1)),                      # груша уже зарезервирована первым заказом
+            self.order((self.apple, 1), warehouse_id=999),
+            self.order((self.apple, 2)),
+        ])
+        results = response.json()
+
+        self.assertEqual([r['success'] for r in results], [True, False, False, True])
+        self.assertIn("Груша", results[1]['error'])
+        self.assertEqual(results[2]['error'], "Склад не найден")
+        self.assertEqual(
+            dict(Stock.objects.values_list('product_id', 'quantity')),
+            {self.apple.id: 0, self.pear.id: 0},
+        )
+        self.assertEqual(Order.objects.get(id=results[0]['order_id']).total_price, 42)
+        self.assertEqual(OrderItem.objects.count(), 3)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        # Склады, товары, остатки, списание, заказы, позиции,
+        # продажи для витрины, её INSERT и UPDATE, журнал + SAVEPOINT/RELEASE
+        with self.assertNumQueries(12):
+            self.post([self.order((self.apple, 1)) for _ in range(2)])
+        with self.assertNumQueries(12):
+            self.post([self.order((self.apple, 1)) for _ in range(3)])
+
+
+class ReturnTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+        cls.pear = Product.objects.create(name="Груша", product_type="Фрукты", price=12)
+        Stock.objects.create(product=cls.apple, warehouse=cls.warehouse, quantity=0)
+        cls.orders = []
+        for _ in range(3):
+            order = Order.objects.create(
+                warehouse=cls.warehouse, client_name="Иванов", destination_address="ул. Мира, 2",
+                status='completed',
+            )
+            OrderItem.objects.create(order=order, product=cls.apple, quantity=3, price=10)
+            OrderItem.objects.create(order=order, product=cls.pear, quantity=1, price=12)
+            cls.orders.append(order)
+
+    def create_return(self, order, *items):
+        return self.client.post(f'/api/orders/order/{order.id}/return', {
+            "reason": "Брак",
+            "items": [{"product_id": p.id, "quantity": q} for p, q in items],
+        }, content_type='application/json')
+
+    def quantities(self):
+        return dict(Stock.objects.values_list('product_id', 'quantity'))
+
+    def test_return_restocks_origin_warehouse(self):
+        response = self.create_return(self.orders[0], (self.apple, 2), (self.pear, 1), (self.apple, 1))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted((i['product_id'], i['quantity']) for i in response.json()['items']),
+            sorted([(self.apple.id, 3), (self.pear.id, 1)]),
+        )
+        self.assertEqual(self.quantities(), {self.apple.id: 3, self.pear.id: 1})
+        self.assertEqual(StockMovement.objects.filter(kind='return').count(), 2)
+
+        response = self.create_return(self.orders[0], (self.apple, 1))
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_quantities_above_ordered(self):
+        response = self.create_return(self.orders[0], (self.apple, 2), (self.apple, 2))
+        self.assertEqual(response.status_code, 400)
+        response = self.create_return(self.orders[0], (self.pear, 1), (self.pear, 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Return.objects.exists())
+        self.assertEqual(self.quantities(), {self.apple.id: 0})
+
+    def test_rejects_orders_not_yet_shipped(self):
+        for status in ('new', 'processing', 'cancelled'):
+            Order.objects.filter(id=self.orders[0].id).update(status=status)
+            response = self.create_return(self.orders[0], (self.apple, 1))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(
+                response.json()['detail'], "Возврат возможен только по отправленному или завершённому заказу",
+            )
+        Order.objects.filter(id=self.orders[0].id).update(status='shipped')
+        self.assertEqual(self.create_return(self.orders[0], (self.apple, 1)).status_code, 200)
+        self.assertEqual(self.quantities(), {self.apple.id: 1})
+
+    def test_missing_order_is_not_found(self):
+        response = self.client.post('/api/orders/order/999/return', {
+            "items": [{"product_id": self.apple.id, "quantity": 1}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['detail'], "Заказ не найден")
+
+    def test_bulk_intake_and_list(self):
+        url = '/api/orders/returns/bulk'
+        entries = [
+            {"order_id": order.id, "items": [{"product_id": self.apple.id, "quantity": 1}]}
+            for order in self.orders
+        ]
+        entries.append({"order_id": self.orders[0].id, "items": [{"product_id": self.pear.id, "quantity": 1}]})
+        entries.append({"order_id": 999, "items": [{"product_id": self.pear.id, "quantity": 1}]})
+
+        results = self.client.post(url, {"returns": entries}, content_type='application/json').json()
+        self.assertEqual([r['success'] for r in results], [True, True, True, False, False])
+        self.assertEqual(results[4]['error'], "Заказ не найден")
+        self.assertEqual(self.quantities(), {self.apple.id: 3})
+        self.assertEqual(ReturnItem.objects.count(), 3)
+
+        first = self.client.get('/api/orders/returns', {'limit': 2})
+        self.assertEqual([r['order_id'] for r in first.json()], [self.orders[2].id, self.orders[1].id])
+        last = self.client.get('/api/orders/returns', {'limit': 2, 'cursor': first['X-Next-Cursor']})
+        self.assertEqual([r['order_id'] for r in last.json()], [self.orders[0].id])
+        self.assertEqual(last['X-Has-More'], 'false')
+
+    def test_bulk_query_count_does_not_depend_on_batch_size(self):
+        def post(orders):
+            entries = [
+                {"order_id": order.id, "items": [{"product_id": self.apple.id, "quantity": 1}]}
+                for order in orders
+            ]
+            self.client.post('/api/orders/returns/bulk', {"returns": entries}, content_type='application/json')
+
+        # Заказы, заказанные количества, возвраты, позиции, возвраты для витрины, её INSERT и UPDATE,
+        # остатки, пополнение, журнал + две пары SAVEPOINT/RELEASE
+        with self.assertNumQueries(14):
+            post(self.orders[:1])
+        with self.assertNumQueries(14):
+            post(self.orders[1:])
+
+
+class CancelOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.other_warehouse = Warehouse.objects.create(name="Запасной", address="ул. Мира, 2")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+        cls.pear = Product.objects.create(name="Груша", product_type="Фрукты", price=12)
+        for warehouse in (cls.warehouse, cls.other_warehouse):
+            Stock.objects.create(product=cls.apple, warehouse=warehouse, quantity=0)
+
+    def create_order(self, warehouse, status='new', **items):
+        order = Order.objects.create(
+            warehouse=warehouse, client_name="Иванов", destination_address="ул. Мира, 2", status=status,
+        )
+        for product, quantity in items.items():
+            OrderItem.objects.create(order=order, product=getattr(self, product), quantity=quantity, price=10)
+        return order
+
+    def cancel(self, order):
+        return self.client.patch(
+            f'/api/orders/order/{order.id}/cancel', {"reason": "Передумал"}, content_type='application/json',
+        )
+
+    def stock(self):
+        return {(p, w): q for p, w, q in Stock.objects.values_list('product_id', 'warehouse_id', 'quantity')}
+
+    def test_cancel_returns_stock_once(self):
+        order = self.create_order(self.warehouse, apple=2, pear=1)
+        response = self.cancel(order)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['cancellation_reason'], "Передумал")
+        self.assertEqual(self.cancel(order).status_code, 400)
+
+        stock = self.stock()
+        self.assertEqual(stock[(self.apple.id, self.warehouse.id)], 2)
+        self.assertEqual(stock[(self.pear.id, self.warehouse.id)], 1)
+        self.assertEqual(StockMovement.objects.filter(kind='cancellation').count(), 2)
+
+    def test_shipped_order_is_not_cancelled(self):
+        order = self.create_order(self.warehouse, status='shipped', apple=2)
+        self.assertEqual(self.cancel(order).status_code, 400)
+        self.assertEqual(self.stock()[(self.apple.id, self.warehouse.id)], 0)
+
+    def test_cancel_after_return_releases_only_the_rest(self):
+        order = self.create_order(self.warehouse, apple=3, pear=1)
+        response = self.client.post(f'/api/orders/order/{order.id}/return', {
+            "items": [{"product_id": self.apple.id, "quantity": 2}],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        # Возврат, оформленный в обход API, например через админку
+        return_obj = Return.objects.create(order=order, reason="Брак")
+        ReturnItem.objects.create(return_obj=return_obj, product=self.apple, quantity=2)
+        ReturnItem.objects.create(return_obj=return_obj, product=self.pear, quantity=1)
+        self.assertEqual(self.cancel(order).status_code, 200)
+
+        self.assertEqual(self.stock()[(self.apple.id, self.warehouse.id)], 1)
+        self.assertNotIn((self.pear.id, self.warehouse.id), self.stock())
+        self.assertEqual(
+            list(StockMovement.objects.filter(kind='cancellation').values_list('product_id', 'delta')),
+            [(self.apple.id, 1)],
+        )
+
+    def test_one_update_per_warehouse(self):
+        orders = [
+            self.create_order(warehouse, apple=1, pear=2)
+            for warehouse in (self.warehouse, self.other_warehouse)
+            for _ in range(3)
+        ]
+        # Захват заказов, смена статуса, продажи для витрины, её INSERT и UPDATE на склад,
+        # позиции, недостающие остатки, по UPDATE на каждый склад, журнал + SAVEPOINT/RELEASE
+        with self.assertNumQueries(13):
+            with transaction.atomic():
+                order_utils.cancel_orders([o.id for o in orders], "Отмена")
+        self.assertEqual(set(self.stock().values()), {3, 6})
+
+    def test_cancel_stale_new_orders(self):
+        stale = self.create_order(self.warehouse, apple=1)
+        processing = self.create_order(self.warehouse, status='processing', apple=1)
+        fresh = self.create_order(self.warehouse, apple=1)
+        Order.objects.filter(id__in=[stale.id, processing.id]).update(
+            created_at=timezone.now() - timedelta(hours=48),
+        )
+
+        response = self.client.post(
+            '/api/orders/cancel_stale', {"older_than_hours": 24}, content_type='application/json',
+        )
+        self.assertEqual(response.json()['order_ids'], [stale.id])
+        self.assertEqual(
+            dict(Order.objects.values_list('id', 'status')),
+            {stale.id: 'cancelled', processing.id: 'processing', fresh.id: 'new'},
+        )
+        self.assertEqual(self.stock()[(self.apple.id, self.warehouse.id)], 1)
+
+
+class CancelOrderConcurrencyTests(TransactionTestCase):
+    threads = 6
+
+    def test_racing_cancels_release_stock_once(self):
+        warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+        Stock.objects.create(product=apple, warehouse=warehouse, quantity=0)
+        orders = []
+        for _ in range(5):
+            order = Order.objects.create(warehouse=warehouse, client_name="Иванов", destination_address="—")
+            OrderItem.objects.create(order=order, product=apple, quantity=2, price=10)
+            orders.append(order.id)
+
+        barrier = threading.Barrier(self.threads)
+
+        def worker():
+            barrier.wait()
+            try:
+                for _ in range(3):
+                    try:
+                        with transaction.atomic():
+                            order_utils.cancel_orders(orders, "Гонка")
+                    except OperationalError:
+                        continue
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        self.assertEqual(Stock.objects.get().quantity, 10)
+        self.assertEqual(StockMovement.objects.filter(kind='cancellation').count(), 5)
+
+
+class OrderStatusTransitionTests(TestCase):
+    url = '/api/orders/bulk_status'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+        Stock.objects.create(product=cls.apple, warehouse=cls.warehouse, quantity=0)
+
+    def create_orders(self, count, status='new'):
+        orders = Order.objects.bulk_create(
+            Order(warehouse=self.warehouse, client_name="Иванов", destination_address="—", status=status)
+            for _ in range(count)
+        )
+        OrderItem.objects.bulk_create(OrderItem(order=o, product=self.apple, quantity=1, price=10) for o in orders)
+        return [o.id for o in orders]
+
+    def post(self, order_ids, status):
+        return self.client.post(self.url, {"order_ids": order_ids, "status": status}, content_type='application/json')
+
+    def test_patch_follows_transition_graph(self):
+        order_id, = self.create_orders(1)
+        url = f'/api/orders/order/{order_id}/status'
+        self.assertEqual(self.client.patch(url, {"status": "shipped"}, content_type='application/json').status_code, 400)
+        response = self.client.patch(url, {"status": "processing"}, content_type='application/json')
+        self.assertEqual(response.json()['status'], 'processing')
+        self.assertEqual(self.client.patch(url, {"status": "unknown"}, content_type='application/json').status_code, 400)
+
+    def test_bulk_transition_reports_rejected(self):
+        new = self.create_orders(3)
+        shipped = self.create_orders(2, status='shipped')
+
+        data = self.post(new + shipped + [999], 'processing').json()
+        self.assertEqual(data['updated'], new)
+        self.assertEqual(data['rejected'], shipped + [999])
+
+        data = self.post(new + shipped, 'cancelled').json()
+        self.assertEqual(data['updated'], new)
+        self.assertEqual(Stock.objects.get().quantity, 3)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        small = self.create_orders(2)
+        large = self.create_orders(200)
+        # Захват заказов и UPDATE + SAVEPOINT/RELEASE
+        with self.assertNumQueries(4):
+            self.post(small, 'processing')
+        with self.assertNumQueries(4):
+            self.post(large, 'processing')
+        self.assertEqual(Order.objects.filter(status='processing').count(), 202)
+
+
+class GenerateDatasetTests(TransactionTestCase):
+    options = ['--orders', '300', '--products', '40', '--warehouses', '3', '--days', '60',
+               '--end', '2026-03-31', '--workers', '1', '--seed', '7']
+
+    def generate(self):
+        call_command('generate_dataset', *self.options, stdout=StringIO())
+        return (
+            list(Order.objects.order_by('id').values_list('id', 'created_at', 'status', 'warehouse_id', 'total_price')),
+            list(OrderItem.objects.order_by('id').values_list('id', 'order_id', 'product_id', 'quantity', 'price')),
+            list(Stock.objects.order_by('id').values_list('id', 'product_id', 'warehouse_id', 'quantity')),
+        )
+
+    def test_dataset_is_consistent_and_deterministic(self):
+        orders, items, stocks = self.generate()
+        self.assertEqual(len(orders), 300)
+        self.assertTrue(all(
+            timezone.localdate(created_at) <= date(2026, 3, 31) for _, created_at, *_ in orders
+        ))
+        totals = {}
+        for _, order_id, _, quantity, price in items:
+            totals[order_id] = totals.get(order_id, 0) + quantity * price
+        self.assertEqual({order_id: total for order_id, *_, total in orders}, totals)
+        # Начальные остатки записаны в журнал движений
+        self.assertEqual(
+            sum(quantity for *_, quantity in stocks),
+            sum(StockMovement.objects.filter(kind='opening').values_list('delta', flat=True)),
+        )
+        out = StringIO()
+        call_command('rollup_daily_sales', '--verify', '--workers', '1', stdout=out)
+        self.assertIn("Расхождений нет", out.getvalue())
+
+        for model in (OrderItem, Order, StockMovement, Stock, Product, Warehouse):
+            model.objects.all().delete()
+        self.assertEqual(self.generate(), (orders, items, stocks))
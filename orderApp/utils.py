@@ -0,0 +1,395 @@
+import hashlib
+import logging
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from concurrent.futures import wait
+from datetime import datetime, time
+from io import BytesIO
+
+import qrcode
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.db import connection, models, transaction
+from django.db.models import DecimalField, Exists, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from ninja.errors import HttpError
+
+from core.executors import get_executor, run_blocking
+from orderApp.models import Order, OrderItem, Return, ReturnItem
+from orderApp.signals import orders_cancelled, orders_changed, returns_registered
+from productApp.utils import apply_stock_batch, merge_lines, release_stock
+
+logger = logging.getLogger(__name__)
+
+QR_VERSION = 1
+QR_BOX_SIZE = 10
+QR_BORDER = 5
+
+ORDER_OUT_FIELDS = (
+    'id', 'status', 'created_at', 'warehouse_id', 'qr_code', 'client_name',
+    'destination_address', 'comment', 'total_price', 'cancellation_reason',
+)
+ORDER_ITEM_OUT_FIELDS = ('items__product_id', 'items__product__name', 'items__quantity', 'items__price')
+
+CANCELLABLE_STATUSES = Order.source_statuses('cancelled')
+# Возврат оформляется только по заказу, товар которого уже покинул склад
+RETURNABLE_STATUSES = ('shipped', 'completed')
+CANCEL_BATCH_SIZE = 500
+
+_pending = set()
+
+
+def order_total_expression():
+    """Сумма позиций заказа, посчитанная в SQL."""
+    items_total = (
+        OrderItem.objects.filter(order_id=OuterRef('pk'))
+        .order_by()
+        .values('order_id')
+        .annotate(total=Sum(F('price') * F('quantity')))
+        .values('total')
+    )
+    return Coalesce(
+        Subquery(items_total, output_field=DecimalField(max_digits=12, decimal_places=2)),
+        Value(0),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def recalculate_order_totals(orders):
+    """Пересчитывает Order.total_price одним UPDATE для переданного queryset или списка id."""
+    order_ids = None
+    if not isinstance(orders, models.QuerySet):
+        order_ids = list(orders)
+        orders = Order.objects.filter(id__in=order_ids)
+    updated = orders.update(total_price=order_total_expression())
+    orders_changed.send(sender=Order, order_ids=order_ids)
+    return updated
+
+
+def cancel_orders(order_ids, reason, statuses=CANCELLABLE_STATUSES):
+    """
+    Отменяет заказы и возвращает их товар на склад. Вызывается внутри transaction.atomic.
+
+    Заказы сначала захватываются: строки блокируются (где это поддерживается),
+    и статус меняется одним UPDATE ... WHERE status IN statuses.
+    Заказ, который уже отменён параллельным запросом, под условие не попадает,
+    поэтому остатки по нему возвращаются ровно один раз.
+    Из возвращаемого количества вычитается уже оформленный по заказу возврат.
+    Возвращает список id отменённых заказов.
+    """
+    claimable = Order.objects.filter(id__in=order_ids, status__in=statuses)
+    if connection.features.has_select_for_update:
+        claimable = claimable.select_for_update().order_by('id')
+    claimed = list(claimable.values_list('id', flat=True))
+    if not claimed:
+        return []
+    Order.objects.filter(id__in=claimed, status__in=statuses).update(
+        status='cancelled', cancellation_reason=reason,
+    )
+    orders_changed.send(sender=Order, order_ids=claimed)
+    orders_cancelled.send(sender=Order, order_ids=claimed)
+
+    # Возвращённый по заказу товар уже пришёл на склад, повторно он не возвращается
+    returned = (
+        ReturnItem.objects.filter(return_obj__order_id=OuterRef('order_id'), product_id=OuterRef('product_id'))
+        .order_by()
+        .values('product_id')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    release_stock(
+        (
+            row['product_id'], row['order__warehouse_id'], row['total'] - row['returned'],
+            'cancellation', f"cancel:{row['order_id']}",
+        )
+        for row in OrderItem.objects.filter(order_id__in=claimed)
+        .order_by()
+        .values('order_id', 'order__warehouse_id', 'product_id')
+        .annotate(total=Sum('quantity'), returned=Coalesce(Subquery(returned), 0))
+    )
+    return claimed
+
+
+def transition_orders(order_ids, status, reason=None):
+    """
+    Переводит заказы в status по графу Order.STATUS_TRANSITIONS.
+
+    Подходящие заказы захватываются и обновляются одним
+    UPDATE ... WHERE status IN (допустимые исходные статусы); отмена идёт через
+    cancel_orders, чтобы вернуть товар на склад. Возвращает пару
+    (переведённые id, отклонённые id). Вызывается внутри transaction.atomic.
+    """
+    if status not in Order.STATUS_TRANSITIONS:
+        raise ValueError(f"Недопустимый статус: {status}")
+    order_ids = list(dict.fromkeys(order_ids))
+
+    if status == 'cancelled':
+        moved = cancel_orders(order_ids, reason)
+    else:
+        claimable = Order.objects.filter(id__in=order_ids, status__in=Order.source_statuses(status))
+        if connection.features.has_select_for_update:
+            claimable = claimable.select_for_update().order_by('id')
+        moved = list(claimable.values_list('id', flat=True))
+        if moved:
+            Order.objects.filter(id__in=moved, status__in=Order.source_statuses(status)).update(status=status)
+            orders_changed.send(sender=Order, order_ids=moved)
+
+    moved_set = set(moved)
+    return sorted(moved_set), [order_id for order_id in order_ids if order_id not in moved_set]
+
+
+def cancel_stale_orders(older_than, reason, batch_size=CANCEL_BATCH_SIZE):
+    """
+    Отменяет новые заказы, созданные раньше older_than, пачками по batch_size,
+    каждая пачка — отдельная короткая транзакция. Возвращает id отменённых заказов.
+    """
+    stale = Order.objects.filter(status='new', created_at__lt=older_than).order_by('id')
+    cancelled = []
+    last_id = 0
+    while True:
+        batch = list(stale.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+        if not batch:
+            return cancelled
+        with transaction.atomic():
+            cancelled.extend(cancel_orders(batch, reason, statuses=('new',)))
+        last_id = batch[-1]
+
+
+class ReturnRejected(Exception):
+    """Возврат по записи не принят; текст — для клиента."""
+
+
+class ReturnOrderNotFound(ReturnRejected):
+    pass
+
+
+def register_returns(entries):
+    """
+    Оформляет пачку возвратов и возвращает товар на склад заказа.
+
+    entries — кортежи (order_id, reason, [(product_id, quantity), ...]).
+    Заказы и заказанные количества читаются двумя запросами на всю пачку,
+    возвраты и их позиции создаются bulk_create, остатки пополняются одним
+    UPDATE. Возвращает по элементу на запись: Return или ReturnRejected.
+    Вызывается внутри transaction.atomic.
+    """
+    order_ids = {order_id for order_id, _, _ in entries}
+    orders = {
+        order['id']: order
+        for order in Order.objects.filter(id__in=order_ids).values(
+            'id', 'status', 'warehouse_id',
+            has_return=Exists(Return.objects.filter(order_id=OuterRef('pk'))),
+        )
+    }
+    ordered = {
+        (row['order_id'], row['product_id']): row['total']
+        for row in OrderItem.objects.filter(order_id__in=order_ids)
+        .order_by()
+        .values('order_id', 'product_id')
+        .annotate(total=Sum('quantity'))
+    }
+
+    results = []
+    seen = set()
+    for order_id, reason, lines in entries:
+        order = orders.get(order_id)
+        if order is None:
+            results.append(ReturnOrderNotFound("Заказ не найден"))
+            continue
+        if order['has_return'] or order_id in seen:
+            results.append(ReturnRejected("Возврат по заказу уже оформлен"))
+            continue
+        if order['status'] not in RETURNABLE_STATUSES:
+            results.append(ReturnRejected("Возврат возможен только по отправленному или завершённому заказу"))
+            continue
+        if not lines or any(quantity <= 0 for _, quantity in lines):
+            results.append(ReturnRejected("Количество товара должно быть положительным"))
+            continue
+        wanted = merge_lines(lines)
+        excess = [
+            product_id for product_id, quantity in wanted.items()
+            if quantity > ordered.get((order_id, product_id), 0)
+        ]
+        if excess:
+            results.append(ReturnRejected(f"Возвращается больше, чем заказано: товары {', '.join(map(str, excess))}"))
+            continue
+        seen.add(order_id)
+        results.append((Return(order_id=order_id, reason=reason or ""), wanted))
+
+    accepted = [result for result in results if not isinstance(result, ReturnRejected)]
+    Return.objects.bulk_create([return_obj for return_obj, _ in accepted])
+    ReturnItem.objects.bulk_create(
+        ReturnItem(return_obj=return_obj, product_id=product_id, quantity=quantity)
+        for return_obj, wanted in accepted
+        for product_id, quantity in wanted.items()
+    )
+    if accepted:
+        returns_registered.send(sender=Return, return_ids=[return_obj.id for return_obj, _ in accepted])
+    restock = [
+        (product_id, orders[return_obj.order_id]['warehouse_id'], quantity, 'return', f"return:{return_obj.order_id}")
+        for return_obj, wanted in accepted
+        for product_id, quantity in wanted.items()
+    ]
+    if restock:
+        apply_stock_batch([restock])
+
+    return [result if isinstance(result, ReturnRejected) else result[0] for result in results]
+
+
+def _order_rows(order_ids):
+    return (
+        Order.objects.filter(id__in=order_ids)
+        .order_by('id', 'items__id')
+        .values_list(*ORDER_OUT_FIELDS, *ORDER_ITEM_OUT_FIELDS)
+    )
+
+
+def _collect_orders(rows, order_ids):
+    orders = {}
+    for (order_id, status, created_at, warehouse_id, qr_code, client_name, address, comment,
+         total_price, cancellation_reason, product_id, name, quantity, price) in rows:
+        order = orders.get(order_id)
+        if order is None:
+            order = orders[order_id] = {
+                "id": order_id,
+                "status": status,
+                "created_at": created_at.isoformat(),
+                "warehouse": warehouse_id,
+                "qr_code": default_storage.url(qr_code) if qr_code else None,
+                "items": [],
+                "total_price": float(total_price),
+                "client_name": client_name,
+                "destination_address": address,
+                "comment": comment,
+                "cancellation_reason": cancellation_reason,
+            }
+        if product_id is not None:
+            order["items"].append({
+                "product_id": product_id, "name": name, "quantity": quantity, "price": float(price),
+            })
+    return [orders[order_id] for order_id in order_ids if order_id in orders]
+
+
+def serialize_orders(order_ids):
+    """
+    Заказы с позициями в виде словарей по схеме OrderOut, в порядке order_ids.
+
+    Заказы, позиции и названия товаров читаются одним запросом с JOIN через
+    values(), без создания моделей; строки собираются в словари напрямую.
+    """
+    order_ids = list(order_ids)
+    return _collect_orders(_order_rows(order_ids), order_ids)
+
+
+async def aserialize_orders(order_ids):
+    order_ids = list(order_ids)
+    # Страница выбирается одним обращением к базе, без поштучного aiterator()
+    return _collect_orders([row async for row in _order_rows(order_ids)], order_ids)
+
+
+def orders_response(data):
+    """
+    JSON-ответ из уже собранных serialize_orders словарей.
+
+    Данные построены из базы по схеме OrderOut, поэтому повторная валидация
+    схемой ответа пропускается: ninja отдаёт HttpResponse как есть.
+    """
+    return JsonResponse(data, safe=False)
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def encode_order_cursor(created_at, order_id):
+    raw = f"{created_at.isoformat()}|{order_id}"
+    return urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_order_cursor(cursor):
+    try:
+        created_at, order_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError:
+        raise HttpError(400, "Некорректный курсор")
+
+
+def order_qr_payload(request, order_id):
+    return request.build_absolute_uri(f"/api/orders/order/{order_id}")
+
+
+def render_qr_png(payload):
+    qr = qrcode.QRCode(version=QR_VERSION, box_size=QR_BOX_SIZE, border=QR_BORDER)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    qr_image = qr.make_image(fill='black', back_color='white')
+    buffer = BytesIO()
+    qr_image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def get_or_render_qr(payload):
+    """
+    Возвращает путь к PNG с QR-кодом в хранилище.
+
+    Имя файла — хеш содержимого и параметров рендера, поэтому одинаковые данные
+    рендерятся один раз, а повторные запросы отдают уже готовый файл.
+    """
+    key = hashlib.sha256(f"{QR_VERSION}:{QR_BOX_SIZE}:{QR_BORDER}:{payload}".encode()).hexdigest()
+    path = f"qr_codes/{key[:2]}/{key}.png"
+    if not default_storage.exists(path):
+        path = default_storage.save(path, ContentFile(render_qr_png(payload)))
+    return path
+
+
+def attach_order_qr(order_id, payload):
+    path = get_or_render_qr(payload)
+    Order.objects.filter(Q(qr_code__isnull=True) | Q(qr_code=''), id=order_id).update(qr_code=path)
+    return path
+
+
+async def aattach_order_qr(order_id, payload):
+    """Рендер QR в пуле 'qr', запись пути в заказ — через async ORM."""
+    path = await run_blocking('qr', get_or_render_qr, payload)
+    await Order.objects.filter(Q(qr_code__isnull=True) | Q(qr_code=''), id=order_id).aupdate(qr_code=path)
+    return path
+
+
+def _attach_order_qr_in_worker(order_id, payload):
+    # Future никто не читает, поэтому ошибка рендера иначе потерялась бы
+    try:
+        attach_order_qr(order_id, payload)
+    except Exception:
+        logger.exception("Не удалось сохранить QR-код заказа %s", order_id)
+    finally:
+        connection.close()
+
+
+def _submit(order_id, payload):
+    future = get_executor('qr').submit(_attach_order_qr_in_worker, order_id, payload)
+    _pending.add(future)
+    future.add_done_callback(_pending.discard)
+
+
+def schedule_order_qr(order_id, payload):
+    """
+    Ставит генерацию QR-кода заказа после коммита транзакции.
+
+    По умолчанию рендер идёт в пуле фоновых потоков, и Order.qr_code заполняется
+    асинхронно. При ORDER_QR_MODE = 'after_commit' рендер выполняется синхронно,
+    но тоже после коммита, не удерживая блокировку записи; при 'inline' — сразу,
+    внутри транзакции.
+    """
+    mode = settings.ORDER_QR_MODE
+    if mode == 'inline':
+        attach_order_qr(order_id, payload)
+    elif mode == 'after_commit':
+        transaction.on_commit(lambda: attach_order_qr(order_id, payload))
+    else:
+        transaction.on_commit(lambda: _submit(order_id, payload))
+
+
+def wait_for_qr_jobs(timeout=None):
+    wait(list(_pending), timeout=timeout)
@@ -1,5 +1,9 @@
 from django.contrib import admin
-from productApp.models import Product, Stock
+from django.db import transaction
+from django.db.models.expressions import RawSQL
+from productApp.models import Product, Stock, StockMovement
+from productApp.search import matching_ids_sql
+from productApp.utils import record_movements
 from unfold.admin import ModelAdmin
 
 @admin.register(Product)
@@ -19,6 +23,12 @@ class ProductAdmin(ModelAdmin):
     list_per_page = 20
     show_full_result_count = True
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу вместо icontains по каждому полю
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(id__in=RawSQL(*matching_ids_sql(search_term))), False
+
 @admin.register(Stock)
 class StockAdmin(ModelAdmin):
     list_display = [
@@ -34,4 +44,35 @@ class StockAdmin(ModelAdmin):
     list_per_page = 20
     show_full_result_count = True
 
+    def save_model(self, request, obj, form, change):
+        # Ручная правка остатка тоже попадает в журнал движений
+        with transaction.atomic():
+            previous = Stock.objects.filter(pk=obj.pk).values_list('quantity', flat=True).first() or 0
+            super().save_model(request, obj, form, change)
+            record_movements([
+                (obj.product_id, obj.warehouse_id, obj.quantity - previous, 'adjustment', f"admin:{request.user.pk}")
+            ])
+
+@admin.register(StockMovement)
+class StockMovementAdmin(ModelAdmin):
+    list_display = [
+        'created_at',
+        'product',
+        'warehouse',
+        'delta',
+        'kind',
+        'reference',
+    ]
+    list_filter = [
+        'kind',
+        'warehouse',
+    ]
+    search_fields = ['product__name', 'reference']
+    list_select_related = ['product', 'warehouse']
+    list_per_page = 20
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -1,11 +1,20 @@
 from django.core.files.storage import default_storage
-from django.db import models
-from django.shortcuts import get_object_or_404
+from django.db import models, transaction
+from django.http import HttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
 from ninja import Schema, Router, UploadedFile
 from ninja.errors import HttpError
+from core.cache import acached_response
 from productApp.models import Product, Stock, ProductImage
+from productApp.search import SEARCH_MAX_LIMIT, search_products
+from productApp.utils import StockConflict, apply_stock_batch, record_movements, stock_as_of
+from datetime import datetime
 from typing import List, Optional
-from productApp.schemas import ProductIn, ProductOut, ProductImageOut, ProductImageIn, ProductUpdate
+from productApp.schemas import (
+    ProductIn, ProductOut, ProductListOut, ProductImageOut, ProductImageIn, ProductUpdate,
+    StockBatchIn, StockBatchOut, StockTransferBatchIn, StockTransferBatchOut,
+    ProductSearchOut, ProductSuggestionOut, PRODUCT_LIST_FIELDS,
+)
 from warehouseApp.models import Warehouse
 from userApp.utils import group_required
 
@@ -13,44 +22,117 @@ from userApp.utils import group_required
 product_router = Router(tags=['Товары'])
 
 
-@product_router.get('/product_list_get', response=List[ProductOut])
+@product_router.get('/product_list_get', response=List[ProductListOut], exclude_unset=True)
 #@group_required("admin")
-def get_products(request, warehouse_id: Optional[int] = None):
-    if warehouse_id:
-        products = Product.objects.filter(stocks__warehouse_id=warehouse_id).distinct()
+async def get_products(
+    request,
+    response: HttpResponse,
+    warehouse_id: Optional[int] = None,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+):
+    # Проекция полей: ?fields=id,name,price
+    if fields:
+        selected = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = set(selected) - set(PRODUCT_LIST_FIELDS)
+        if unknown:
+            raise HttpError(400, f"Неизвестные поля: {', '.join(sorted(unknown))}")
     else:
-        products = Product.objects.all()
-
-    result = []
-    for p in products:
-        stock_warehouses = Stock.objects.filter(product=p, quantity__gt=0).values_list('warehouse_id', flat=True)
-        result.append({
-            "id": p.id,
-            "name": p.name,
-            "product_type": p.product_type,
-            "product_description": p.product_description,
-            "price": p.price,
-            # "warehouse": p.warehouse.id,
-            "warehouses_with_stock": list(stock_warehouses)
-        })
-    return result
+        selected = list(PRODUCT_LIST_FIELDS)
+
+    products = Product.objects.order_by('id')
+    if warehouse_id:
+        products = products.filter(
+            id__in=Stock.objects.filter(warehouse_id=warehouse_id).values('product_id')
+        )
+
+    # Keyset-пагинация: курсор — id последнего товара предыдущей страницы
+    if cursor is not None:
+        products = products.filter(id__gt=cursor)
+    if limit is not None:
+        if limit <= 0:
+            raise HttpError(400, "limit должен быть положительным")
+        products = products[:limit]
+
+    columns = [f for f in selected if f != 'warehouses_with_stock']
+    rows = [row async for row in products.values('id', *[c for c in columns if c != 'id'])]
+
+    if 'warehouses_with_stock' in selected:
+        # Склады с остатками для всей страницы одним запросом
+        stock_map = {row['id']: [] for row in rows}
+        if rows:
+            stocks = (
+                Stock.objects.filter(product_id__in=[row['id'] for row in rows], quantity__gt=0)
+                .order_by('product_id', 'warehouse_id')
+                .values_list('product_id', 'warehouse_id')
+            )
+            async for product_id, stock_warehouse_id in stocks:
+                stock_map.setdefault(product_id, []).append(stock_warehouse_id)
+        for row in rows:
+            row['warehouses_with_stock'] = stock_map.get(row['id'], [])
+
+    if limit is not None and len(rows) == limit:
+        response['X-Next-Cursor'] = str(rows[-1]['id'])
+
+    if 'id' not in selected:
+        for row in rows:
+            del row['id']
+    return rows
+
+
+def check_search_limit(limit):
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        raise HttpError(400, f"limit должен быть от 1 до {SEARCH_MAX_LIMIT}")
+
+
+@product_router.get('/product_search', response=List[ProductSearchOut])
+def search_product_index(
+    request,
+    q: str,
+    product_type: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    limit: int = 20,
+):
+    # Полнотекстовый индекс (FTS5 или tsvector), каждое слово ищется как префикс
+    check_search_limit(limit)
+    return search_products(q, product_type=product_type, min_price=min_price, max_price=max_price, limit=limit)
+
+
+@product_router.get('/product_autocomplete', response=List[ProductSuggestionOut])
+def autocomplete_products(request, q: str, limit: int = 10):
+    check_search_limit(limit)
+    return search_products(q, limit=limit, names_only=True)
 
 
 @product_router.get('/product_detail_get', response=ProductOut)
-def get_product_detail(request, product_id: int, warehouse_id: Optional[int] = None):
-    product = get_object_or_404(Product, id=product_id)
+async def get_product_detail(request, response: HttpResponse, product_id: int, warehouse_id: Optional[int] = None):
+    return await acached_response(
+        request, response,
+        key=f"product_detail:{product_id}:{warehouse_id}",
+        dependencies=[('product', product_id)],
+        producer=lambda: load_product_detail(product_id, warehouse_id),
+    )
+
+
+async def load_product_detail(product_id, warehouse_id):
+    product = await aget_object_or_404(Product, id=product_id)
 
     current_warehouse = None
     current_quantity = None
 
     if warehouse_id is not None:
-        stock = Stock.objects.filter(product=product, warehouse_id=warehouse_id).first()
+        stock = await Stock.objects.filter(product=product, warehouse_id=warehouse_id).afirst()
         if not stock or stock.quantity <= 0:
             raise HttpError(404, "Товар не найден на указанном складе")
         current_warehouse = warehouse_id
         current_quantity = stock.quantity
 
-    stock_warehouses = Stock.objects.filter(product=product, quantity__gt=0).values_list('warehouse_id', flat=True)
+    stock_warehouses = [
+        stock_warehouse_id
+        async for stock_warehouse_id in Stock.objects.filter(product=product, quantity__gt=0).values_list('warehouse_id', flat=True)
+    ]
 
     return {
         "id": product.id,
@@ -60,7 +142,7 @@ def get_product_detail(request, product_id: int, warehouse_id: Optional[int] = N
         "price": product.price,
         "current_warehouse": current_warehouse,
         "current_quantity": current_quantity,
-        "warehouses_with_stock": list(stock_warehouses)
+        "warehouses_with_stock": stock_warehouses
     }
 
 
@@ -141,12 +223,21 @@ def delete_product(request, product_id: int):
 
 
 @product_router.get('/product_stock')
-def get_product_stock(request, product_id: int, warehouse_id: Optional[int] = None):
-    product = Product.objects.get(id=product_id)
+async def get_product_stock(request, response: HttpResponse, product_id: int, warehouse_id: Optional[int] = None):
+    return await acached_response(
+        request, response,
+        key=f"product_stock:{product_id}:{warehouse_id}",
+        dependencies=[('product', product_id)] + ([('warehouse', warehouse_id)] if warehouse_id is not None else []),
+        producer=lambda: load_product_stock(product_id, warehouse_id),
+    )
+
+
+async def load_product_stock(product_id, warehouse_id):
+    product = await Product.objects.aget(id=product_id)
 
     if warehouse_id is not None:
-        warehouse = Warehouse.objects.get(id=warehouse_id)
-        stock = Stock.objects.filter(product=product, warehouse=warehouse).first()
+        warehouse = await Warehouse.objects.aget(id=warehouse_id)
+        stock = await Stock.objects.filter(product=product, warehouse=warehouse).afirst()
 
         if stock:
             return {
@@ -158,9 +249,11 @@ def get_product_stock(request, product_id: int, warehouse_id: Optional[int] = No
         else:
             return {"detail": "Нет остатков на складе для данного продукта."}
     else:
-        stocks = Stock.objects.filter(product=product, quantity__gt=0)
-        total_quantity = sum(stock.quantity for stock in stocks)
-        warehouse_ids = [stock.warehouse.id for stock in stocks]
+        stocks = [
+            row async for row in Stock.objects.filter(product=product, quantity__gt=0).values_list('warehouse_id', 'quantity')
+        ]
+        total_quantity = sum(quantity for _, quantity in stocks)
+        warehouse_ids = [warehouse_id for warehouse_id, _ in stocks]
 
         return {
             "product": product.name,
@@ -169,6 +262,15 @@ def get_product_stock(request, product_id: int, warehouse_id: Optional[int] = No
         }
 
 
+@product_router.get('/product_stock_as_of')
+def get_product_stock_as_of(request, product_id: int, warehouse_id: int, at: datetime):
+    return {
+        "product_id": product_id,
+        "warehouse_id": warehouse_id,
+        "at": at.isoformat(),
+        "quantity": stock_as_of(product_id, warehouse_id, at),
+    }
+
 
 # Эндпоинт для добавления товара на склад
 
@@ -180,17 +282,19 @@ def add_product_stock(request, product_id: int, warehouse_id: int, quantity: int
         product = Product.objects.get(id=product_id)
         warehouse = Warehouse.objects.get(id=warehouse_id)
 
-        # Получаем или создаем запись на складе
-        stock, created = Stock.objects.get_or_create(product=product, warehouse=warehouse)
+        with transaction.atomic():
+            # Получаем или создаем запись на складе
+            stock, created = Stock.objects.select_for_update().get_or_create(product=product, warehouse=warehouse)
 
-        # Если запись была создана, необходимо указать начальное количество
-        if created:
-            stock.quantity = quantity
-        else:
-            # Если запись уже существует, обновляем количество
-            stock.quantity += quantity
+            # Если запись была создана, необходимо указать начальное количество
+            if created:
+                stock.quantity = quantity
+            else:
+                # Если запись уже существует, обновляем количество
+                stock.quantity += quantity
 
-        stock.save()
+            stock.save()
+            record_movements([(product.id, warehouse.id, quantity, 'receipt', '')])
         return {"status": "success", "stock_quantity": stock.quantity}
     except Product.DoesNotExist:
         return {"status": "error", "message": "Product not found"}
@@ -206,22 +310,24 @@ def remove_product_stock(request, product_id: int, warehouse_id: int, quantity:
         product = Product.objects.get(id=product_id)
         warehouse = Warehouse.objects.get(id=warehouse_id)
 
-        # Получаем запись об остатках
-        stock = Stock.objects.filter(product=product, warehouse=warehouse).first()
+        with transaction.atomic():
+            # Получаем запись об остатках
+            stock = Stock.objects.select_for_update().filter(product=product, warehouse=warehouse).first()
 
-        if not stock:
-            return {"status": "error", "message": "Остаток на складе не найден"}
+            if not stock:
+                return {"status": "error", "message": "Остаток на складе не найден"}
 
-        # Проверка на достаточное количество
-        if stock.quantity < quantity:
-            return {
-                "status": "error",
-                "message": f"Недостаточно товара на складе. Доступно: {stock.quantity}"
-            }
+            # Проверка на достаточное количество
+            if stock.quantity < quantity:
+                return {
+                    "status": "error",
+                    "message": f"Недостаточно товара на складе. Доступно: {stock.quantity}"
+                }
 
-        # Уменьшаем количество
-        stock.quantity -= quantity
-        stock.save()
+            # Уменьшаем количество
+            stock.quantity -= quantity
+            stock.save()
+            record_movements([(product.id, warehouse.id, -quantity, 'write_off', '')])
 
         return {"status": "success", "stock_quantity": stock.quantity}
 
@@ -249,23 +355,29 @@ def transfer_product_stock(
         if from_warehouse_id == to_warehouse_id:
             return {"status": "error", "message": "Нельзя переместить товар на тот же склад"}
 
-        # Остаток на складе-источнике
-        from_stock = Stock.objects.filter(product=product, warehouse=from_warehouse).first()
-        if not from_stock or from_stock.quantity < quantity:
-            return {
-                "status": "error",
-                "message": f"Недостаточно товара на складе-источнике. Доступно: {from_stock.quantity if from_stock else 0}"
-            }
-
-        # Получаем или создаем запись на складе-назначении
-        to_stock, _ = Stock.objects.get_or_create(product=product, warehouse=to_warehouse)
-
-        # Выполняем перенос
-        from_stock.quantity -= quantity
-        to_stock.quantity += quantity
-
-        from_stock.save()
-        to_stock.save()
+        with transaction.atomic():
+            # Остаток на складе-источнике
+            from_stock = Stock.objects.select_for_update().filter(product=product, warehouse=from_warehouse).first()
+            if not from_stock or from_stock.quantity < quantity:
+                return {
+                    "status": "error",
+                    "message": f"Недостаточно товара на складе-источнике. Доступно: {from_stock.quantity if from_stock else 0}"
+                }
+
+            # Получаем или создаем запись на складе-назначении
+            to_stock, _ = Stock.objects.select_for_update().get_or_create(product=product, warehouse=to_warehouse)
+
+            # Выполняем перенос
+            from_stock.quantity -= quantity
+            to_stock.quantity += quantity
+
+            from_stock.save()
+            to_stock.save()
+            reference = f"transfer:{from_warehouse.id}->{to_warehouse.id}"
+            record_movements([
+                (product.id, from_warehouse.id, -quantity, 'transfer_out', reference),
+                (product.id, to_warehouse.id, quantity, 'transfer_in', reference),
+            ])
 
         return {
             "status": "success",
@@ -281,6 +393,93 @@ def transfer_product_stock(
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+def run_stock_batch(rows, operations, atomic, build_row):
+    """
+    Общая часть пакетных эндпоинтов: проверка товаров и складов двумя запросами,
+    затем apply_stock_batch для прошедших проверку строк.
+
+    operations — по одной операции на строку или сообщение об ошибке вместо неё.
+    """
+    product_ids = {m[0] for op in operations if not isinstance(op, str) for m in op}
+    warehouse_ids = {m[1] for op in operations if not isinstance(op, str) for m in op}
+    known_products = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+    known_warehouses = set(Warehouse.objects.filter(id__in=warehouse_ids).values_list('id', flat=True))
+
+    errors = {}
+    for index, op in enumerate(operations):
+        if isinstance(op, str):
+            errors[index] = op
+        elif any(m[0] not in known_products for m in op):
+            errors[index] = "Продукт не найден"
+        elif any(m[1] not in known_warehouses for m in op):
+            errors[index] = "Склад не найден"
+
+    if errors and atomic:
+        valid = []
+    else:
+        valid = [index for index in range(len(operations)) if index not in errors]
+
+    try:
+        applied = apply_stock_batch([operations[index] for index in valid], atomic=atomic)
+    except StockConflict:
+        raise HttpError(409, "Остатки изменились во время обработки, повторите запрос")
+
+    outcome = dict(zip(valid, applied))
+    failed = bool(errors) or any(shortage for shortage, _ in applied)
+    result_rows = []
+    for index, row in enumerate(rows):
+        if index in errors:
+            result_rows.append({"index": index, "status": "error", "message": errors[index]})
+            continue
+        shortage, quantities = outcome.get(index, (None, None))
+        if shortage:
+            result_rows.append({
+                "index": index, "status": "error",
+                "message": f"Недостаточно товара на складе. Доступно: {shortage.available}",
+            })
+        elif atomic and failed:
+            result_rows.append({"index": index, "status": "skipped", "message": "Пакет отменён из-за ошибок"})
+        else:
+            result_rows.append({"index": index, "status": "success", **build_row(row, quantities)})
+
+    return {"status": "error" if failed else "success", "rows": result_rows}
+
+
+@product_router.post("/products/product_stock_batch", response=StockBatchOut)
+def batch_product_stock(request, data: StockBatchIn):
+    operations = [
+        [(row.product_id, row.warehouse_id, row.delta, 'receipt' if row.delta > 0 else 'write_off', '')]
+        if row.delta else "Изменение не может быть нулевым"
+        for row in data.rows
+    ]
+    return run_stock_batch(
+        data.rows, operations, data.atomic,
+        lambda row, quantities: {"stock_quantity": quantities[(row.product_id, row.warehouse_id)]},
+    )
+
+
+@product_router.post("/products/product_stock_transfer_batch", response=StockTransferBatchOut)
+def batch_transfer_product_stock(request, data: StockTransferBatchIn):
+    operations = []
+    for row in data.rows:
+        if row.from_warehouse_id == row.to_warehouse_id:
+            operations.append("Нельзя переместить товар на тот же склад")
+        elif row.quantity <= 0:
+            operations.append("Количество должно быть положительным")
+        else:
+            reference = f"transfer:{row.from_warehouse_id}->{row.to_warehouse_id}"
+            operations.append([
+                (row.product_id, row.from_warehouse_id, -row.quantity, 'transfer_out', reference),
+                (row.product_id, row.to_warehouse_id, row.quantity, 'transfer_in', reference),
+            ])
+    return run_stock_batch(
+        data.rows, operations, data.atomic,
+        lambda row, quantities: {
+            "from_warehouse_stock": quantities[(row.product_id, row.from_warehouse_id)],
+            "to_warehouse_stock": quantities[(row.product_id, row.to_warehouse_id)],
+        },
+    )
+
 @product_router.post('/product/upload_image', response={200: ProductImageOut, 404: dict})
 def upload_product_image(request, data: ProductImageIn, file: UploadedFile):
     try:
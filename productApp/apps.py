@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ProductappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'productApp'
+
+    def ready(self):
+        from productApp import signals  # noqa: F401
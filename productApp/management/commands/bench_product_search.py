@@ -0,0 +1,69 @@
+import itertools
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.benchmark import benchmark_environment, latency_summary
+from productApp.models import Product
+from productApp.search import rebuild_search_index, search_products
+
+SYLLABLES = ["ка", "ро", "ми", "ла", "то", "не", "ва", "со", "ру", "ли", "ма", "ко", "де", "ти", "на", "по"]
+TYPES = ["Фрукты", "Молочное", "Бакалея", "Напитки", "Сладости"]
+VOCABULARY_SIZE = 20000
+
+
+class Command(BaseCommand):
+    help = "Задержка поиска и автодополнения товаров по индексу на N товарах"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500000)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Словарь с распределением Ципфа: частые слова встречаются в тысячах товаров
+        vocabulary = list(dict.fromkeys(
+            "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(VOCABULARY_SIZE * 2)
+        ))[:VOCABULARY_SIZE]
+        cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+        self.word = lambda: rng.choices(vocabulary, cum_weights=cum_weights)[0]
+
+        with benchmark_environment():
+            self.seed(rng, options['products'])
+            started = time.perf_counter()
+            rebuild_search_index()
+            results = {"products": options['products'], "index_seconds": round(time.perf_counter() - started, 2)}
+
+            cases = {
+                "search_two_words": lambda: search_products(f"{self.word()} {self.word()[:4]}"),
+                "search_with_filters": lambda: search_products(
+                    self.word(), product_type=rng.choice(TYPES), min_price=100, max_price=500,
+                ),
+                "autocomplete_prefix": lambda: search_products(self.word()[:3], limit=10, names_only=True),
+            }
+            for name, run in cases.items():
+                samples = []
+                for _ in range(options['queries']):
+                    query_started = time.perf_counter()
+                    run()
+                    samples.append(time.perf_counter() - query_started)
+                results[name] = latency_summary(samples)
+
+        self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+
+    def seed(self, rng, count):
+        Product.objects.bulk_create(
+            (
+                Product(
+                    name=f"{self.word().capitalize()} {self.word()} {n}",
+                    product_type=rng.choice(TYPES),
+                    price=rng.randint(10, 1000),
+                    product_description=" ".join(self.word() for _ in range(6)),
+                )
+                for n in range(count)
+            ),
+            batch_size=5000,
+        )
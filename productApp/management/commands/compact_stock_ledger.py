@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from productApp.utils import compact_stock_ledger
+
+
+class Command(BaseCommand):
+    help = "Создаёт снимки остатков по журналу движений, чтобы запросы на дату читали короткий хвост"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cutoff', help="Момент снимка в ISO 8601, не позже LEDGER_COMPACTION_GRACE назад (по умолчанию — эта граница)")
+
+    def handle(self, *args, **options):
+        cutoff = parse_datetime(options['cutoff']) if options['cutoff'] else None
+        created = compact_stock_ledger(cutoff)
+        self.stdout.write(self.style.SUCCESS(f"Создано снимков: {created}"))
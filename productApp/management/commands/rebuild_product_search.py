@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from productApp.models import Product
+from productApp.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Пересобирает поисковый индекс товаров, например после bulk_create или ручной правки базы"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано товаров: {Product.objects.count()}"))
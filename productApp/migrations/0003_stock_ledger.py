@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-18 02:21
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_opening_movements(apps, schema_editor):
+    # Текущие остатки становятся первой записью журнала
+    Stock = apps.get_model('productApp', 'Stock')
+    StockMovement = apps.get_model('productApp', 'StockMovement')
+    StockMovement.objects.bulk_create(
+        (
+            StockMovement(product_id=product_id, warehouse_id=warehouse_id, delta=quantity, kind='opening')
+            for product_id, warehouse_id, quantity
+            in Stock.objects.filter(quantity__gt=0).values_list('product_id', 'warehouse_id', 'quantity').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productApp', '0002_alter_product_options_product_product_description_and_more'),
+        ('warehouseApp', '0002_alter_warehouse_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField(verbose_name='Изменение')),
+                ('kind', models.CharField(choices=[('opening', 'Начальный остаток'), ('receipt', 'Поступление'), ('write_off', 'Списание'), ('transfer_in', 'Перемещение (приход)'), ('transfer_out', 'Перемещение (расход)'), ('order', 'Заказ'), ('adjustment', 'Корректировка')], max_length=20, verbose_name='Тип движения')),
+                ('reference', models.CharField(blank=True, max_length=100, verbose_name='Основание')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='productApp.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='warehouseApp.warehouse')),
+            ],
+            options={
+                'verbose_name_plural': 'Stock movements (Движения товара)',
+                'indexes': [models.Index(fields=['product', 'warehouse', 'id'], name='movement_pair_id_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('last_movement_id', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='productApp.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='warehouseApp.warehouse')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'warehouse', '-taken_at'], name='snapshot_pair_taken_idx')],
+            },
+        ),
+        migrations.RunPython(create_opening_movements, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productApp', '0003_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='kind',
+            field=models.CharField(choices=[('opening', 'Начальный остаток'), ('receipt', 'Поступление'), ('write_off', 'Списание'), ('transfer_in', 'Перемещение (приход)'), ('transfer_out', 'Перемещение (расход)'), ('order', 'Заказ'), ('return', 'Возврат'), ('adjustment', 'Корректировка')], max_length=20, verbose_name='Тип движения'),
+        ),
+    ]
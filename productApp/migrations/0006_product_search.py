@@ -0,0 +1,62 @@
+from django.db import migrations
+
+# SQL скопирован сюда, чтобы миграция не менялась вместе с productApp.search
+SEARCH_TABLE = 'productApp_product_search'
+
+SQLITE_CREATE = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS "{SEARCH_TABLE}" USING fts5(
+        name, product_description,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )""",
+]
+SQLITE_FILL = [
+    f'INSERT INTO "{SEARCH_TABLE}" (rowid, name, product_description) '
+    f'SELECT id, name, coalesce(product_description, \'\') FROM "productApp_product"',
+    f'INSERT INTO "{SEARCH_TABLE}" ("{SEARCH_TABLE}") VALUES (\'optimize\')',
+]
+
+POSTGRES_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"""CREATE TABLE IF NOT EXISTS "{SEARCH_TABLE}" (
+        product_id bigint PRIMARY KEY REFERENCES "productApp_product" (id) ON DELETE CASCADE,
+        name text NOT NULL,
+        document tsvector NOT NULL
+    )""",
+    f'CREATE INDEX IF NOT EXISTS product_search_document_idx ON "{SEARCH_TABLE}" USING gin (document)',
+    f'CREATE INDEX IF NOT EXISTS product_search_name_trgm_idx ON "{SEARCH_TABLE}" USING gin (name gin_trgm_ops)',
+]
+POSTGRES_FILL = [
+    f'INSERT INTO "{SEARCH_TABLE}" (product_id, name, document) '
+    "SELECT p.id, p.name, "
+    "setweight(to_tsvector('simple', coalesce(p.name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(p.product_description, '')), 'B') "
+    'FROM "productApp_product" p',
+]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        statements = POSTGRES_CREATE + POSTGRES_FILL
+    else:
+        statements = SQLITE_CREATE + SQLITE_FILL
+    with schema_editor.connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS "{SEARCH_TABLE}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productApp', '0005_stockmovement_cancellation_kind'),
+    ]
+
+    operations = [
+        # Таблица индекса зависит от СУБД, поэтому создаётся вне моделей
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productApp', '0006_product_search'),
+        ('warehouseApp', '0002_alter_warehouse_options'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['warehouse', 'product'], name='stock_warehouse_product_idx'),
+        ),
+    ]
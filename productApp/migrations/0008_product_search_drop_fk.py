@@ -0,0 +1,22 @@
+from django.db import migrations
+
+SEARCH_TABLE = 'productApp_product_search'
+
+
+def drop_foreign_key(apps, schema_editor):
+    # Ключ мешал flush и TRUNCATE: таблица индекса не модель и в их список не входит
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'ALTER TABLE "{SEARCH_TABLE}" DROP CONSTRAINT IF EXISTS "{SEARCH_TABLE}_product_id_fkey"'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productApp', '0007_stock_warehouse_product_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_foreign_key, migrations.RunPython.noop),
+    ]
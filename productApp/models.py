@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 from warehouseApp.models import Warehouse
 
@@ -68,6 +69,86 @@ class Stock(models.Model):
 
     class Meta:
         unique_together = ('product', 'warehouse')  # Уникальное сочетание продукта и склада
+        indexes = [
+            # Остатки склада по порядку товаров: keyset-пагинация без сортировки
+            models.Index(fields=['warehouse', 'product'], name='stock_warehouse_product_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.product.name} на складе {self.warehouse.name}: {self.quantity} шт."
\ No newline at end of file
+        return f"{self.product.name} на складе {self.warehouse.name}: {self.quantity} шт."
+
+class StockMovement(models.Model):
+    """Запись журнала движения товара. Журнал только дополняется."""
+    KIND_CHOICES = [
+        ('opening', 'Начальный остаток'),
+        ('receipt', 'Поступление'),
+        ('write_off', 'Списание'),
+        ('transfer_in', 'Перемещение (приход)'),
+        ('transfer_out', 'Перемещение (расход)'),
+        ('order', 'Заказ'),
+        ('return', 'Возврат'),
+        ('cancellation', 'Отмена заказа'),
+        ('adjustment', 'Корректировка'),
+    ]
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='movements'
+    )
+    warehouse = models.ForeignKey(
+        Warehouse,
+        on_delete=models.CASCADE,
+        related_name='movements'
+    )
+    delta = models.IntegerField(
+        verbose_name="Изменение"
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        verbose_name="Тип движения"
+    )
+    reference = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name="Основание"
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True
+    )
+
+    class Meta:
+        verbose_name_plural = 'Stock movements (Движения товара)'
+        indexes = [
+            models.Index(fields=['product', 'warehouse', 'id'], name='movement_pair_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}@{self.warehouse_id}: {self.delta:+d} ({self.kind})"
+
+
+class StockSnapshot(models.Model):
+    """Остаток пары товар/склад с учётом всех движений до last_movement_id включительно."""
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='snapshots'
+    )
+    warehouse = models.ForeignKey(
+        Warehouse,
+        on_delete=models.CASCADE,
+        related_name='snapshots'
+    )
+    quantity = models.IntegerField()
+    last_movement_id = models.BigIntegerField()
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'warehouse', '-taken_at'], name='snapshot_pair_taken_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}@{self.warehouse_id} на {self.taken_at}: {self.quantity}"
@@ -15,6 +15,37 @@ class ProductOut(Schema):
     product_description: Optional[str]
     warehouses_with_stock: List[int]
 
+# Схема для списка товаров: отдаются только запрошенные через fields= поля
+class ProductListOut(Schema):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    product_type: Optional[str] = None
+    price: Optional[float] = None
+    product_description: Optional[str] = None
+    warehouses_with_stock: Optional[List[int]] = None
+
+PRODUCT_LIST_FIELDS = (
+    'id',
+    'name',
+    'product_type',
+    'product_description',
+    'price',
+    'warehouses_with_stock',
+)
+
+# Результат поиска по индексу; rank — чем больше, тем лучше совпадение
+class ProductSearchOut(Schema):
+    id: int
+    name: str
+    product_type: str
+    price: float
+    product_description: Optional[str]
+    rank: float
+
+class ProductSuggestionOut(Schema):
+    id: int
+    name: str
+
 # Схема для ввода данных о продукте
 class ProductIn(Schema):
     name: str
@@ -42,4 +73,44 @@ class ProductImageOut(Schema):
     product: int
     image_url: str
     alt_text: Optional[str]
-    uploaded_at: str
\ No newline at end of file
+    uploaded_at: str
+
+class StockDeltaIn(Schema):
+    product_id: int
+    warehouse_id: int
+    delta: int
+
+class StockBatchIn(Schema):
+    rows: List[StockDeltaIn]
+    atomic: bool = True  # False — применить корректные строки, пропустив ошибочные
+
+class StockBatchRowOut(Schema):
+    index: int
+    status: str
+    message: Optional[str] = None
+    stock_quantity: Optional[int] = None
+
+class StockBatchOut(Schema):
+    status: str
+    rows: List[StockBatchRowOut]
+
+class StockTransferRowIn(Schema):
+    product_id: int
+    from_warehouse_id: int
+    to_warehouse_id: int
+    quantity: int
+
+class StockTransferBatchIn(Schema):
+    rows: List[StockTransferRowIn]
+    atomic: bool = True
+
+class StockTransferRowOut(Schema):
+    index: int
+    status: str
+    message: Optional[str] = None
+    from_warehouse_stock: Optional[int] = None
+    to_warehouse_stock: Optional[int] = None
+
+class StockTransferBatchOut(Schema):
+    status: str
+    rows: List[StockTransferRowOut]
@@ -0,0 +1,210 @@
+import re
+
+from django.db import connection
+
+# Поисковый индекс товаров. SQLite — виртуальная таблица FTS5 (rowid = id товара),
+# PostgreSQL — таблица с tsvector под GIN-индексом и триграммный индекс по названию.
+# Индекс обновляется сигналами Product и пересобирается командой rebuild_product_search.
+SEARCH_TABLE = 'productApp_product_search'
+SEARCH_MAX_LIMIT = 100
+SEARCH_BATCH_SIZE = 2000
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+SQLITE_CREATE = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS "{SEARCH_TABLE}" USING fts5(
+        name, product_description,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )""",
+]
+SQLITE_DROP = [f'DROP TABLE IF EXISTS "{SEARCH_TABLE}"']
+
+POSTGRES_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # Без внешнего ключа: flush и TRUNCATE в тестах очищают только таблицы моделей,
+    # строки удалённых товаров убирают post_delete и prune_search_index
+    f"""CREATE TABLE IF NOT EXISTS "{SEARCH_TABLE}" (
+        product_id bigint PRIMARY KEY,
+        name text NOT NULL,
+        document tsvector NOT NULL
+    )""",
+    f'CREATE INDEX IF NOT EXISTS product_search_document_idx ON "{SEARCH_TABLE}" USING gin (document)',
+    f'CREATE INDEX IF NOT EXISTS product_search_name_trgm_idx ON "{SEARCH_TABLE}" USING gin (name gin_trgm_ops)',
+]
+POSTGRES_DROP = [f'DROP TABLE IF EXISTS "{SEARCH_TABLE}"']
+
+# Название весомее описания: A — название, B — описание
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(p.name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(p.product_description, '')), 'B')"
+)
+
+
+def _is_postgres(conn=None):
+    return (conn or connection).vendor == 'postgresql'
+
+
+def create_search_index(conn):
+    for sql in (POSTGRES_CREATE if _is_postgres(conn) else SQLITE_CREATE):
+        with conn.cursor() as cursor:
+            cursor.execute(sql)
+
+
+def drop_search_index(conn):
+    for sql in (POSTGRES_DROP if _is_postgres(conn) else SQLITE_DROP):
+        with conn.cursor() as cursor:
+            cursor.execute(sql)
+
+
+def prune_search_index(conn):
+    """Удаляет из индекса товары, которых больше нет, например после flush."""
+    if SEARCH_TABLE not in conn.introspection.table_names():
+        return
+    key = 'product_id' if _is_postgres(conn) else 'rowid'
+    with conn.cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{SEARCH_TABLE}" WHERE {key} NOT IN (SELECT id FROM "productApp_product")')
+
+
+def index_products(product_ids):
+    """Переиндексирует товары по id; удалённые товары убираются из индекса."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), SEARCH_BATCH_SIZE):
+            batch = product_ids[start:start + SEARCH_BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            if _is_postgres():
+                cursor.execute(f'DELETE FROM "{SEARCH_TABLE}" WHERE product_id IN ({placeholders})', batch)
+                cursor.execute(
+                    f'INSERT INTO "{SEARCH_TABLE}" (product_id, name, document) '
+                    f'SELECT p.id, p.name, {POSTGRES_DOCUMENT} FROM "productApp_product" p '
+                    f'WHERE p.id IN ({placeholders})',
+                    batch,
+                )
+            else:
+                cursor.execute(f'DELETE FROM "{SEARCH_TABLE}" WHERE rowid IN ({placeholders})', batch)
+                cursor.execute(
+                    f'INSERT INTO "{SEARCH_TABLE}" (rowid, name, product_description) '
+                    f'SELECT id, name, coalesce(product_description, \'\') FROM "productApp_product" '
+                    f'WHERE id IN ({placeholders})',
+                    batch,
+                )
+
+
+def unindex_products(product_ids):
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    key = 'product_id' if _is_postgres() else 'rowid'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM "{SEARCH_TABLE}" WHERE {key} IN ({", ".join(["%s"] * len(product_ids))})',
+            product_ids,
+        )
+
+
+def rebuild_search_index():
+    """Пересоздаёт индекс по всем товарам одним INSERT ... SELECT."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{SEARCH_TABLE}"')
+        if _is_postgres():
+            cursor.execute(
+                f'INSERT INTO "{SEARCH_TABLE}" (product_id, name, document) '
+                f'SELECT p.id, p.name, {POSTGRES_DOCUMENT} FROM "productApp_product" p'
+            )
+        else:
+            cursor.execute(
+                f'INSERT INTO "{SEARCH_TABLE}" (rowid, name, product_description) '
+                f'SELECT id, name, coalesce(product_description, \'\') FROM "productApp_product"'
+            )
+            # Слияние сегментов FTS5 ускоряет последующие запросы
+            cursor.execute(f'INSERT INTO "{SEARCH_TABLE}" ("{SEARCH_TABLE}") VALUES (\'optimize\')')
+
+
+def search_terms(query):
+    return [term.lower() for term in _TERM.findall(query or '')]
+
+
+def _match_expression(terms, names_only):
+    """Каждое слово — префикс; все слова должны встретиться."""
+    if _is_postgres():
+        weight = 'A' if names_only else ''
+        return ' & '.join(f"{term}:*{weight}" for term in terms)
+    expression = ' '.join(f'"{term}"*' for term in terms)
+    return f'name : ({expression})' if names_only else expression
+
+
+def matching_ids_sql(query):
+    """
+    Подзапрос id товаров, подходящих под query, и его параметры.
+
+    Для фильтрации queryset через RawSQL, например в поиске админки.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return 'SELECT NULL WHERE 0 = 1', []
+    if _is_postgres():
+        return (
+            f"SELECT product_id FROM \"{SEARCH_TABLE}\" WHERE document @@ to_tsquery('simple', %s)",
+            [_match_expression(terms, False)],
+        )
+    return f'SELECT rowid FROM "{SEARCH_TABLE}" WHERE "{SEARCH_TABLE}" MATCH %s', [_match_expression(terms, False)]
+
+
+def search_products(query, product_type=None, min_price=None, max_price=None, limit=20, names_only=False):
+    """
+    Ищет товары по индексу, лучшие совпадения первыми.
+
+    Все слова запроса ищутся как префиксы, поэтому подходит и для
+    автодополнения (names_only=True — только по названию).
+    Возвращает словари id, name, product_type, price, product_description, rank.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    filters = []
+    filter_params = []
+    if product_type:
+        filters.append('p.product_type = %s')
+        filter_params.append(product_type)
+    if min_price is not None:
+        filters.append('p.price >= %s')
+        filter_params.append(min_price)
+    if max_price is not None:
+        filters.append('p.price <= %s')
+        filter_params.append(max_price)
+    where = ''.join(f' AND {condition}' for condition in filters)
+
+    # Ранжируются все совпадения: выборка первых N без сортировки по рангу
+    # теряла бы точные совпадения по названию у частых слов
+    if _is_postgres():
+        # Ранг по tsvector, при равенстве — по похожести названия (pg_trgm)
+        sql = (
+            f'SELECT p.id, p.name, p.product_type, p.price, p.product_description, '
+            f'ts_rank(s.document, q.query) AS rank '
+            f'FROM "{SEARCH_TABLE}" s '
+            f"CROSS JOIN to_tsquery('simple', %s) AS q(query) "
+            f'JOIN "productApp_product" p ON p.id = s.product_id '
+            f'WHERE s.document @@ q.query{where} '
+            f'ORDER BY rank DESC, similarity(s.name, %s) DESC, p.id LIMIT %s'
+        )
+        params = [_match_expression(terms, names_only), *filter_params, ' '.join(terms), limit]
+    else:
+        # bm25 тем меньше, чем лучше совпадение; название весит в 10 раз больше описания
+        sql = (
+            f'SELECT p.id, p.name, p.product_type, p.price, p.product_description, '
+            f'-bm25("{SEARCH_TABLE}", 10.0, 1.0) AS rank '
+            f'FROM "{SEARCH_TABLE}" '
+            f'JOIN "productApp_product" p ON p.id = "{SEARCH_TABLE}".rowid '
+            f'WHERE "{SEARCH_TABLE}" MATCH %s{where} '
+            f'ORDER BY rank DESC, p.id LIMIT %s'
+        )
+        params = [_match_expression(terms, names_only), *filter_params, limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
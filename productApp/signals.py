@@ -0,0 +1,44 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import Signal, receiver
+
+from core.cache import bump_versions
+from productApp.models import Product, Stock
+from productApp.search import index_products, prune_search_index, unindex_products
+
+# Отправляется при любом изменении остатков, в том числе через queryset.update()
+stock_changed = Signal()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    bump_versions('product', [instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def reindex_product(sender, instance, **kwargs):
+    index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    unindex_products([instance.pk])
+
+
+@receiver(post_migrate)
+def prune_product_search(sender, using, **kwargs):
+    # flush очищает таблицы моделей и затем отправляет post_migrate
+    if sender.name == 'productApp':
+        prune_search_index(connections[using])
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def invalidate_stock(sender, instance, **kwargs):
+    bump_versions('product', [instance.product_id])
+
+
+@receiver(stock_changed)
+def invalidate_changed_stock(sender, product_ids, **kwargs):
+    bump_versions('product', product_ids)
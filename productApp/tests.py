@@ -1,3 +1,562 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.cache import cache_stats
+from core.metrics import recent_profiles, render_prometheus, reset_metrics
+from core.middleware import MetricsMiddleware
+from orderApp.models import Order
+from productApp.admin import ProductAdmin
+from productApp.models import Product, Stock, StockMovement, StockSnapshot
+from productApp.search import SEARCH_TABLE, rebuild_search_index, search_products
+from productApp.utils import (
+    InsufficientStock, compact_stock_ledger, record_movements, reserve_stock, stock_as_of,
+)
+from userApp.models import CustomUser
+from warehouseApp.models import Warehouse
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+class ProductListTests(TestCase):
+    url = '/api/products/product_list_get'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.other_warehouse = Warehouse.objects.create(name="Запасной", address="ул. Мира, 2")
+
+    def create_products(self, count):
+        products = Product.objects.bulk_create(
+            Product(name=f"Товар {i}", product_type="Тип", price=10 + i) for i in range(count)
+        )
+        Stock.objects.bulk_create(
+            Stock(product=p, warehouse=self.warehouse, quantity=5) for p in products
+        )
+        return products
+
+    def test_query_count_does_not_depend_on_catalog_size(self):
+        self.create_products(3)
+        with self.assertNumQueries(2):
+            small = self.client.get(self.url)
+        self.create_products(30)
+        with self.assertNumQueries(2):
+            large = self.client.get(self.url)
+        self.assertEqual(len(small.json()), 3)
+        self.assertEqual(len(large.json()), 33)
+
+    def test_warehouses_with_stock(self):
+        product = self.create_products(1)[0]
+        Stock.objects.create(product=product, warehouse=self.other_warehouse, quantity=0)
+
+        data = self.client.get(self.url).json()
+        self.assertEqual(data[0]['warehouses_with_stock'], [self.warehouse.id])
+
+        data = self.client.get(self.url, {'warehouse_id': self.other_warehouse.id}).json()
+        self.assertEqual([p['id'] for p in data], [product.id])
+
+    def test_cursor_pagination(self):
+        products = self.create_products(5)
+
+        first = self.client.get(self.url, {'limit': 2})
+        self.assertEqual([p['id'] for p in first.json()], [products[0].id, products[1].id])
+        cursor = first['X-Next-Cursor']
+
+        second = self.client.get(self.url, {'limit': 2, 'cursor': cursor})
+        self.assertEqual([p['id'] for p in second.json()], [products[2].id, products[3].id])
+
+        last = self.client.get(self.url, {'limit': 2, 'cursor': second['X-Next-Cursor']})
+        self.assertEqual([p['id'] for p in last.json()], [products[4].id])
+        self.assertNotIn('X-Next-Cursor', last)
+
+    def test_page_stock_uses_fetched_ids(self):
+        self.create_products(3)
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(self.url, {'limit': 2}).json()
+        self.assertEqual([p['warehouses_with_stock'] for p in data], [[self.warehouse.id]] * 2)
+        # Запрос остатков не повторяет выборку страницы подзапросом
+        stock_sql = queries.captured_queries[-1]['sql']
+        self.assertNotIn('LIMIT', stock_sql.upper())
+
+    def test_fields_projection(self):
+        self.create_products(2)
+        with self.assertNumQueries(1):
+            data = self.client.get(self.url, {'fields': 'id,name,price'}).json()
+        self.assertEqual(set(data[0]), {'id', 'name', 'price'})
+
+        response = self.client.get(self.url, {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ReserveStockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+        cls.pear = Product.objects.create(name="Груша", product_type="Фрукты", price=12)
+        Stock.objects.create(product=cls.apple, warehouse=cls.warehouse, quantity=10)
+        Stock.objects.create(product=cls.pear, warehouse=cls.warehouse, quantity=3)
+
+    def quantities(self):
+        return dict(Stock.objects.values_list('product_id', 'quantity'))
+
+    def test_reserves_all_lines(self):
+        reserve_stock(self.warehouse.id, [(self.apple.id, 4), (self.pear.id, 3), (self.apple.id, 1)], "order:1")
+        self.assertEqual(self.quantities(), {self.apple.id: 5, self.pear.id: 0})
+        self.assertEqual(
+            sorted(StockMovement.objects.values_list('product_id', 'delta', 'reference')),
+            sorted([(self.apple.id, -5, "order:1"), (self.pear.id, -3, "order:1")]),
+        )
+
+    def test_reports_every_shortage_and_changes_nothing(self):
+        missing = Product.objects.create(name="Слива", product_type="Фрукты", price=5)
+        with self.assertRaises(InsufficientStock) as ctx:
+            reserve_stock(self.warehouse.id, [(self.apple.id, 10), (self.pear.id, 4), (missing.id, 1)])
+
+        self.assertEqual(
+            [(s.product_id, s.requested, s.available) for s in ctx.exception.shortages],
+            [(self.pear.id, 4, 3), (missing.id, 1, 0)],
+        )
+        self.assertEqual(self.quantities(), {self.apple.id: 10, self.pear.id: 3})
+        self.assertFalse(StockMovement.objects.exists())
+
+
+class StockLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.other_warehouse = Warehouse.objects.create(name="Запасной", address="ул. Мира, 2")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+
+    def test_stock_endpoints_write_movements(self):
+        params = {'product_id': self.apple.id, 'warehouse_id': self.warehouse.id, 'quantity': 10}
+        self.client.post(f'/api/products/products/product_stock_add?{urlencode(params)}')
+        params['quantity'] = 3
+        self.client.post(f'/api/products/products/product_stock_decrease?{urlencode(params)}')
+        self.client.post('/api/products/products/product_stock_transfer?' + urlencode({
+            'product_id': self.apple.id, 'from_warehouse_id': self.warehouse.id,
+            'to_warehouse_id': self.other_warehouse.id, 'quantity': 2,
+        }))
+
+        for stock in Stock.objects.all():
+            journal = StockMovement.objects.filter(product=stock.product, warehouse=stock.warehouse)
+            self.assertEqual(journal.aggregate(total=Sum('delta'))['total'], stock.quantity)
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list('kind', flat=True)),
+            ['receipt', 'write_off', 'transfer_out', 'transfer_in'],
+        )
+
+    def test_stock_as_of_uses_snapshot_and_tail(self):
+        start = timezone.now() - timedelta(days=3)
+        for day, delta in enumerate([10, -4, 5]):
+            StockMovement.objects.create(
+                product=self.apple, warehouse=self.warehouse, delta=delta, kind='receipt',
+                created_at=start + timedelta(days=day),
+            )
+
+        self.assertEqual(compact_stock_ledger(start + timedelta(days=1, hours=1)), 1)
+        self.assertEqual(StockSnapshot.objects.get().quantity, 6)
+        record_movements([(self.apple.id, self.warehouse.id, -1, 'write_off', '')])
+        # Свежее списание моложе LEDGER_COMPACTION_GRACE и остаётся в хвосте
+        self.assertEqual(compact_stock_ledger(), 1)
+        self.assertEqual(StockSnapshot.objects.order_by('-taken_at').first().quantity, 11)
+        self.assertEqual(stock_as_of(self.apple.id, self.warehouse.id, timezone.now()), 10)
+        StockMovement.objects.filter(kind='write_off').update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(compact_stock_ledger(), 1)
+        self.assertEqual(StockSnapshot.objects.order_by('-taken_at').first().quantity, 10)
+
+        self.assertEqual(stock_as_of(self.apple.id, self.warehouse.id, start - timedelta(hours=1)), 0)
+        self.assertEqual(stock_as_of(self.apple.id, self.warehouse.id, start + timedelta(hours=1)), 10)
+        self.assertEqual(stock_as_of(self.apple.id, self.warehouse.id, start + timedelta(days=2, hours=1)), 11)
+        self.assertEqual(stock_as_of(self.apple.id, self.warehouse.id, timezone.now()), 10)
+
+    def test_compaction_skips_movements_within_grace_period(self):
+        now = timezone.now()
+
+        def move(movement_id, delta):
+            StockMovement.objects.create(
+                id=movement_id, product=self.apple, warehouse=self.warehouse, delta=delta, kind='receipt',
+                created_at=now - timedelta(minutes=1),
+            )
+
+        move(20, 7)
+        self.assertEqual(compact_stock_ledger(now), 0)
+        # Движение с меньшим id закоммичено позже: его транзакция началась раньше
+        move(10, 3)
+        StockMovement.objects.update(created_at=now - timedelta(hours=1))
+        self.assertEqual(compact_stock_ledger(), 1)
+        self.assertEqual(StockSnapshot.objects.get().quantity, 10)
+        self.assertEqual(stock_as_of(self.apple.id, self.warehouse.id, timezone.now()), 10)
+
+    def test_snapshot_is_dated_by_late_movement_below_watermark(self):
+        start = timezone.now() - timedelta(days=2)
+        for movement_id, delta, created_at in ((10, 5, start), (20, 4, start + timedelta(hours=1))):
+            StockMovement.objects.create(
+                id=movement_id, product=self.apple, warehouse=self.warehouse, delta=delta, kind='receipt',
+                created_at=created_at,
+            )
+        # id 15 выдан раньше id 20, но движение датировано позже cutoff
+        late = start + timedelta(hours=5)
+        StockMovement.objects.create(
+            id=15, product=self.apple, warehouse=self.warehouse, delta=2, kind='receipt', created_at=late,
+        )
+
+        cutoff = start + timedelta(hours=2)
+        self.assertEqual(compact_stock_ledger(cutoff), 1)
+        snapshot = StockSnapshot.objects.get()
+        self.assertEqual((snapshot.quantity, snapshot.taken_at), (11, late))
+        self.assertEqual(stock_as_of(self.apple.id, self.warehouse.id, cutoff), 9)
+        self.assertEqual(stock_as_of(self.apple.id, self.warehouse.id, late), 11)
+
+
+# Заказы идут через эндпоинт; QR рендерится синхронно, чтобы не оставлять задач в пуле
+@override_settings(ORDER_QR_MODE='after_commit', MEDIA_ROOT=MEDIA_ROOT)
+class ReserveStockConcurrencyTests(TransactionTestCase):
+    threads = 8
+    attempts = 25
+
+    def test_no_overselling_under_load(self):
+        warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+        pear = Product.objects.create(name="Груша", product_type="Фрукты", price=12)
+        Stock.objects.create(product=apple, warehouse=warehouse, quantity=50)
+        Stock.objects.create(product=pear, warehouse=warehouse, quantity=50)
+
+        statuses = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.threads)
+
+        def worker(index):
+            # Встречный порядок строк в соседних потоках
+            items = [{"product_id": apple.id, "quantity": 1}, {"product_id": pear.id, "quantity": 2}]
+            if index % 2:
+                items.reverse()
+            client = Client(raise_request_exception=False)
+            barrier.wait()
+            try:
+                for _ in range(self.attempts):
+                    response = client.post('/api/orders/order_create', {
+                        "warehouse_id": warehouse.id, "client_name": "Иванов",
+                        "destination_address": "—", "items": items,
+                    }, content_type='application/json')
+                    with lock:
+                        statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(self.threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        # Любая ошибка базы дала бы 500: допустимы только успех и нехватка товара
+        self.assertEqual(set(statuses) - {200, 400}, set())
+        created = statuses.count(200)
+        stocks = dict(Stock.objects.values_list('product_id', 'quantity'))
+        self.assertEqual(created, 25)
+        self.assertEqual(Order.objects.count(), created)
+        self.assertEqual(stocks, {apple.id: 50 - created, pear.id: 50 - 2 * created})
+
+
+class ProductCacheTests(TestCase):
+    url = '/api/products/product_detail_get'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+        Stock.objects.create(product=cls.apple, warehouse=cls.warehouse, quantity=10)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, **headers):
+        return self.client.get(self.url, {'product_id': self.apple.id}, headers=headers)
+
+    def test_second_read_is_served_from_cache(self):
+        before = cache_stats()
+        self.get()
+        with self.assertNumQueries(0):
+            response = self.get()
+        self.assertEqual(response.json()['name'], "Яблоко")
+        after = cache_stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_etag_and_not_modified(self):
+        etag = self.get()['ETag']
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalidated_by_product_and_stock_changes(self):
+        etag = self.get()['ETag']
+
+        self.apple.name = "Зелёное яблоко"
+        self.apple.save()
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], "Зелёное яблоко")
+
+        reserve_stock(self.warehouse.id, [(self.apple.id, 10)])
+        self.assertEqual(self.get().json()['warehouses_with_stock'], [])
+
+
+class StockBatchTests(TestCase):
+    url = '/api/products/products/product_stock_batch'
+    transfer_url = '/api/products/products/product_stock_transfer_batch'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.other_warehouse = Warehouse.objects.create(name="Запасной", address="ул. Мира, 2")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукты", price=10)
+        cls.pear = Product.objects.create(name="Груша", product_type="Фрукты", price=12)
+        Stock.objects.create(product=cls.apple, warehouse=cls.warehouse, quantity=10)
+
+    def post(self, url, rows, atomic=True):
+        return self.client.post(url, {'rows': rows, 'atomic': atomic}, content_type='application/json')
+
+    def quantities(self):
+        return {(p, w): q for p, w, q in Stock.objects.values_list('product_id', 'warehouse_id', 'quantity')}
+
+    def test_applies_rows_in_order(self):
+        rows = [
+            {'product_id': self.pear.id, 'warehouse_id': self.warehouse.id, 'delta': 5},
+            {'product_id': self.apple.id, 'warehouse_id': self.warehouse.id, 'delta': -10},
+            {'product_id': self.pear.id, 'warehouse_id': self.warehouse.id, 'delta': -5},
+        ]
+        data = self.post(self.url, rows).json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual([r['stock_quantity'] for r in data['rows']], [5, 0, 0])
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list('kind', flat=True)),
+            ['receipt', 'write_off', 'write_off'],
+        )
+
+    def test_atomic_batch_rejects_everything(self):
+        rows = [
+            {'product_id': self.apple.id, 'warehouse_id': self.warehouse.id, 'delta': -4},
+            {'product_id': self.apple.id, 'warehouse_id': self.warehouse.id, 'delta': -7},
+            {'product_id': self.apple.id, 'warehouse_id': 0, 'delta': 1},
+        ]
+        data = self.post(self.url, rows).json()
+        self.assertEqual(data['status'], 'error')
+        self.assertEqual([r['status'] for r in data['rows']], ['skipped', 'skipped', 'error'])
+        self.assertEqual(self.quantities(), {(self.apple.id, self.warehouse.id): 10})
+        self.assertFalse(StockMovement.objects.exists())
+
+        data = self.post(self.url, rows[:2]).json()
+        self.assertEqual([r['status'] for r in data['rows']], ['skipped', 'error'])
+        self.assertIn('Доступно: 6', data['rows'][1]['message'])
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_best_effort_applies_valid_rows(self):
+        rows = [
+            {'product_id': self.apple.id, 'warehouse_id': self.warehouse.id, 'delta': -4},
+            {'product_id': self.apple.id, 'warehouse_id': self.warehouse.id, 'delta': -7},
+            {'product_id': self.apple.id, 'warehouse_id': self.warehouse.id, 'delta': 0},
+            {'product_id': self.apple.id, 'warehouse_id': self.warehouse.id, 'delta': -6},
+        ]
+        data = self.post(self.url, rows, atomic=False).json()
+        self.assertEqual([r['status'] for r in data['rows']], ['success', 'error', 'error', 'success'])
+        self.assertEqual(data['rows'][3]['stock_quantity'], 0)
+        self.assertEqual(self.quantities(), {(self.apple.id, self.warehouse.id): 0})
+
+    def test_transfer_batch(self):
+        rows = [
+            {'product_id': self.apple.id, 'from_warehouse_id': self.warehouse.id,
+             'to_warehouse_id': self.other_warehouse.id, 'quantity': 4},
+            {'product_id': self.apple.id, 'from_warehouse_id': self.other_warehouse.id,
+             'to_warehouse_id': self.warehouse.id, 'quantity': 1},
+        ]
+        data = self.post(self.transfer_url, rows).json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(
+            [(r['from_warehouse_stock'], r['to_warehouse_stock']) for r in data['rows']],
+            [(6, 4), (3, 7)],
+        )
+        self.assertEqual(StockMovement.objects.filter(kind='transfer_in').count(), 2)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        def rows(count):
+            return [
+                {'product_id': self.apple.id, 'warehouse_id': self.warehouse.id, 'delta': 1}
+                for _ in range(count)
+            ]
+
+        self.post(self.url, rows(1))
+        with CaptureQueriesContext(connection) as small:
+            self.post(self.url, rows(3))
+        with CaptureQueriesContext(connection) as large:
+            self.post(self.url, rows(50))
+        self.assertEqual(len(small), len(large))
+
+
+class ProductSearchTests(TestCase):
+    url = '/api/products/product_search'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.apple = Product.objects.create(
+            name="Яблоко зелёное", product_type="Фрукты", price=10, product_description="Сорт семеренко",
+        )
+        cls.juice = Product.objects.create(
+            name="Сок", product_type="Напитки", price=50, product_description="Яблочный сок прямого отжима",
+        )
+        cls.pear = Product.objects.create(name="Груша", product_type="Фрукты", price=30)
+
+    def search(self, **params):
+        response = self.client.get(f"{self.url}?{urlencode(params)}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['id'] for row in response.json()]
+
+    def test_prefix_match_ranks_name_above_description(self):
+        self.assertEqual(self.search(q="ябл"), [self.apple.id, self.juice.id])
+        self.assertEqual(self.search(q="ЯБЛОКО зел"), [self.apple.id])
+
+    def test_filters(self):
+        self.assertEqual(self.search(q="ябл", product_type="Напитки"), [self.juice.id])
+        self.assertEqual(self.search(q="ябл", min_price=20, max_price=60), [self.juice.id])
+
+    def test_index_follows_product_changes(self):
+        self.pear.name = "Груша конференция"
+        self.pear.save()
+        self.assertEqual(self.search(q="конф"), [self.pear.id])
+        self.pear.delete()
+        self.assertEqual(self.search(q="груша"), [])
+
+    def test_exact_name_wins_among_many_description_matches(self):
+        Product.objects.bulk_create(
+            Product(name=f"Товар {n}", product_type="Напитки", price=5, product_description="Листовой чай")
+            for n in range(600)
+        )
+        tea = Product.objects.create(name="Чай", product_type="Напитки", price=5)
+        rebuild_search_index()
+        self.assertEqual(search_products("чай", limit=5)[0]['id'], tea.id)
+
+    def test_autocomplete_matches_names_only(self):
+        response = self.client.get('/api/products/product_autocomplete?q=ябл')
+        self.assertEqual(response.json(), [{"id": self.apple.id, "name": "Яблоко зелёное"}])
+
+    def test_rebuild_indexes_bulk_created_products(self):
+        Product.objects.bulk_create([Product(name="Слива", product_type="Фрукты", price=20)])
+        self.assertEqual(self.search(q="слив"), [])
+        call_command('rebuild_product_search', stdout=StringIO())
+        self.assertEqual(len(self.search(q="слив")), 1)
+
+    def test_admin_search_uses_index(self):
+        request = RequestFactory().get('/')
+        queryset, may_have_duplicates = ProductAdmin(Product, admin.site).get_search_results(
+            request, Product.objects.all(), "сок",
+        )
+        self.assertEqual(list(queryset), [self.juice])
+        self.assertFalse(may_have_duplicates)
+
+
+class ProductSearchFlushTests(TransactionTestCase):
+    def test_flush_clears_index(self):
+        Product.objects.create(name="Слива", product_type="Фрукты", price=20)
+        self.assertEqual(len(search_products("слива")), 1)
+        call_command('flush', interactive=False, verbosity=0)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM "{SEARCH_TABLE}"')
+            self.assertEqual(cursor.fetchone(), (0,))
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.products = [
+            Product.objects.create(name=f"Товар {n}", product_type="Фрукты", price=10) for n in range(6)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        reset_metrics()
+
+    def metric(self, text, prefix):
+        return [line for line in text.splitlines() if line.startswith(prefix)]
+
+    def test_route_latency_and_queries_exported(self):
+        self.client.get('/api/products/product_detail_get', {'product_id': self.products[0].id})
+        self.client.get('/api/products/product_detail_get', {'product_id': self.products[1].id})
+        response = self.client.get('/api/metrics')
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+
+        route = 'route="api/products/product_detail_get"'
+        self.assertIn(f'http_request_duration_seconds_count{{method="GET",{route}}} 2', text)
+        self.assertIn(f'http_request_duration_seconds_bucket{{method="GET",{route},le="+Inf"}} 2', text)
+        self.assertIn(f'http_responses_total{{method="GET",{route},status="200"}} 2', text)
+        queries = self.metric(text, f'db_queries_total{{method="GET",{route}}}')
+        self.assertEqual(len(queries), 1)
+        self.assertGreater(int(queries[0].split()[-1]), 0)
+        self.assertIn('api_cache_events_total{event="misses"}', text)
+
+    async def test_async_request_is_measured(self):
+        await self.async_client.get('/api/products/product_list_get')
+        text = render_prometheus()
+        route = 'route="api/products/product_list_get"'
+        self.assertIn(f'http_request_duration_seconds_count{{method="GET",{route}}} 1', text)
+        queries = self.metric(text, f'db_queries_total{{method="GET",{route}}}')
+        self.assertGreater(int(queries[0].split()[-1]), 0)
+
+    def test_repeated_query_flagged_as_n_plus_one(self):
+        def view(request):
+            for product in self.products:
+                list(Stock.objects.filter(product_id=product.id))
+            return HttpResponse()
+
+        request = RequestFactory().get('/loop')
+        with self.assertLogs('core.middleware', level='WARNING'):
+            MetricsMiddleware(view)(request)
+        text = render_prometheus()
+        self.assertIn('db_n_plus_one_requests_total{method="GET",route="unmatched"} 1', text)
+        self.assertIn('db_queries_total{method="GET",route="unmatched"} 6', text)
+
+    def test_streaming_response_measured_until_consumed(self):
+        def view(request):
+            rows = (product.name for product in Product.objects.filter(id__in=[p.id for p in self.products]))
+            return StreamingHttpResponse(rows)
+
+        response = MetricsMiddleware(view)(RequestFactory().get('/export'))
+        self.assertNotIn('route="unmatched"', render_prometheus())
+        self.assertEqual(len(b''.join(response.streaming_content).decode()), sum(len(p.name) for p in self.products))
+        self.assertIn('db_queries_total{method="GET",route="unmatched"} 1', render_prometheus())
+
+    @override_settings(PROFILE_SAMPLE_RATE=1, PROFILE_THRESHOLD_MS=0)
+    def test_sampled_profile_captured(self):
+        self.client.get('/api/products/product_detail_get', {'product_id': self.products[0].id})
+        self.assertEqual(self.client.get('/api/profiles').status_code, 401)
+
+        user = CustomUser.objects.create_user(username="admin", password="secret")
+        user.groups.add(Group.objects.create(name="admin"))
+        self.client.force_login(user)
+        profiles = {profile['route']: profile for profile in self.client.get('/api/profiles').json()}
+        self.assertIn('cumulative', profiles['api/products/product_detail_get']['stats'])
+        self.assertEqual(len(recent_profiles()), 3)
+
+    def test_metrics_limited_to_allowed_addresses(self):
+        self.assertEqual(self.client.get('/api/metrics', REMOTE_ADDR='10.0.0.5').status_code, 403)
+        self.assertEqual(self.client.get('/api/cache_stats', REMOTE_ADDR='10.0.0.5').status_code, 403)
+        self.assertEqual(self.client.get('/api/cache_stats').status_code, 200)
@@ -0,0 +1,294 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Case, F, Max, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from productApp.models import Stock, StockMovement, StockSnapshot
+from productApp.signals import stock_changed
+
+DECREMENT_BATCH_SIZE = 500
+MOVEMENT_BATCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class Shortage:
+    product_id: int
+    requested: int
+    available: int
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(f"Недостаточно товара для {len(shortages)} позиций")
+
+
+class StockConflict(Exception):
+    """Остатки изменились между проверкой и списанием."""
+
+
+def merge_lines(lines):
+    """Суммирует количества по product_id: один товар может встречаться в заказе несколько раз."""
+    wanted = defaultdict(int)
+    for product_id, quantity in lines:
+        wanted[product_id] += quantity
+    return dict(sorted(wanted.items()))
+
+
+def decrement_stock(stocks, key, wanted):
+    """
+    Условно уменьшает остатки: wanted — {значение поля key: количество}.
+
+    Строка уменьшается только если остатка хватает (quantity >= CASE ... END),
+    возвращает число обновлённых строк. Отрицательное количество увеличивает
+    остаток. Большие наборы делятся на пачки по DECREMENT_BATCH_SIZE ключей,
+    каждая — один UPDATE.
+    """
+    updated = 0
+    items = list(wanted.items())
+    for start in range(0, len(items), DECREMENT_BATCH_SIZE):
+        batch = items[start:start + DECREMENT_BATCH_SIZE]
+        requested = Case(
+            *[When(**{key: value}, then=Value(quantity)) for value, quantity in batch],
+            output_field=models.IntegerField(),
+        )
+        updated += stocks.filter(
+            **{f'{key}__in': [value for value, _ in batch]}, quantity__gte=requested
+        ).update(quantity=F('quantity') - requested)
+    return updated
+
+
+def reserve_stock(warehouse_id, lines, reference=''):
+    """
+    Списывает остатки сразу для всех строк заказа.
+
+    lines — список пар (product_id, quantity), reference — основание для журнала
+    движений (например, "order:42"). Списание выполняется одним условным
+    UPDATE (quantity >= запрошенного для каждой строки), поэтому параллельные заказы
+    не могут уйти в минус. Если хотя бы одной строки не хватает, транзакция
+    откатывается и выбрасывается InsufficientStock со списком всех нехваток.
+    """
+    wanted = merge_lines(lines)
+    if not wanted:
+        return
+
+    stocks = Stock.objects.filter(warehouse_id=warehouse_id, product_id__in=wanted)
+    try:
+        with transaction.atomic():
+            # Блокируем строки в порядке product_id, чтобы встречные заказы не взаимоблокировались
+            if connection.features.has_select_for_update:
+                list(stocks.select_for_update().order_by('product_id').values_list('id', flat=True))
+
+            if decrement_stock(stocks, 'product_id', wanted) != len(wanted):
+                raise InsufficientStock([])
+            record_movements(
+                (product_id, warehouse_id, -quantity, 'order', reference)
+                for product_id, quantity in wanted.items()
+            )
+    except InsufficientStock:
+        # Частичное списание уже откачено, читаем исходные остатки
+        available = dict(stocks.values_list('product_id', 'quantity'))
+        raise InsufficientStock([
+            Shortage(product_id, quantity, available.get(product_id, 0))
+            for product_id, quantity in wanted.items()
+            if available.get(product_id, 0) < quantity
+        ])
+
+
+def release_stock(movements):
+    """
+    Возвращает товар на склады: movements — кортежи
+    (product_id, warehouse_id, quantity, kind, reference) с quantity > 0.
+
+    Количества суммируются по складу и товару, на каждый склад выполняется
+    один UPDATE quantity = quantity + CASE product_id ... END. Отсутствующие
+    строки остатков предварительно создаются с нулём.
+    """
+    movements = [m for m in movements if m[2]]
+    by_warehouse = defaultdict(lambda: defaultdict(int))
+    for product_id, warehouse_id, quantity, _, _ in movements:
+        by_warehouse[warehouse_id][product_id] += quantity
+    if not by_warehouse:
+        return
+
+    Stock.objects.bulk_create(
+        [
+            Stock(product_id=product_id, warehouse_id=warehouse_id, quantity=0)
+            for warehouse_id, lines in by_warehouse.items()
+            for product_id in lines
+        ],
+        ignore_conflicts=True,
+    )
+    for warehouse_id, lines in sorted(by_warehouse.items()):
+        decrement_stock(
+            Stock.objects.filter(warehouse_id=warehouse_id), 'product_id',
+            {product_id: -quantity for product_id, quantity in sorted(lines.items())},
+        )
+    record_movements(movements)
+
+
+def apply_stock_batch(operations, atomic=True):
+    """
+    Применяет пакет операций с остатками за несколько запросов.
+
+    operations — список операций, каждая — список движений
+    (product_id, warehouse_id, delta, kind, reference); операция применяется
+    целиком или не применяется. Возвращает по элементу на операцию:
+    (Shortage или None, {(product_id, warehouse_id): остаток после операции}).
+    При atomic=True одна ошибка отменяет весь пакет.
+    """
+    pairs = {(m[0], m[1]) for operation in operations for m in operation}
+    product_ids = {product_id for product_id, _ in pairs}
+    warehouse_ids = {warehouse_id for _, warehouse_id in pairs}
+
+    with transaction.atomic():
+        stocks = Stock.objects.filter(product_id__in=product_ids, warehouse_id__in=warehouse_ids)
+        if connection.features.has_select_for_update:
+            stocks = stocks.select_for_update().order_by('id')
+
+        def load():
+            return {
+                (product_id, warehouse_id): [stock_id, quantity]
+                for stock_id, product_id, warehouse_id, quantity
+                in stocks.values_list('id', 'product_id', 'warehouse_id', 'quantity')
+            }
+
+        current = load()
+        # Недостающие строки остатков создаются только для поступлений
+        missing = {(m[0], m[1]) for operation in operations for m in operation if m[2] > 0} - set(current)
+        if missing:
+            Stock.objects.bulk_create(
+                [Stock(product_id=product_id, warehouse_id=warehouse_id, quantity=0) for product_id, warehouse_id in missing],
+                ignore_conflicts=True,
+            )
+            current = load()
+
+        results = []
+        deltas = defaultdict(int)
+        movements = []
+        for operation in operations:
+            after = {}
+            shortage = None
+            for product_id, warehouse_id, delta, kind, reference in operation:
+                key = (product_id, warehouse_id)
+                quantity = after.get(key, current[key][1] if key in current else 0)
+                if quantity + delta < 0:
+                    shortage = Shortage(product_id, -delta, quantity)
+                    break
+                after[key] = quantity + delta
+            results.append((shortage, {} if shortage else after))
+            if shortage:
+                continue
+
+            for product_id, warehouse_id, delta, kind, reference in operation:
+                deltas[current[(product_id, warehouse_id)][0]] += delta
+            for key, quantity in after.items():
+                current[key][1] = quantity
+            movements.extend(operation)
+
+        if atomic and any(shortage for shortage, _ in results):
+            transaction.set_rollback(True)
+            return results
+
+        deltas = {stock_id: -delta for stock_id, delta in deltas.items() if delta}
+        if decrement_stock(Stock.objects.all(), 'id', deltas) != len(deltas):
+            raise StockConflict()
+        record_movements(movements)
+    return results
+
+
+def record_movements(rows):
+    """
+    Пишет движения в журнал пачками INSERT и отправляет stock_changed.
+
+    rows — кортежи (product_id, warehouse_id, delta, kind, reference). Вызывается
+    в той же транзакции, что и изменение Stock.quantity.
+    """
+    now = timezone.now()
+    movements = StockMovement.objects.bulk_create(
+        (
+            StockMovement(
+                product_id=product_id, warehouse_id=warehouse_id, delta=delta,
+                kind=kind, reference=reference, created_at=now,
+            )
+            for product_id, warehouse_id, delta, kind, reference in rows
+            if delta
+        ),
+        batch_size=MOVEMENT_BATCH_SIZE,
+    )
+    stock_changed.send(sender=StockMovement, product_ids={m.product_id for m in movements})
+
+
+def stock_as_of(product_id, warehouse_id, moment):
+    """
+    Остаток на момент moment: последний снимок до moment и движения после него.
+
+    Снимки делает compact_stock_ledger, поэтому хвост движений ограничен
+    периодом между компакциями.
+    """
+    snapshot = (
+        StockSnapshot.objects.filter(product_id=product_id, warehouse_id=warehouse_id, taken_at__lte=moment)
+        .order_by('-taken_at')
+        .values_list('quantity', 'last_movement_id')
+        .first()
+    )
+    quantity, last_movement_id = snapshot or (0, 0)
+    tail = StockMovement.objects.filter(
+        product_id=product_id, warehouse_id=warehouse_id,
+        id__gt=last_movement_id, created_at__lte=moment,
+    ).aggregate(total=Sum('delta'))['total']
+    return quantity + (tail or 0)
+
+
+def compact_stock_ledger(cutoff=None):
+    """
+    Создаёт снимки остатков на момент cutoff для пар, у которых были движения
+    после предыдущей компакции. Журнал не изменяется. Если в снимок попало
+    движение с created_at позже cutoff, снимок датируется этим движением.
+
+    Последний снимок каждой пары учитывает все её движения до общей отметки
+    (максимального last_movement_id), поэтому новые остатки считаются одним
+    сгруппированным запросом по движениям после отметки.
+
+    cutoff не позже чем LEDGER_COMPACTION_GRACE назад: id движения выдаётся
+    при INSERT, и ещё не закоммиченное движение с меньшим id оказалось бы
+    ниже отметки и выпало бы из снимков.
+    """
+    safe = timezone.now() - timedelta(seconds=getattr(settings, 'LEDGER_COMPACTION_GRACE', 900))
+    cutoff = min(cutoff, safe) if cutoff else safe
+    last_id = StockMovement.objects.filter(created_at__lte=cutoff).aggregate(last=Max('id'))['last']
+    watermark = StockSnapshot.objects.aggregate(last=Max('last_movement_id'))['last'] or 0
+    if not last_id or last_id <= watermark:
+        return 0
+
+    previous = (
+        StockSnapshot.objects.filter(product_id=OuterRef('product_id'), warehouse_id=OuterRef('warehouse_id'))
+        .order_by('-last_movement_id')
+    )
+    tails = (
+        StockMovement.objects.filter(id__gt=watermark, id__lte=last_id)
+        .values('product_id', 'warehouse_id')
+        .annotate(
+            delta=Sum('delta'),
+            last_created=Max('created_at'),
+            previous=Coalesce(Subquery(previous.values('quantity')[:1]), 0),
+            previous_taken=Subquery(previous.values('taken_at')[:1]),
+        )
+        .values_list('product_id', 'warehouse_id', 'delta', 'last_created', 'previous', 'previous_taken')
+    )
+    # Движение с id до отметки могло получить created_at позже cutoff: снимок датируется
+    # не раньше всех вошедших в него движений, иначе stock_as_of учёл бы их слишком рано
+    snapshots = [
+        StockSnapshot(
+            product_id=product_id, warehouse_id=warehouse_id, quantity=previous_quantity + delta,
+            last_movement_id=last_id, taken_at=max(cutoff, last_created, previous_taken or cutoff),
+        )
+        for product_id, warehouse_id, delta, last_created, previous_quantity, previous_taken in tails.iterator()
+    ]
+    StockSnapshot.objects.bulk_create(snapshots, batch_size=MOVEMENT_BATCH_SIZE)
+    return len(snapshots)
@@ -0,0 +1,202 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.cache import cached_buckets
+from orderApp.models import Order
+from productApp.models import Product, Stock
+from reportApp.models import DailySalesRollup
+from reportApp.rollup import day_bounds
+from warehouseApp.models import Warehouse
+
+ANALYTICS_MAX_DAYS = 366
+ANALYTICS_DEFAULT_DAYS = 30
+# Этапы воронки по порядку; отменённые заказы считаются отдельно
+FUNNEL_STAGES = ('new', 'processing', 'shipped', 'completed')
+
+
+def analytics_range(start=None, end=None):
+    """Границы периода в днях; по умолчанию — последние ANALYTICS_DEFAULT_DAYS дней."""
+    end = end or timezone.localdate()
+    start = start or end - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    if start > end:
+        raise ValueError("start должен быть не позже end")
+    if (end - start).days + 1 > ANALYTICS_MAX_DAYS:
+        raise ValueError(f"Период не может быть длиннее {ANALYTICS_MAX_DAYS} дней")
+    return start, end
+
+
+def compute_day_buckets(days):
+    """
+    Агрегаты за дни: GROUP BY по заказам и чтение витрины DailySalesRollup.
+
+    orders — (склад, статус, число заказов, сумма заказов),
+    items — (склад, товар, количество, выручка) без отменённых заказов.
+    """
+    since, until = day_bounds(min(days), max(days))
+    buckets = {day: {"orders": [], "items": []} for day in days}
+
+    orders = (
+        Order.objects.filter(created_at__gte=since, created_at__lt=until)
+        .annotate(day=TruncDate('created_at'))
+        .order_by()
+        .values_list('day', 'warehouse_id', 'status')
+        .annotate(count=Count('id'), revenue=Sum('total_price'))
+    )
+    for day, warehouse_id, status, count, revenue in orders:
+        if day in buckets:
+            buckets[day]["orders"].append((warehouse_id, status, count, revenue or Decimal(0)))
+
+    # Витрина уже сгруппирована по дню, складу и товару: позиции заказов не читаются
+    items = DailySalesRollup.objects.filter(date__gte=min(days), date__lte=max(days)).values_list(
+        'date', 'warehouse_id', 'product_id', 'quantity', 'revenue',
+    )
+    for day, warehouse_id, product_id, quantity, revenue in items:
+        if day in buckets and (quantity or revenue):
+            buckets[day]["items"].append((warehouse_id, product_id, quantity, revenue))
+    return buckets
+
+
+def day_buckets(start, end):
+    """
+    Агрегаты по дням периода: [(день, корзина)].
+
+    Закрытые дни берутся из кэша и пересчитываются только после изменения
+    заказов этого дня; текущий день считается всегда.
+    """
+    today = timezone.localdate()
+    days = [start + timedelta(days=n) for n in range((end - start).days + 1)]
+    keys = [day.isoformat() for day in days]
+    values = cached_buckets(
+        'analytics',
+        keys,
+        lambda missing: {
+            day.isoformat(): bucket
+            for day, bucket in compute_day_buckets([date.fromisoformat(key) for key in missing]).items()
+        },
+        cacheable=lambda key: key < today.isoformat(),
+    )
+    return list(zip(days, values))
+
+
+def _names(model, ids):
+    return dict(model.objects.filter(id__in=ids).values_list('id', 'name'))
+
+
+def revenue_by_day(start, end):
+    """Выручка без отменённых заказов по дням периода, включая дни без заказов."""
+    rows = []
+    for day, bucket in day_buckets(start, end):
+        orders = [row for row in bucket["orders"] if row[1] != 'cancelled']
+        rows.append({
+            "day": day,
+            "orders": sum(row[2] for row in orders),
+            "quantity": sum(row[2] for row in bucket["items"]),
+            "revenue": sum((row[3] for row in orders), Decimal(0)),
+        })
+    return rows
+
+
+def revenue_by_warehouse(start, end):
+    """Выручка без отменённых заказов по складам."""
+    totals = defaultdict(lambda: {"orders": 0, "quantity": 0, "revenue": Decimal(0)})
+    for _, bucket in day_buckets(start, end):
+        for warehouse_id, status, count, amount in bucket["orders"]:
+            if status != 'cancelled':
+                totals[warehouse_id]["orders"] += count
+                totals[warehouse_id]["revenue"] += amount
+        for warehouse_id, _, quantity, _ in bucket["items"]:
+            totals[warehouse_id]["quantity"] += quantity
+    names = _names(Warehouse, totals)
+    return sorted(
+        ({"warehouse_id": warehouse_id, "warehouse": names.get(warehouse_id), **row}
+         for warehouse_id, row in totals.items()),
+        key=lambda row: row["revenue"], reverse=True,
+    )
+
+
+def _product_totals(buckets, warehouse_id=None):
+    totals = defaultdict(lambda: {"quantity": 0, "revenue": Decimal(0)})
+    for _, bucket in buckets:
+        for item_warehouse_id, product_id, quantity, amount in bucket["items"]:
+            if warehouse_id is not None and item_warehouse_id != warehouse_id:
+                continue
+            totals[product_id]["quantity"] += quantity
+            totals[product_id]["revenue"] += amount
+    return totals
+
+
+def top_products(start, end, limit=10, by='revenue'):
+    """Товары по выручке или количеству за период; limit=None — все товары."""
+    if by not in ('revenue', 'quantity'):
+        raise ValueError(f"Недопустимая сортировка: {by}")
+    totals = _product_totals(day_buckets(start, end))
+    ranked = sorted(totals.items(), key=lambda entry: entry[1][by], reverse=True)[:limit]
+    names = _names(Product, [product_id for product_id, _ in ranked])
+    return [
+        {"product_id": product_id, "product": names.get(product_id), **row}
+        for product_id, row in ranked
+    ]
+
+
+def status_funnel(start, end):
+    """
+    Число заказов периода по статусам и воронка этапов.
+
+    Этап считается пройденным, если заказ находится в нём или дальше;
+    conversion — доля от заказов, дошедших до предыдущего этапа.
+    """
+    statuses = dict.fromkeys(dict(Order.STATUS_CHOICES), 0)
+    for _, bucket in day_buckets(start, end):
+        for _, status, count, _ in bucket["orders"]:
+            statuses[status] += count
+
+    funnel = []
+    previous = None
+    for index, stage in enumerate(FUNNEL_STAGES):
+        reached = sum(statuses[later] for later in FUNNEL_STAGES[index:])
+        # Новые заказы — вход воронки, включая те, что потом отменили
+        if index == 0:
+            reached += statuses['cancelled']
+        funnel.append({
+            "stage": stage,
+            "orders": reached,
+            "conversion": round(reached / previous, 4) if previous else None,
+        })
+        previous = reached
+    return {"statuses": statuses, "funnel": funnel}
+
+
+def stock_turnover(start, end, warehouse_id=None):
+    """
+    Оборачиваемость товаров: продано за период / текущий остаток.
+
+    days_of_supply — на сколько дней хватит остатка при средних продажах периода.
+    """
+    sold = _product_totals(day_buckets(start, end), warehouse_id)
+    stock = Stock.objects.all()
+    if warehouse_id is not None:
+        stock = stock.filter(warehouse_id=warehouse_id)
+    on_hand = dict(stock.order_by().values_list('product_id').annotate(total=Sum('quantity')))
+
+    days = (end - start).days + 1
+    product_ids = set(sold) | set(on_hand)
+    names = _names(Product, product_ids)
+    rows = []
+    for product_id in product_ids:
+        quantity = sold[product_id]["quantity"] if product_id in sold else 0
+        available = on_hand.get(product_id, 0)
+        daily = quantity / days
+        rows.append({
+            "product_id": product_id,
+            "product": names.get(product_id),
+            "sold": quantity,
+            "on_hand": available,
+            "turnover": round(quantity / available, 4) if available else None,
+            "days_of_supply": round(available / daily, 1) if daily else None,
+        })
+    return sorted(rows, key=lambda row: (row["turnover"] is None, -(row["turnover"] or 0), row["product_id"]))
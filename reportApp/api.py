@@ -1,17 +1,127 @@
-from ninja import Router
-from django.http import FileResponse, HttpRequest
-from reportApp.utils import export_filtered_orders_to_xlsx, export_stock_to_xlsx, export_single_order_to_xlsx
+from datetime import date
+from typing import List, Literal, Optional
+
+from ninja import Query, Router
+from ninja.errors import HttpError
+from django.core.files.storage import default_storage
+from django.http import HttpRequest
+from django.shortcuts import get_object_or_404
+from core.executors import PooledFileResponse, run_blocking
+from reportApp import analytics
+from reportApp.models import ReportJob
+from reportApp.schemas import (
+    ReportJobIn, ReportJobOut, RevenueDayOut, RevenueWarehouseOut, ProductSalesOut,
+    StatusFunnelOut, StockTurnoverOut,
+)
+from reportApp.utils import (
+    REPORT_BUILDERS, XLSX_CONTENT_TYPE, enqueue_report,
+    export_filtered_orders, export_stock, export_single_order,
+)
 
 report_router = Router(tags=["Отчеты"])
 
+# xlsx — оформленный отчёт для людей, остальные — плоские выгрузки для BI
+ExportFormat = Literal["xlsx", "csv", "parquet", "arrow"]
+
+
+def report_job_out(job):
+    return ReportJobOut(
+        id=job.id,
+        report=job.report,
+        status=job.status,
+        params=job.params,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        error=job.error,
+        download_url=f"/api/report/jobs/{job.id}/download" if job.status == 'done' else None,
+    )
+
+
 @report_router.get("/orders_report")
-def orders_report(request):
-    return export_filtered_orders_to_xlsx(request)
+async def orders_report(request, fmt: ExportFormat = Query("xlsx", alias="format")):
+    # Сборка отчёта блокирующая: выполняется в ограниченном пуле 'reports'
+    return await run_blocking('reports', export_filtered_orders, request, fmt)
 
 @report_router.get("/stock_report")
-def stock_report(request):
-    return export_stock_to_xlsx(request)
+async def stock_report(request, fmt: ExportFormat = Query("xlsx", alias="format")):
+    return await run_blocking('reports', export_stock, request, fmt)
 
 @report_router.get("/order-report/{order_id}")
-def single_order_report(request: HttpRequest, order_id: int):
-    return export_single_order_to_xlsx(request, order_id)
\ No newline at end of file
+async def single_order_report(request: HttpRequest, order_id: int, fmt: ExportFormat = Query("xlsx", alias="format")):
+    return await run_blocking('reports', export_single_order, request, order_id, fmt)
+
+
+@report_router.post("/jobs", response={202: ReportJobOut})
+def create_report_job(request, data: ReportJobIn):
+    """Ставит отчёт в очередь; для тех же параметров и данных возвращает готовую задачу."""
+    if data.report not in REPORT_BUILDERS:
+        raise HttpError(400, f"Неизвестный отчёт: {data.report}")
+    params = {}
+    if data.report == 'orders':
+        params = {
+            "start": data.start.isoformat() if data.start else None,
+            "end": data.end.isoformat() if data.end else None,
+        }
+    return 202, report_job_out(enqueue_report(data.report, params))
+
+@report_router.get("/jobs/{job_id}", response=ReportJobOut)
+def get_report_job(request, job_id: int):
+    return report_job_out(get_object_or_404(ReportJob, id=job_id))
+
+@report_router.get("/jobs/{job_id}/download")
+def download_report_job(request, job_id: int):
+    job = get_object_or_404(ReportJob, id=job_id)
+    if job.status != 'done':
+        raise HttpError(409, "Отчёт ещё не готов")
+    return PooledFileResponse(
+        default_storage.open(job.artifact.name, 'rb'),
+        as_attachment=True,
+        filename=f"{job.report}_report_{job.id}.xlsx",
+        content_type=XLSX_CONTENT_TYPE,
+        executor='reports',
+    )
+
+
+def analytics_period(start, end):
+    try:
+        return analytics.analytics_range(start, end)
+    except ValueError as e:
+        raise HttpError(400, str(e))
+
+
+# Аналитика считается GROUP BY запросами и кэшируется по дням.
+# Период по умолчанию — последние 30 дней.
+
+@report_router.get("/analytics/revenue_by_day", response=List[RevenueDayOut])
+def revenue_by_day(request, start: Optional[date] = None, end: Optional[date] = None):
+    return analytics.revenue_by_day(*analytics_period(start, end))
+
+@report_router.get("/analytics/revenue_by_warehouse", response=List[RevenueWarehouseOut])
+def revenue_by_warehouse(request, start: Optional[date] = None, end: Optional[date] = None):
+    return analytics.revenue_by_warehouse(*analytics_period(start, end))
+
+@report_router.get("/analytics/revenue_by_product", response=List[ProductSalesOut])
+def revenue_by_product(request, start: Optional[date] = None, end: Optional[date] = None):
+    return analytics.top_products(*analytics_period(start, end), limit=None)
+
+@report_router.get("/analytics/top_products", response=List[ProductSalesOut])
+def top_products(
+    request,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = 10,
+    by: Literal["revenue", "quantity"] = "revenue",
+):
+    if not 1 <= limit <= 100:
+        raise HttpError(400, "limit должен быть от 1 до 100")
+    return analytics.top_products(*analytics_period(start, end), limit=limit, by=by)
+
+@report_router.get("/analytics/status_funnel", response=StatusFunnelOut)
+def status_funnel(request, start: Optional[date] = None, end: Optional[date] = None):
+    return analytics.status_funnel(*analytics_period(start, end))
+
+@report_router.get("/analytics/stock_turnover", response=List[StockTurnoverOut])
+def stock_turnover(
+    request, start: Optional[date] = None, end: Optional[date] = None, warehouse_id: Optional[int] = None,
+):
+    return analytics.stock_turnover(*analytics_period(start, end), warehouse_id=warehouse_id)
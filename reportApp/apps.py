@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ReportappConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'reportApp'
+
+    def ready(self):
+        from reportApp import checks, signals  # noqa: F401
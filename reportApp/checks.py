@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии данных отчётов должны быть общими для всех процессов."""
+    alias = getattr(settings, 'API_CACHE_ALIAS', 'default')
+    if settings.CACHES[alias]['BACKEND'].endswith('.LocMemCache'):
+        return [Warning(
+            "Версии данных отчётов хранятся в кэше процесса: при нескольких воркерах "
+            "фоновые отчёты могут отдать устаревший артефакт.",
+            hint="Задайте общий кэш: CACHE_BACKEND=redis или CACHE_BACKEND=file.",
+            id='reportApp.W001',
+        )]
+    return []
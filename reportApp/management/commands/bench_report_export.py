@@ -0,0 +1,65 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from core.benchmark import benchmark_environment
+from orderApp.models import Order, OrderItem
+from productApp.models import Product
+from reportApp.utils import export_filtered_orders
+from warehouseApp.models import Warehouse
+
+FORMATS = ("xlsx", "csv", "parquet", "arrow")
+
+
+class Command(BaseCommand):
+    help = "Время выгрузки отчёта по заказам в форматах xlsx, csv, parquet и arrow"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--items', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with benchmark_environment():
+            rows = self.seed(options['orders'], options['items'])
+            request = RequestFactory().get('/api/report/orders_report')
+            results = {"rows": rows}
+            for fmt in FORMATS:
+                results[fmt] = self.measure(request, fmt)
+            for fmt in FORMATS[1:]:
+                results[f"speedup_{fmt}"] = round(results["xlsx"]["seconds"] / results[fmt]["seconds"], 1)
+
+        self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+
+    def seed(self, count, items):
+        warehouse = Warehouse.objects.create(name="Бенчмарк", address="—")
+        products = Product.objects.bulk_create(
+            Product(name=f"Товар {i}", product_type="Бенчмарк", price=100) for i in range(50)
+        )
+        orders = Order.objects.bulk_create(
+            (
+                Order(warehouse=warehouse, client_name=f"Клиент {n}", destination_address="—", total_price=100 * items)
+                for n in range(count)
+            ),
+            batch_size=2000,
+        )
+        OrderItem.objects.bulk_create(
+            (
+                OrderItem(order=order, product=products[(n + i) % len(products)], quantity=1, price=100)
+                for n, order in enumerate(orders)
+                for i in range(items)
+            ),
+            batch_size=2000,
+        )
+        return count * items
+
+    def measure(self, request, fmt):
+        started = time.perf_counter()
+        response = export_filtered_orders(request, fmt)
+        size = sum(len(chunk) for chunk in response.streaming_content)
+        response.close()
+        return {
+            "seconds": round(time.perf_counter() - started, 3),
+            "size_mb": round(size / 2 ** 20, 2),
+        }
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from reportApp.models import ReportJob
+from reportApp.utils import requeue_stale_jobs, run_report_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет задачи отчётов из очереди, например оставшиеся после перезапуска сервера; "
+        "задачи, зависшие в running дольше REPORT_JOB_TIMEOUT, возвращаются в очередь"
+    )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Возвращено в очередь зависших задач: {requeued}")
+        done = failed = 0
+        for job_id in ReportJob.objects.filter(status='queued').order_by('id').values_list('id', flat=True):
+            try:
+                run_report_job(job_id)
+                done += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Задача #{job_id}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Выполнено задач: {done}, с ошибкой: {failed}"))
@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from orderApp.models import Order
+from reportApp.rollup import rebuild_rollup, verify_rollup
+
+
+def _in_worker(func, start, end):
+    try:
+        return func(start, end)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Пересобирает витрину DailySalesRollup или проверяет расхождения (--verify) параллельно по периодам"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help="Только найти расхождения с заказами")
+        parser.add_argument('--start', type=parse_date, help="Первый день, по умолчанию — день первого заказа")
+        parser.add_argument('--end', type=parse_date, help="Последний день, по умолчанию — день последнего заказа")
+        parser.add_argument('--partition-days', type=int, default=31)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        bounds = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+        if bounds['first'] is None and not (options['start'] and options['end']):
+            self.stdout.write("Заказов нет")
+            return
+        start = options['start'] or timezone.localdate(bounds['first'])
+        end = options['end'] or timezone.localdate(bounds['last'])
+        if start > end:
+            raise CommandError("--start должен быть не позже --end")
+
+        step = timedelta(days=options['partition_days'])
+        partitions = []
+        while start <= end:
+            partitions.append((start, min(start + step - timedelta(days=1), end)))
+            start += step
+
+        func = verify_rollup if options['verify'] else rebuild_rollup
+        # Периоды не пересекаются, поэтому обрабатываются независимо в своих транзакциях
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(lambda p: _in_worker(func, *p), partitions))
+
+        if options['verify']:
+            self.report_drift([drift for result in results for drift in result])
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Пересобрано строк: {sum(results)} в {len(partitions)} периодах"
+            ))
+
+    def report_drift(self, drifted):
+        for (day, warehouse_id, product_id), stored, expected in drifted:
+            self.stdout.write(
+                f"{day} склад #{warehouse_id} товар #{product_id}: в витрине {stored}, по заказам {expected}"
+            )
+        if drifted:
+            raise CommandError(f"Расхождений: {len(drifted)}, запустите команду без --verify")
+        self.stdout.write(self.style.SUCCESS("Расхождений нет"))
@@ -0,0 +1,70 @@
+# Generated by Django 5.2 on 2026-10-18 02:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollup(apps, schema_editor):
+    OrderItem = apps.get_model('orderApp', 'OrderItem')
+    ReturnItem = apps.get_model('orderApp', 'ReturnItem')
+    DailySalesRollup = apps.get_model('reportApp', 'DailySalesRollup')
+
+    rows = {}
+    sales = (
+        OrderItem.objects.exclude(order__status='cancelled')
+        .annotate(day=TruncDate('order__created_at'))
+        .order_by()
+        .values_list('day', 'order__warehouse_id', 'product_id')
+        .annotate(
+            units=Sum('quantity'),
+            amount=Sum(F('price') * F('quantity'), output_field=models.DecimalField(max_digits=14, decimal_places=2)),
+        )
+    )
+    for day, warehouse_id, product_id, units, amount in sales:
+        rows[(day, warehouse_id, product_id)] = DailySalesRollup(
+            date=day, warehouse_id=warehouse_id, product_id=product_id, quantity=units, revenue=amount,
+        )
+    returned = (
+        ReturnItem.objects.annotate(day=TruncDate('return_obj__order__created_at'))
+        .order_by()
+        .values_list('day', 'return_obj__order__warehouse_id', 'product_id')
+        .annotate(units=Sum('quantity'))
+    )
+    for day, warehouse_id, product_id, units in returned:
+        row = rows.setdefault(
+            (day, warehouse_id, product_id),
+            DailySalesRollup(date=day, warehouse_id=warehouse_id, product_id=product_id),
+        )
+        row.returned_quantity = units
+    DailySalesRollup.objects.bulk_create(rows.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orderApp', '0003_order_list_indexes'),
+        ('productApp', '0005_stockmovement_cancellation_kind'),
+        ('reportApp', '0001_initial'),
+        ('warehouseApp', '0002_alter_warehouse_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('returned_quantity', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='productApp.product')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='warehouseApp.warehouse')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'warehouse', 'product'), name='rollup_date_warehouse_product_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+from django.db import models
+from productApp.models import Product
+from warehouseApp.models import Warehouse
+
+
+class ReportJob(models.Model):
+    """Задача на построение отчёта в фоне; готовый файл хранится как артефакт."""
+    REPORT_CHOICES = [
+        ('orders', 'Заказы'),
+        ('stock', 'Остатки'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готов'),
+        ('failed', 'Ошибка'),
+    ]
+
+    report = models.CharField(max_length=20, choices=REPORT_CHOICES)
+    params = models.JSONField(default=dict, blank=True)
+    # Хеш отчёта, параметров и версии данных: одинаковые запросы получают один файл
+    cache_key = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    artifact = models.FileField(upload_to='reports/', null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['cache_key', 'status'], name='reportjob_key_status_idx'),
+            models.Index(fields=['status', 'id'], name='reportjob_status_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Report job #{self.id} ({self.report}, {self.get_status_display()})"
+
+
+class DailySalesRollup(models.Model):
+    """
+    Продажи за день по складу и товару без отменённых заказов.
+
+    День — дата создания заказа. Поддерживается инкрементально при создании,
+    отмене заказов, возвратах и построчных правках позиций; пересобирается
+    командой rollup_daily_sales.
+    """
+    date = models.DateField()
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    returned_quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'warehouse', 'product'], name='rollup_date_warehouse_product_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Rollup {self.date} warehouse #{self.warehouse_id} product #{self.product_id}"
@@ -0,0 +1,198 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from orderApp.models import Order, OrderItem, Return, ReturnItem
+from reportApp.models import DailySalesRollup
+
+ROLLUP_BATCH_SIZE = 500
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def day_bounds(first, last):
+    """Полуинтервал [начало first, начало дня после last) в текущем часовом поясе."""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(first, time.min), tz),
+        timezone.make_aware(datetime.combine(last + timedelta(days=1), time.min), tz),
+    )
+
+
+def _order_sales(items):
+    return (
+        items.annotate(day=TruncDate('order__created_at'))
+        .order_by()
+        .values_list('day', 'order__warehouse_id', 'product_id')
+        .annotate(units=Sum('quantity'), amount=Sum(F('price') * F('quantity'), output_field=MONEY))
+    )
+
+
+def _returned(return_items):
+    return (
+        return_items.annotate(day=TruncDate('return_obj__order__created_at'))
+        .order_by()
+        .values_list('day', 'return_obj__order__warehouse_id', 'product_id')
+        .annotate(units=Sum('quantity'))
+    )
+
+
+def add_to_rollup(deltas):
+    """
+    Прибавляет к витрине deltas — {(день, склад, товар): (quantity, revenue, returned_quantity)}.
+
+    Отсутствующие строки создаются с нулями, затем на каждую пару (день, склад)
+    выполняется UPDATE ... = ... + CASE product_id ... END пачками по
+    ROLLUP_BATCH_SIZE товаров. Вызывается в транзакции изменения заказов.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    DailySalesRollup.objects.bulk_create(
+        [DailySalesRollup(date=day, warehouse_id=warehouse_id, product_id=product_id)
+         for day, warehouse_id, product_id in deltas],
+        ignore_conflicts=True,
+    )
+
+    groups = defaultdict(list)
+    for (day, warehouse_id, product_id), delta in sorted(deltas.items()):
+        groups[(day, warehouse_id)].append((product_id, delta))
+
+    def case(batch, index, output_field):
+        return Case(
+            *[When(product_id=product_id, then=Value(delta[index])) for product_id, delta in batch],
+            default=Value(0),
+            output_field=output_field,
+        )
+
+    for (day, warehouse_id), lines in groups.items():
+        for start in range(0, len(lines), ROLLUP_BATCH_SIZE):
+            batch = lines[start:start + ROLLUP_BATCH_SIZE]
+            DailySalesRollup.objects.filter(
+                date=day, warehouse_id=warehouse_id, product_id__in=[product_id for product_id, _ in batch],
+            ).update(
+                quantity=F('quantity') + case(batch, 0, models.IntegerField()),
+                revenue=F('revenue') + case(batch, 1, MONEY),
+                returned_quantity=F('returned_quantity') + case(batch, 2, models.IntegerField()),
+            )
+
+
+def record_order_sales(order_ids, sign=1):
+    """Добавляет (sign=1) или вычитает (sign=-1, отмена) продажи заказов."""
+    add_to_rollup({
+        (day, warehouse_id, product_id): (sign * units, sign * amount, 0)
+        for day, warehouse_id, product_id, units, amount
+        in _order_sales(OrderItem.objects.filter(order_id__in=order_ids))
+    })
+
+
+def record_returns(return_ids):
+    add_to_rollup({
+        (day, warehouse_id, product_id): (0, Decimal(0), units)
+        for day, warehouse_id, product_id, units
+        in _returned(ReturnItem.objects.filter(return_obj_id__in=return_ids))
+    })
+
+
+def record_item_change(old, new):
+    """
+    Переносит в витрину построчное изменение позиции заказа (админка, удаление заказа).
+
+    old и new — (order_id, product_id, quantity, price) до и после изменения,
+    None для созданной или удалённой позиции. Позиции отменённых заказов
+    в продажах не учитываются.
+    """
+    lines = [(sign, line) for sign, line in ((-1, old), (1, new)) if line]
+    orders = Order.objects.in_bulk({order_id for _, (order_id, _, _, _) in lines})
+    deltas = defaultdict(lambda: [0, Decimal(0), 0])
+    for sign, (order_id, product_id, quantity, price) in lines:
+        order = orders.get(order_id)
+        if order is None or order.status == 'cancelled':
+            continue
+        delta = deltas[(timezone.localdate(order.created_at), order.warehouse_id, product_id)]
+        delta[0] += sign * quantity
+        delta[1] += sign * quantity * Decimal(price)
+    add_to_rollup({key: tuple(delta) for key, delta in deltas.items()})
+
+
+def record_return_item_change(old, new):
+    """То же для позиции возврата: old и new — (return_id, product_id, quantity) или None."""
+    lines = [(sign, line) for sign, line in ((-1, old), (1, new)) if line]
+    returns = {
+        row['id']: row
+        for row in Return.objects.filter(id__in={return_id for _, (return_id, _, _) in lines}).values(
+            'id', 'order__created_at', 'order__warehouse_id',
+        )
+    }
+    deltas = defaultdict(int)
+    for sign, (return_id, product_id, quantity) in lines:
+        row = returns.get(return_id)
+        if row is not None:
+            deltas[(timezone.localdate(row['order__created_at']), row['order__warehouse_id'], product_id)] += (
+                sign * quantity
+            )
+    add_to_rollup({key: (0, Decimal(0), units) for key, units in deltas.items()})
+
+
+def expected_rollup(start, end):
+    """Витрина за период, посчитанная заново по позициям заказов и возвратам."""
+    since, until = day_bounds(start, end)
+    expected = defaultdict(lambda: [0, Decimal(0), 0])
+    items = OrderItem.objects.filter(
+        order__created_at__gte=since, order__created_at__lt=until,
+    ).exclude(order__status='cancelled')
+    for day, warehouse_id, product_id, units, amount in _order_sales(items):
+        expected[(day, warehouse_id, product_id)][:2] = [units, amount]
+    returned = ReturnItem.objects.filter(
+        return_obj__order__created_at__gte=since, return_obj__order__created_at__lt=until,
+    )
+    for day, warehouse_id, product_id, units in _returned(returned):
+        expected[(day, warehouse_id, product_id)][2] = units
+    return {key: tuple(values) for key, values in expected.items()}
+
+
+def stored_rollup(start, end):
+    return {
+        (day, warehouse_id, product_id): (quantity, revenue, returned)
+        for day, warehouse_id, product_id, quantity, revenue, returned in DailySalesRollup.objects.filter(
+            date__gte=start, date__lte=end,
+        ).values_list('date', 'warehouse_id', 'product_id', 'quantity', 'revenue', 'returned_quantity')
+        # Нулевые строки остаются после полной отмены и равны отсутствующим
+        if quantity or revenue or returned
+    }
+
+
+def rebuild_rollup(start, end):
+    """Пересобирает витрину за период в одной транзакции; возвращает число строк."""
+    with transaction.atomic():
+        # Расчёт внутри транзакции: изменения между ним и записью не теряются
+        expected = expected_rollup(start, end)
+        DailySalesRollup.objects.filter(date__gte=start, date__lte=end).delete()
+        DailySalesRollup.objects.bulk_create(
+            (
+                DailySalesRollup(
+                    date=day, warehouse_id=warehouse_id, product_id=product_id,
+                    quantity=quantity, revenue=revenue, returned_quantity=returned,
+                )
+                for (day, warehouse_id, product_id), (quantity, revenue, returned) in expected.items()
+            ),
+            batch_size=ROLLUP_BATCH_SIZE,
+        )
+    return len(expected)
+
+
+def verify_rollup(start, end):
+    """Расхождения витрины с данными: [(ключ, сохранено, ожидается)]."""
+    expected = expected_rollup(start, end)
+    stored = stored_rollup(start, end)
+    return [
+        (key, stored.get(key), expected.get(key))
+        for key in sorted(set(expected) | set(stored))
+        if stored.get(key) != expected.get(key)
+    ]
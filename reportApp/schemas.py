@@ -0,0 +1,57 @@
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from ninja import Schema
+
+
+class ReportJobIn(Schema):
+    report: str
+    start: Optional[date] = None
+    end: Optional[date] = None
+
+class ReportJobOut(Schema):
+    id: int
+    report: str
+    status: str
+    params: dict
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    error: str = ""
+    download_url: Optional[str] = None
+
+
+class RevenueDayOut(Schema):
+    day: date
+    orders: int
+    quantity: int
+    revenue: float
+
+class RevenueWarehouseOut(Schema):
+    warehouse_id: int
+    warehouse: Optional[str] = None
+    orders: int
+    quantity: int
+    revenue: float
+
+class ProductSalesOut(Schema):
+    product_id: int
+    product: Optional[str] = None
+    quantity: int
+    revenue: float
+
+class FunnelStageOut(Schema):
+    stage: str
+    orders: int
+    conversion: Optional[float] = None
+
+class StatusFunnelOut(Schema):
+    statuses: Dict[str, int]
+    funnel: List[FunnelStageOut]
+
+class StockTurnoverOut(Schema):
+    product_id: int
+    product: Optional[str] = None
+    sold: int
+    on_hand: int
+    turnover: Optional[float] = None
+    days_of_supply: Optional[float] = None
@@ -0,0 +1,127 @@
+from django.db import transaction
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.cache import bump_versions
+from orderApp.models import Order, OrderItem, ReturnItem
+from orderApp.signals import orders_cancelled, orders_changed, orders_placed, returns_registered
+from productApp.models import Product, Stock
+from productApp.signals import stock_changed
+from reportApp.rollup import record_item_change, record_order_sales, record_return_item_change, record_returns
+from warehouseApp.models import Warehouse
+
+# Версии данных отчётов: новая версия даёт новый ключ артефакта
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@receiver(orders_changed)
+def invalidate_orders_report(sender, **kwargs):
+    bump_versions('report', ['orders'])
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+@receiver(stock_changed)
+def invalidate_stock_report(sender, **kwargs):
+    bump_versions('report', ['stock'])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+def invalidate_all_reports(sender, **kwargs):
+    # Названия товаров и складов есть в обоих отчётах
+    bump_versions('report', ['orders', 'stock'])
+
+
+# Версии дней аналитики: изменение заказа пересчитывает только день его создания
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_order_day(sender, instance, **kwargs):
+    bump_versions('analytics', [timezone.localdate(instance.created_at).isoformat()])
+
+
+@receiver(orders_changed)
+def invalidate_changed_order_days(sender, order_ids=None, **kwargs):
+    if order_ids is None:
+        bump_versions('analytics', ['*'])
+        return
+
+    def bump_days():
+        days = (
+            Order.objects.filter(id__in=order_ids)
+            .annotate(day=TruncDate('created_at'))
+            .order_by()
+            .values_list('day', flat=True)
+            .distinct()
+        )
+        bump_versions('analytics', [day.isoformat() for day in days])
+
+    # Дни ищутся после коммита, чтобы не добавлять запрос в транзакцию изменения
+    transaction.on_commit(bump_days)
+
+
+# Витрина продаж по дням обновляется в той же транзакции, что и заказы
+
+
+@receiver(orders_placed)
+def add_placed_sales(sender, order_ids, **kwargs):
+    record_order_sales(order_ids)
+
+
+@receiver(orders_cancelled)
+def subtract_cancelled_sales(sender, order_ids, **kwargs):
+    record_order_sales(order_ids, sign=-1)
+
+
+@receiver(returns_registered)
+def add_returned_quantities(sender, return_ids, **kwargs):
+    record_returns(return_ids)
+
+
+# Построчные изменения позиций (админка, удаление заказа) переносятся разницей
+# старого и нового значения; API создаёт позиции bulk_create и сюда не попадает
+
+
+def _item_line(item):
+    return (item.order_id, item.product_id, item.quantity, item.price)
+
+
+def _return_item_line(item):
+    return (item.return_obj_id, item.product_id, item.quantity)
+
+
+@receiver(pre_save, sender=OrderItem)
+@receiver(pre_save, sender=ReturnItem)
+def remember_rollup_line(sender, instance, **kwargs):
+    line = _item_line if sender is OrderItem else _return_item_line
+    old = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._rollup_old_line = line(old) if old else None
+
+
+@receiver(post_save, sender=OrderItem)
+def update_rollup_item(sender, instance, **kwargs):
+    record_item_change(getattr(instance, '_rollup_old_line', None), _item_line(instance))
+
+
+@receiver(post_delete, sender=OrderItem)
+def remove_rollup_item(sender, instance, **kwargs):
+    record_item_change(_item_line(instance), None)
+
+
+@receiver(post_save, sender=ReturnItem)
+def update_rollup_return_item(sender, instance, **kwargs):
+    record_return_item_change(getattr(instance, '_rollup_old_line', None), _return_item_line(instance))
+
+
+@receiver(post_delete, sender=ReturnItem)
+def remove_rollup_return_item(sender, instance, **kwargs):
+    record_return_item_change(_return_item_line(instance), None)
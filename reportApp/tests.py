@@ -0,0 +1,411 @@
+import csv
+import io
+import shutil
+import tempfile
+import threading
+import warnings
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+import openpyxl
+import pyarrow as pa
+import pyarrow.parquet as pq
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from orderApp.models import Order, OrderItem, Return, ReturnItem
+from orderApp.utils import register_returns, transition_orders
+from productApp.models import Product, Stock
+from reportApp.models import DailySalesRollup, ReportJob
+from reportApp.rollup import rebuild_rollup, verify_rollup
+from reportApp import utils as report_utils
+from reportApp.utils import XLSX_CONTENT_TYPE, report_cache_key
+from warehouseApp.models import Warehouse
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, REPORT_JOBS_ASYNC=False)
+class ReportJobTests(TestCase):
+    url = '/api/report/jobs'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Склад", address="Адрес")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукт", price=10)
+        Stock.objects.create(product=cls.apple, warehouse=cls.warehouse, quantity=5)
+
+    def enqueue(self, payload):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, payload, content_type='application/json')
+
+    def test_job_builds_downloadable_artifact(self):
+        response = self.enqueue({"report": "stock"})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'queued')
+
+        job = self.client.get(f"{self.url}/{response.json()['id']}").json()
+        self.assertEqual(job['status'], 'done')
+
+        download = self.client.get(job['download_url'])
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'PK'))
+
+    def test_same_request_reuses_artifact(self):
+        first = self.enqueue({"report": "orders", "start": "2024-01-01"}).json()
+        second = self.enqueue({"report": "orders", "start": "2024-01-01"}).json()
+        self.assertEqual(first['id'], second['id'])
+        self.assertEqual(second['status'], 'done')
+        self.assertEqual(ReportJob.objects.count(), 1)
+
+    def test_data_change_creates_new_job(self):
+        first = self.enqueue({"report": "stock"}).json()
+        with self.captureOnCommitCallbacks(execute=True):
+            Stock.objects.filter(product=self.apple).update(quantity=7)
+            Stock.objects.get(product=self.apple).save()
+        second = self.enqueue({"report": "stock"}).json()
+        self.assertNotEqual(first['id'], second['id'])
+
+    @override_settings(REPORT_JOB_TIMEOUT=60)
+    def test_stale_running_job_is_not_reused_and_requeued(self):
+        cache_key = report_cache_key('stock', {})
+        running = ReportJob.objects.create(
+            report='stock', params={}, cache_key=cache_key, status='running', started_at=timezone.now(),
+        )
+        self.assertEqual(self.enqueue({"report": "stock"}).json()['id'], running.id)
+
+        stale = timezone.now() - timedelta(minutes=5)
+        ReportJob.objects.filter(id=running.id).update(started_at=stale)
+        fresh = self.enqueue({"report": "stock"}).json()
+        self.assertNotEqual(fresh['id'], running.id)
+
+        out = io.StringIO()
+        call_command('process_report_jobs', stdout=out)
+        self.assertIn("зависших задач: 1", out.getvalue())
+        running.refresh_from_db()
+        self.assertEqual(running.status, 'done')
+
+    def test_download_before_done_conflicts(self):
+        job = ReportJob.objects.create(report='stock', params={}, cache_key='x' * 64)
+        response = self.client.get(f"{self.url}/{job.id}/download")
+        self.assertEqual(response.status_code, 409)
+
+    def test_unknown_report_rejected(self):
+        response = self.enqueue({"report": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+
+# Отчёты собираются в пуле 'reports' на отдельном соединении, поэтому данные должны быть закоммичены
+class ExportFormatTests(TransactionTestCase):
+    def setUp(self):
+        self.warehouse = Warehouse.objects.create(name="Склад", address="Адрес")
+        self.apple = Product.objects.create(name="Яблоко", product_type="Фрукт", price=10)
+        Stock.objects.create(product=self.apple, warehouse=self.warehouse, quantity=5)
+        self.order = Order.objects.create(
+            warehouse=self.warehouse, client_name="Иван", destination_address="Адрес", total_price=30,
+        )
+        OrderItem.objects.create(order=self.order, product=self.apple, quantity=3, price=10)
+
+    def test_orders_csv_is_streamed(self):
+        response = self.client.get('/api/report/orders_report?format=csv')
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['product'], "Яблоко")
+        self.assertEqual(rows[0]['item_total'], "30.00")
+
+    def test_orders_parquet_keeps_types(self):
+        response = self.client.get('/api/report/orders_report?format=parquet')
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.num_rows, 1)
+        self.assertEqual(table.schema.field('quantity').type, pa.int64())
+        self.assertEqual(table.column('order_id').to_pylist(), [self.order.id])
+
+    def test_stock_arrow(self):
+        response = self.client.get('/api/report/stock_report?format=arrow')
+        table = pa.ipc.open_file(pa.BufferReader(b''.join(response.streaming_content))).read_all()
+        self.assertEqual(table.to_pylist(), [{"warehouse": "Склад", "product": "Яблоко", "quantity": 5}])
+
+    def test_single_order_csv(self):
+        response = self.client.get(f'/api/report/order-report/{self.order.id}?format=csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+
+    def test_orders_xlsx_has_daily_summary(self):
+        rebuild_rollup(timezone.localdate(), timezone.localdate())
+        response = self.client.get('/api/report/orders_report')
+        workbook = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        summary = list(workbook["Продажи по дням"].values)
+        self.assertEqual(summary[1][1:], (3, 30, 0))
+
+    def load_xlsx(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        return openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_orders_xlsx_headers_and_rows(self):
+        pear = Product.objects.create(name="Груша", product_type="Фрукт", price=20)
+        OrderItem.objects.create(order=self.order, product=pear, quantity=2, price=20)
+        rows = list(self.load_xlsx('/api/report/orders_report')["Заказы"].values)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(len(rows[0]), 13)
+        self.assertEqual(rows[0][:2], ("ID заказа", "Статус"))
+        self.assertEqual(rows[0][-1], "Итоговая сумма заказа")
+        self.assertEqual([(row[0], row[8], row[9], row[11]) for row in rows[1:]], [
+            (self.order.id, "Яблоко", 3, 30), (self.order.id, "Груша", 2, 40),
+        ])
+
+        rows = list(self.load_xlsx('/api/report/orders_report?start=2000-01-01&end=2000-01-31')["Заказы"].values)
+        self.assertEqual(len(rows), 1)
+
+    def test_stock_xlsx_headers_and_rows(self):
+        spare = Warehouse.objects.create(name="Запасной", address="Адрес")
+        Stock.objects.create(product=self.apple, warehouse=spare, quantity=2)
+        rows = list(self.load_xlsx('/api/report/stock_report')["Остатки товаров"].values)
+        self.assertEqual(rows, [
+            ("Склад", "Продукт", "Остаток"),
+            ("Запасной", "Яблоко", 2),
+            ("Склад", "Яблоко", 5),
+        ])
+
+    async def asgi_get(self, path, query):
+        # Напрямую через ASGIHandler: тестовый клиент не читает поток так, как сервер
+        communicator = ApplicationCommunicator(ASGIHandler(), {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'query_string': query.encode(), 'headers': [],
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+        })
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(10)
+        body = b''
+        while True:
+            message = await communicator.receive_output(10)
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return start['status'], body
+
+    async def test_asgi_streams_exports_through_reports_pool(self):
+        threads = []
+        chunks = report_utils._chunks
+
+        def recorded_chunks(rows, *args):
+            threads.append(threading.current_thread().name)
+            return chunks(rows, *args)
+
+        with warnings.catch_warnings(record=True) as caught, \
+                mock.patch.object(report_utils, '_chunks', recorded_chunks):
+            warnings.simplefilter('always')
+            status, body = await self.asgi_get('/api/report/orders_report', 'format=csv')
+            self.assertEqual(status, 200)
+            self.assertEqual(len(body.decode().splitlines()), 2)
+            status, body = await self.asgi_get('/api/report/stock_report', 'format=xlsx')
+            self.assertEqual(status, 200)
+            self.assertEqual(len(list(openpyxl.load_workbook(io.BytesIO(body))["Остатки товаров"].values)), 2)
+
+        self.assertEqual([str(w.message) for w in caught if 'synchronous iterators' in str(w.message)], [])
+        self.assertTrue(threads and all(name.startswith('reports') for name in threads), threads)
+
+    def test_unknown_format_rejected(self):
+        response = self.client.get('/api/report/stock_report?format=pdf')
+        self.assertEqual(response.status_code, 422)
+
+
+class AnalyticsTests(TestCase):
+    url = '/api/report/analytics'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Склад", address="Адрес")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукт", price=10)
+        cls.pear = Product.objects.create(name="Груша", product_type="Фрукт", price=20)
+        Stock.objects.create(product=cls.apple, warehouse=cls.warehouse, quantity=10)
+        Stock.objects.create(product=cls.pear, warehouse=cls.warehouse, quantity=0)
+
+        cls.day1 = datetime(2024, 3, 1, 12, tzinfo=dt_timezone.utc)
+        cls.day2 = cls.day1 + timedelta(days=2)
+        cls.first = cls.create_order(cls.day1, [(cls.apple, 3, 10), (cls.pear, 1, 20)])
+        cls.second = cls.create_order(cls.day1, [(cls.apple, 2, 10)])
+        cls.cancelled = cls.create_order(cls.day2, [(cls.pear, 5, 20)], status='cancelled')
+        rebuild_rollup(cls.day1.date(), cls.day2.date())
+
+    @classmethod
+    def create_order(cls, created_at, items, status='new'):
+        order = Order.objects.create(
+            warehouse=cls.warehouse, client_name="Клиент", destination_address="Адрес", status=status,
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=quantity, price=price)
+            for product, quantity, price in items
+        )
+        Order.objects.filter(id=order.id).update(
+            created_at=created_at, total_price=sum(quantity * price for _, quantity, price in items),
+        )
+        return order
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, path, **params):
+        params = {"start": "2024-03-01", "end": "2024-03-03", **params}
+        response = self.client.get(f"{self.url}/{path}", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_revenue_by_day_excludes_cancelled(self):
+        rows = self.get('revenue_by_day')
+        self.assertEqual(
+            [(row['day'], row['orders'], row['quantity'], row['revenue']) for row in rows],
+            [("2024-03-01", 2, 6, 70.0), ("2024-03-02", 0, 0, 0.0), ("2024-03-03", 0, 0, 0.0)],
+        )
+
+    def test_revenue_by_warehouse(self):
+        rows = self.get('revenue_by_warehouse')
+        self.assertEqual(rows, [{
+            "warehouse_id": self.warehouse.id, "warehouse": "Склад", "orders": 2, "quantity": 6, "revenue": 70.0,
+        }])
+
+    def test_top_products(self):
+        rows = self.get('top_products', by='quantity', limit=1)
+        self.assertEqual(rows, [{"product_id": self.apple.id, "product": "Яблоко", "quantity": 5, "revenue": 50.0}])
+
+    def test_status_funnel(self):
+        data = self.get('status_funnel')
+        self.assertEqual(data['statuses']['new'], 2)
+        self.assertEqual(data['statuses']['cancelled'], 1)
+        self.assertEqual(data['funnel'][0], {"stage": "new", "orders": 3, "conversion": None})
+        self.assertEqual(data['funnel'][1], {"stage": "processing", "orders": 0, "conversion": 0.0})
+
+    def test_stock_turnover(self):
+        rows = {row['product_id']: row for row in self.get('stock_turnover')}
+        self.assertEqual(rows[self.apple.id]['turnover'], 0.5)
+        self.assertEqual(rows[self.apple.id]['days_of_supply'], 6.0)
+        self.assertIsNone(rows[self.pear.id]['turnover'])
+
+    def test_closed_days_are_served_from_cache(self):
+        self.get('revenue_by_day')
+        with self.assertNumQueries(0):
+            self.get('revenue_by_day')
+
+    def test_order_change_recomputes_its_day(self):
+        self.get('revenue_by_day')
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_orders([self.second.id], 'processing')
+        rows = self.get('revenue_by_day')
+        self.assertEqual(rows[0]['orders'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_orders([self.second.id], 'cancelled', reason="Тест")
+        rows = self.get('revenue_by_day')
+        self.assertEqual((rows[0]['orders'], rows[0]['revenue']), (1, 50.0))
+
+    def test_invalid_period_rejected(self):
+        response = self.client.get(f"{self.url}/revenue_by_day", {"start": "2024-03-05", "end": "2024-03-01"})
+        self.assertEqual(response.status_code, 400)
+
+
+class DailySalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name="Склад", address="Адрес")
+        cls.apple = Product.objects.create(name="Яблоко", product_type="Фрукт", price=10)
+        cls.pear = Product.objects.create(name="Груша", product_type="Фрукт", price=12)
+        Stock.objects.create(product=cls.apple, warehouse=cls.warehouse, quantity=10)
+        Stock.objects.create(product=cls.pear, warehouse=cls.warehouse, quantity=10)
+
+    def create_order(self, *items):
+        response = self.client.post('/api/orders/order_create', {
+            "warehouse_id": self.warehouse.id,
+            "client_name": "Иванов",
+            "destination_address": "ул. Мира, 2",
+            "items": [{"product_id": p.id, "quantity": q} for p, q in items],
+        }, content_type='application/json')
+        return Order.objects.get(id=response.json()['id'])
+
+    def rollup(self):
+        return {
+            product_id: (quantity, float(revenue), returned)
+            for product_id, quantity, revenue, returned in DailySalesRollup.objects.values_list(
+                'product_id', 'quantity', 'revenue', 'returned_quantity',
+            )
+        }
+
+    def test_follows_orders_cancellations_and_returns(self):
+        first = self.create_order((self.apple, 2), (self.pear, 1))
+        second = self.create_order((self.apple, 3))
+        self.assertEqual(self.rollup(), {self.apple.id: (5, 50.0, 0), self.pear.id: (1, 12.0, 0)})
+
+        with transaction.atomic():
+            transition_orders([second.id], 'cancelled', reason="Отмена")
+        self.assertEqual(self.rollup()[self.apple.id], (2, 20.0, 0))
+
+        Order.objects.filter(id=first.id).update(status='completed')
+        with transaction.atomic():
+            register_returns([(first.id, "Брак", [(self.apple.id, 1)])])
+        self.assertEqual(self.rollup()[self.apple.id], (2, 20.0, 1))
+
+        today = timezone.localdate()
+        self.assertEqual(verify_rollup(today, today), [])
+
+    def test_follows_row_edits_and_deletes(self):
+        # Так заказы, позиции и возвраты меняет админка: построчным save() и delete()
+        today = timezone.localdate()
+        order = Order.objects.create(
+            warehouse=self.warehouse, client_name="Иванов", destination_address="—", status='completed',
+        )
+        item = OrderItem.objects.create(order=order, product=self.apple, quantity=2, price=10)
+        OrderItem.objects.create(order=order, product=self.pear, quantity=1, price=12)
+        self.assertEqual(self.rollup(), {self.apple.id: (2, 20.0, 0), self.pear.id: (1, 12.0, 0)})
+
+        item.quantity, item.product = 4, self.pear
+        item.save()
+        self.assertEqual(self.rollup(), {self.apple.id: (0, 0.0, 0), self.pear.id: (5, 52.0, 0)})
+
+        return_obj = Return.objects.create(order=order)
+        return_item = ReturnItem.objects.create(return_obj=return_obj, product=self.pear, quantity=1)
+        return_item.quantity = 3
+        return_item.save()
+        self.assertEqual(self.rollup()[self.pear.id], (5, 52.0, 3))
+        self.assertEqual(verify_rollup(today, today), [])
+
+        order.delete()
+        self.assertEqual(set(self.rollup().values()), {(0, 0.0, 0)})
+        self.assertEqual(verify_rollup(today, today), [])
+
+    def test_rebuild_fixes_drift(self):
+        self.create_order((self.apple, 2))
+        DailySalesRollup.objects.update(quantity=7)
+        today = timezone.localdate()
+        self.assertEqual(len(verify_rollup(today, today)), 1)
+
+        self.assertEqual(rebuild_rollup(today, today), 1)
+        self.assertEqual(verify_rollup(today, today), [])
+        self.assertEqual(self.rollup(), {self.apple.id: (2, 20.0, 0)})
+
+
+# Команда обрабатывает периоды в отдельных потоках со своими соединениями.
+# Тестовая SQLite в памяти не ждёт блокировок, поэтому здесь один поток
+class RollupCommandTests(TransactionTestCase):
+    def test_verify_and_rebuild_by_partitions(self):
+        warehouse = Warehouse.objects.create(name="Склад", address="Адрес")
+        apple = Product.objects.create(name="Яблоко", product_type="Фрукт", price=10)
+        for days_ago in (0, 40, 80):
+            order = Order.objects.create(warehouse=warehouse, client_name="Иванов", destination_address="—")
+            OrderItem.objects.bulk_create([OrderItem(order=order, product=apple, quantity=1, price=10)])
+            Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(days=days_ago))
+
+        with self.assertRaises(CommandError):
+            call_command('rollup_daily_sales', '--verify', stdout=io.StringIO())
+
+        out = io.StringIO()
+        call_command('rollup_daily_sales', '--partition-days', '30', '--workers', '1', stdout=out)
+        self.assertIn("Пересобрано строк: 3", out.getvalue())
+        call_command('rollup_daily_sales', '--verify', stdout=out)
+        self.assertIn("Расхождений нет", out.getvalue())
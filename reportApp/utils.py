@@ -1,120 +1,201 @@
-from datetime import datetime
+import csv
+import hashlib
+import json
+import tempfile
+from datetime import datetime, timedelta
 from io import BytesIO
 
 import openpyxl
 import qrcode
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
 from django.utils.dateparse import parse_date
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
 from django.http import HttpResponse
+from core.cache import get_versions
+from core.executors import PooledFileResponse, PooledStreamingHttpResponse, get_executor
 from orderApp.models import Order, OrderItem
 from productApp.models import Stock
+from reportApp.models import DailySalesRollup, ReportJob
 from openpyxl.drawing.image import Image as OpenpyxlImage
 
 
-def export_filtered_orders_to_xlsx(request):
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Увеличивается при изменении формата отчётов, чтобы не отдавать старые артефакты
+REPORT_FORMAT_VERSION = 1
+EXPORT_CHUNK_SIZE = 2000
+WIDTH_SAMPLE_SIZE = 500
+
+STATUS_COLORS = {
+    "new": "FFFACD",
+    "processing": "ADD8E6",
+    "shipped": "87CEEB",
+    "completed": "90EE90",
+    "cancelled": "FFC0CB",
+}
+
+
+def _header_row(sheet, headers):
+    bold = Font(bold=True)
+    row = []
+    for header in headers:
+        cell = WriteOnlyCell(sheet, value=header)
+        cell.font = bold
+        row.append(cell)
+    return row
+
+
+def _set_widths_from_sample(sheet, headers, sample_rows):
+    # Ширина колонок считается по выборке, а не по всем строкам
+    for idx, header in enumerate(headers, start=1):
+        max_len = max([len(str(header))] + [len(str(row[idx - 1] or "")) for row in sample_rows])
+        sheet.column_dimensions[get_column_letter(idx)].width = max_len + 2
+
+
+def _stream_workbook(workbook, filename):
+    """
+    Сохраняет write-only книгу во временный файл и отдаёт его потоком.
+
+    Строки write-only книги уже лежат на диске, поэтому память не растёт
+    с размером отчёта.
+    """
+    tmp = tempfile.TemporaryFile()
+    workbook.save(tmp)
+    tmp.seek(0)
+    return PooledFileResponse(
+        tmp, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE, executor='reports',
+    )
+
+
+def report_dates(request):
     start_raw = request.GET.get("start")
     end_raw = request.GET.get("end")
+    return (parse_date(start_raw) if start_raw else None, parse_date(end_raw) if end_raw else None)
 
-    start = parse_date(start_raw) if start_raw else None
-    end = parse_date(end_raw) if end_raw else None
 
-    orders = Order.objects.prefetch_related('items__product').select_related('warehouse')
+def filtered_order_rows(start=None, end=None, order_id=None):
+    items = OrderItem.objects.all()
+    if order_id is not None:
+        items = items.filter(order_id=order_id)
     if start:
-        orders = orders.filter(created_at__date__gte=start)
+        items = items.filter(order__created_at__date__gte=start)
     if end:
-        orders = orders.filter(created_at__date__lte=end)
+        items = items.filter(order__created_at__date__lte=end)
+
+    # Итог заказа берётся из денормализованного Order.total_price
+    return items.order_by("order_id", "id").values_list(
+        "order_id", "order__status", "order__warehouse__name", "order__created_at",
+        "order__client_name", "order__destination_address", "order__comment",
+        "order__cancellation_reason", "product__name", "quantity", "price", "order__total_price",
+    )
+
+
+def _order_row(row):
+    (order_id, status, warehouse_name, created_at, client_name, address,
+     comment, cancellation_reason, product_name, quantity, price, order_total) = row
+    return [
+        order_id,
+        status,
+        warehouse_name or "—",
+        created_at.strftime("%Y-%m-%d %H:%M"),
+        client_name,
+        address,
+        comment,
+        cancellation_reason,
+        product_name,
+        quantity,
+        float(price),
+        float(price) * quantity,
+        float(order_total or 0),
+    ]
+
 
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Заказы"
+def build_orders_workbook(start=None, end=None):
+    rows = filtered_order_rows(start, end)
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Заказы")
 
     headers = [
         "ID заказа", "Статус", "Склад", "Дата создания",
         "Клиент", "Адрес", "Комментарий", "Причина отмены",
         "Продукт", "Количество", "Цена за единицу", "Сумма по товару", "Итоговая сумма заказа"
     ]
-    sheet.append(headers)
-
-    for cell in sheet[1]:
-        cell.font = Font(bold=True)
+    _set_widths_from_sample(sheet, headers, [_order_row(row) for row in rows[:WIDTH_SAMPLE_SIZE]])
+    sheet.append(_header_row(sheet, headers))
 
-    status_colors = {
-        "new": "FFFACD",
-        "processing": "ADD8E6",
-        "shipped": "87CEEB",
-        "completed": "90EE90",
-        "cancelled": "FFC0CB",
+    # Цветовая заливка по статусу: один объект стиля на статус
+    status_fills = {
+        status: PatternFill(start_color=color, end_color=color, fill_type="solid")
+        for status, color in STATUS_COLORS.items()
     }
 
-    for order in orders:
-        for item in order.items.all():
-            sheet.append([
-                order.id,
-                order.status,
-                order.warehouse.name if order.warehouse else "—",
-                order.created_at.strftime("%Y-%m-%d %H:%M"),
-                order.client_name,
-                order.destination_address,
-                order.comment,
-                order.cancellation_reason,
-                item.product.name,
-                item.quantity,
-                float(item.price),
-                float(item.price) * item.quantity,
-                float(order.total_price)
-            ])
-
-            # Цветовая заливка по статусу
-            row_num = sheet.max_row
-            status_cell = sheet.cell(row=row_num, column=2)
-            fill_color = status_colors.get(order.status)
-            if fill_color:
-                status_cell.fill = PatternFill(start_color=fill_color, end_color=fill_color, fill_type="solid")
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        values = _order_row(row)
+        status_cell = WriteOnlyCell(sheet, value=values[1])
+        fill = status_fills.get(values[1])
+        if fill:
+            status_cell.fill = fill
+        values[1] = status_cell
+        sheet.append(values)
 
-    # Автоширина
-    for col in sheet.columns:
-        max_len = max(len(str(cell.value or "")) for cell in col)
-        sheet.column_dimensions[col[0].column_letter].width = max_len + 2
+    _append_daily_summary(workbook, start, end)
+    return workbook
 
-    response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    response["Content-Disposition"] = f"attachment; filename=orders_report_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx"
-    workbook.save(response)
-    return response
 
+def _append_daily_summary(workbook, start=None, end=None):
+    # Итоги по дням читаются из витрины: O(дней), а не O(позиций)
+    rollup = DailySalesRollup.objects.all()
+    if start:
+        rollup = rollup.filter(date__gte=start)
+    if end:
+        rollup = rollup.filter(date__lte=end)
+    days = (
+        rollup.order_by('date')
+        .values_list('date')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'), returned=Sum('returned_quantity'))
+    )
 
+    sheet = workbook.create_sheet("Продажи по дням")
+    headers = ["Дата", "Продано, шт. (без отмен)", "Выручка", "Возвращено, шт."]
+    for idx, header in enumerate(headers, start=1):
+        sheet.column_dimensions[get_column_letter(idx)].width = len(header) + 2
+    sheet.append(_header_row(sheet, headers))
+    for day, quantity, revenue, returned in days:
+        sheet.append([day.isoformat(), quantity, float(revenue), returned])
 
-def export_stock_to_xlsx(request):
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Остатки товаров"
+
+def export_filtered_orders_to_xlsx(request):
+    workbook = build_orders_workbook(*report_dates(request))
+    return _stream_workbook(workbook, f"orders_report_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx")
+
+
+def build_stock_workbook():
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Остатки товаров")
 
     headers = ["Склад", "Продукт", "Остаток"]
-    sheet.append(headers)
 
-    for cell in sheet[1]:
-        cell.font = Font(bold=True)
+    stocks = Stock.objects.order_by("warehouse__name", "product__name").values_list(
+        "warehouse__name", "product__name", "quantity"
+    )
+    _set_widths_from_sample(sheet, headers, list(stocks[:WIDTH_SAMPLE_SIZE]))
+    sheet.append(_header_row(sheet, headers))
 
-    stocks = Stock.objects.select_related("warehouse", "product").order_by("warehouse__name", "product__name")
+    for row in stocks.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        sheet.append(row)
 
-    for stock in stocks:
-        sheet.append([
-            stock.warehouse.name,
-            stock.product.name,
-            stock.quantity
-        ])
+    return workbook
 
-    for col in sheet.columns:
-        max_length = max(len(str(cell.value or "")) for cell in col)
-        col_letter = col[0].column_letter
-        sheet.column_dimensions[col_letter].width = max_length + 2
 
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    filename = f"stock_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    response["Content-Disposition"] = f"attachment; filename={filename}"
-    workbook.save(response)
-    return response
+def export_stock_to_xlsx(request):
+    return _stream_workbook(build_stock_workbook(), f"stock_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
 
 
 def export_single_order_to_xlsx(request, order_id: int):
@@ -179,3 +260,225 @@ def export_single_order_to_xlsx(request, order_id: int):
     response["Content-Disposition"] = f"attachment; filename=order_{order.id}_report.xlsx"
     wb.save(response)
     return response
+
+
+# Плоские форматы для выгрузки в BI: без стилей, колонки с машинными именами.
+# Тип колонки нужен только для Arrow/Parquet.
+ORDER_EXPORT_COLUMNS = [
+    ("order_id", "int64"), ("status", "string"), ("warehouse", "string"), ("created_at", "timestamp"),
+    ("client_name", "string"), ("destination_address", "string"), ("comment", "string"),
+    ("cancellation_reason", "string"), ("product", "string"), ("quantity", "int64"),
+    ("price", "money"), ("item_total", "money"), ("order_total", "money"),
+]
+STOCK_EXPORT_COLUMNS = [("warehouse", "string"), ("product", "string"), ("quantity", "int64")]
+
+FLAT_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+
+def _flat_order_rows(rows):
+    # Сумма по позиции вставляется перед итогом заказа
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield row[:11] + (row[10] * row[9], row[11])
+
+
+def _chunks(rows, size=EXPORT_CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def _stream_csv(columns, rows, filename):
+    writer = csv.writer(_Echo())
+
+    def generate():
+        yield writer.writerow([name for name, _ in columns])
+        for chunk in _chunks(rows):
+            # Одна отправка на пачку строк, а не на каждую строку
+            yield "".join(writer.writerow(row) for row in chunk)
+
+    # Строки читаются из базы во время отправки, в пуле 'reports'
+    response = PooledStreamingHttpResponse(generate(), content_type=FLAT_CONTENT_TYPES["csv"], executor='reports')
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _arrow_schema(columns):
+    import pyarrow as pa
+
+    types = {
+        "int64": pa.int64(),
+        "string": pa.string(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "money": pa.decimal128(14, 2),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _stream_columnar(fmt, columns, rows, filename):
+    """
+    Пишет строки пачками в Parquet или Arrow IPC и отдаёт файл потоком.
+
+    Каждая пачка из values_list перекладывается по колонкам и становится
+    отдельной record batch, поэтому в памяти не бывает больше одной пачки.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(columns)
+    tmp = tempfile.TemporaryFile()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(tmp, schema)
+    else:
+        writer = pa.ipc.new_file(tmp, schema)
+    with writer:
+        for chunk in _chunks(rows):
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)],
+                schema=schema,
+            )
+            writer.write_batch(batch)
+    tmp.seek(0)
+    return PooledFileResponse(
+        tmp, as_attachment=True, filename=filename, content_type=FLAT_CONTENT_TYPES[fmt], executor='reports',
+    )
+
+
+def _export_flat(fmt, columns, rows, name):
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    if fmt == "csv":
+        return _stream_csv(columns, rows, filename)
+    return _stream_columnar(fmt, columns, rows, filename)
+
+
+def export_filtered_orders(request, fmt="xlsx"):
+    if fmt == "xlsx":
+        return export_filtered_orders_to_xlsx(request)
+    rows = _flat_order_rows(filtered_order_rows(*report_dates(request)))
+    return _export_flat(fmt, ORDER_EXPORT_COLUMNS, rows, "orders_report")
+
+
+def export_stock(request, fmt="xlsx"):
+    if fmt == "xlsx":
+        return export_stock_to_xlsx(request)
+    rows = (
+        Stock.objects.order_by("warehouse__name", "product__name")
+        .values_list("warehouse__name", "product__name", "quantity")
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    return _export_flat(fmt, STOCK_EXPORT_COLUMNS, rows, "stock_report")
+
+
+def export_single_order(request, order_id, fmt="xlsx"):
+    if fmt == "xlsx":
+        return export_single_order_to_xlsx(request, order_id)
+    rows = _flat_order_rows(filtered_order_rows(order_id=order_id))
+    return _export_flat(fmt, ORDER_EXPORT_COLUMNS, rows, f"order_{order_id}_report")
+
+
+REPORT_BUILDERS = {
+    "orders": lambda params: build_orders_workbook(
+        parse_date(params["start"]) if params.get("start") else None,
+        parse_date(params["end"]) if params.get("end") else None,
+    ),
+    "stock": lambda params: build_stock_workbook(),
+}
+
+
+def report_cache_key(report, params):
+    """
+    Ключ артефакта: отчёт, параметры и текущая версия данных отчёта.
+
+    Версии живут в кэше, поэтому при нескольких процессах нужен общий кэш
+    (CACHE_BACKEND=redis или file): в locmem процесс, не видевший изменения,
+    отдал бы устаревший артефакт. См. проверку reportApp.W001.
+    """
+    version, = get_versions([('report', report)])
+    raw = f"{REPORT_FORMAT_VERSION}|{report}|{json.dumps(params, sort_keys=True)}|{version}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def stale_cutoff():
+    """Задача в статусе running, начатая раньше этого момента, считается брошенной."""
+    return timezone.now() - timedelta(seconds=getattr(settings, 'REPORT_JOB_TIMEOUT', 1800))
+
+
+def requeue_stale_jobs():
+    """Возвращает в очередь задачи, исполнитель которых завис или умер; возвращает их число."""
+    return ReportJob.objects.filter(status='running', started_at__lt=stale_cutoff()).update(
+        status='queued', started_at=None,
+    )
+
+
+def enqueue_report(report, params):
+    """
+    Ставит отчёт в очередь или возвращает уже существующую задачу.
+
+    Если для тех же параметров и той же версии данных отчёт уже построен
+    или строится, новая задача не создаётся. Брошенная задача (running
+    дольше REPORT_JOB_TIMEOUT) не переиспользуется.
+    """
+    cache_key = report_cache_key(report, params)
+    existing = (
+        ReportJob.objects.filter(cache_key=cache_key)
+        .filter(Q(status__in=('queued', 'done')) | Q(status='running', started_at__gte=stale_cutoff()))
+        .order_by('-id')
+        .first()
+    )
+    if existing and (existing.status != 'done' or default_storage.exists(existing.artifact.name)):
+        return existing
+
+    job = ReportJob.objects.create(report=report, params=params, cache_key=cache_key)
+    transaction.on_commit(lambda: schedule_report_job(job.id))
+    return job
+
+
+def run_report_job(job_id):
+    """Строит артефакт задачи. Задачу забирает только один исполнитель."""
+    claimed = ReportJob.objects.filter(id=job_id, status='queued').update(
+        status='running', started_at=timezone.now(),
+    )
+    if not claimed:
+        return
+    job = ReportJob.objects.get(id=job_id)
+    try:
+        path = f"reports/{job.cache_key}.xlsx"
+        if not default_storage.exists(path):
+            with tempfile.TemporaryFile() as tmp:
+                REPORT_BUILDERS[job.report](job.params).save(tmp)
+                tmp.seek(0)
+                path = default_storage.save(path, File(tmp))
+    except Exception as e:
+        ReportJob.objects.filter(id=job_id).update(status='failed', error=str(e), finished_at=timezone.now())
+        raise
+    ReportJob.objects.filter(id=job_id).update(status='done', artifact=path, finished_at=timezone.now())
+
+
+def _run_report_job_in_worker(job_id):
+    try:
+        run_report_job(job_id)
+    finally:
+        connection.close()
+
+
+def schedule_report_job(job_id):
+    """Запускает задачу в пуле 'reports' или, при REPORT_JOBS_ASYNC = False, сразу."""
+    if getattr(settings, 'REPORT_JOBS_ASYNC', True):
+        get_executor('reports').submit(_run_report_job_in_worker, job_id)
+    else:
+        run_report_job(job_id)
@@ -1,22 +1,74 @@
-from typing import List
+from typing import List, Optional
 from ninja import Router
 from ninja.errors import HttpError
-from django.shortcuts import get_object_or_404
+from django.http import HttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
 
+from core.cache import acached_response
 from warehouseApp.models import Warehouse
-from warehouseApp.schemas import WarehouseIn, WarehouseOut, WarehouseUpdate
+from warehouseApp.schemas import (
+    WarehouseIn, WarehouseOut, WarehouseStockOut, WarehouseSummaryOut, WarehouseUpdate,
+)
+from warehouseApp.utils import LOW_STOCK_THRESHOLD, stock_row, warehouse_stock, warehouse_summaries
 
 warehouse_router = Router(tags=['Склады'])
 
+STOCK_PAGE_SIZE = 50
+STOCK_MAX_PAGE_SIZE = 500
+
 @warehouse_router.get('/warehouse_list',response=List[WarehouseOut])
-def get_warehouses(request):
-    warehouses = Warehouse.objects.all()
-    return warehouses
+async def get_warehouses(request, response: HttpResponse):
+    async def load():
+        return [warehouse async for warehouse in Warehouse.objects.values('id', 'name', 'address').aiterator()]
+
+    return await acached_response(
+        request, response,
+        key="warehouse_list",
+        dependencies=[('warehouse', 'all')],
+        producer=load,
+    )
 
 @warehouse_router.get('/warehouse/{warehouse_id}', response=WarehouseOut)
-def get_warehouse_detail(request, warehouse_id: int):
-    warehouse = get_object_or_404(Warehouse, id=warehouse_id)
-    return warehouse
+async def get_warehouse_detail(request, response: HttpResponse, warehouse_id: int):
+    return await acached_response(
+        request, response,
+        key=f"warehouse_detail:{warehouse_id}",
+        dependencies=[('warehouse', warehouse_id)],
+        producer=lambda: aget_object_or_404(Warehouse.objects.values('id', 'name', 'address'), id=warehouse_id),
+    )
+
+
+@warehouse_router.get('/warehouse_summary', response=List[WarehouseSummaryOut])
+async def get_warehouse_summary(request, low_stock: int = LOW_STOCK_THRESHOLD):
+    """Число товаров, единиц, стоимость остатков, товары с низким остатком и открытые заказы по складам."""
+    if low_stock < 0:
+        raise HttpError(400, "low_stock не может быть отрицательным")
+    return [row async for row in warehouse_summaries(low_stock)]
+
+
+@warehouse_router.get('/warehouse/{warehouse_id}/stock', response=List[WarehouseStockOut])
+async def get_warehouse_stock(
+    request,
+    response: HttpResponse,
+    warehouse_id: int,
+    cursor: Optional[int] = None,
+    limit: int = STOCK_PAGE_SIZE,
+    low_stock_only: bool = False,
+    low_stock: int = LOW_STOCK_THRESHOLD,
+):
+    if not 0 < limit <= STOCK_MAX_PAGE_SIZE:
+        raise HttpError(400, f"limit должен быть от 1 до {STOCK_MAX_PAGE_SIZE}")
+    if not await Warehouse.objects.filter(id=warehouse_id).aexists():
+        raise HttpError(404, f"Склад с id={warehouse_id} не найден")
+
+    # Лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+    page = [stock async for stock in warehouse_stock(warehouse_id, cursor, low_stock_only, low_stock)[:limit + 1]]
+    has_more = len(page) > limit
+    page = page[:limit]
+    response['X-Has-More'] = 'true' if has_more else 'false'
+    if has_more:
+        response['X-Next-Cursor'] = str(page[-1].product_id)
+    return [stock_row(stock, low_stock) for stock in page]
 
 
 @warehouse_router.post('/warehouse_create', response=WarehouseOut)
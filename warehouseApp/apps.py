@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class WarehouseappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'warehouseApp'
+
+    def ready(self):
+        from warehouseApp import signals  # noqa: F401
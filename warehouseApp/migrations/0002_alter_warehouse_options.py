@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 02:04
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouseApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='warehouse',
+            options={'verbose_name_plural': 'Warehouse (Склады)'},
+        ),
+    ]
@@ -1,3 +1,4 @@
+from decimal import Decimal
 from typing import Optional
 
 from ninja import Schema
@@ -13,4 +14,23 @@ class WarehouseOut(Schema):
 
 class WarehouseUpdate(Schema):
     name: Optional[str] = None
-    address: Optional[str] = None
\ No newline at end of file
+    address: Optional[str] = None
+
+class WarehouseSummaryOut(Schema):
+    id: int
+    name: str
+    address: Optional[str] = None
+    sku_count: int
+    total_units: int
+    stock_value: Decimal
+    low_stock_skus: int
+    open_orders: int
+
+class WarehouseStockOut(Schema):
+    product_id: int
+    name: str
+    product_type: str
+    price: Decimal
+    quantity: int
+    value: Decimal
+    low_stock: bool
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.cache import bump_versions
+from warehouseApp.models import Warehouse
+
+
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+def invalidate_warehouse(sender, instance, **kwargs):
+    bump_versions('warehouse', [instance.pk, 'all'])
@@ -1,3 +1,81 @@
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from orderApp.models import Order
+from productApp.models import Product, Stock
+from warehouseApp.models import Warehouse
+
+
+class WarehouseSummaryTests(TestCase):
+    url = '/api/warehouses/warehouse_summary'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Warehouse.objects.create(name="Основной", address="ул. Ленина, 1")
+        cls.spare = Warehouse.objects.create(name="Запасной", address="ул. Мира, 2")
+        cls.empty = Warehouse.objects.create(name="Пустой", address="ул. Садовая, 3")
+        cls.products = [
+            Product.objects.create(name=f"Товар {n}", product_type="Фрукты", price=Decimal('2.50') * (n + 1))
+            for n in range(5)
+        ]
+        # Основной склад: 100, 5, 0, 30, 1 шт.; запасной — только первый товар
+        for product, quantity in zip(cls.products, (100, 5, 0, 30, 1)):
+            Stock.objects.create(product=product, warehouse=cls.main, quantity=quantity)
+        Stock.objects.create(product=cls.products[0], warehouse=cls.spare, quantity=7)
+        for status in ('new', 'processing', 'shipped', 'cancelled'):
+            Order.objects.create(warehouse=cls.main, client_name="Иванов", destination_address="—", status=status)
+        Order.objects.create(warehouse=cls.spare, client_name="Петров", destination_address="—")
+
+    def test_summary_for_all_warehouses_in_one_query(self):
+        with self.assertNumQueries(1):
+            rows = {row['name']: row for row in self.client.get(self.url).json()}
+
+        main = rows["Основной"]
+        self.assertEqual(main['sku_count'], 4)
+        self.assertEqual(main['total_units'], 136)
+        # 100 * 2.50 + 5 * 5.00 + 30 * 10.00 + 1 * 12.50
+        self.assertEqual(Decimal(main['stock_value']), Decimal('587.50'))
+        self.assertEqual(main['low_stock_skus'], 3)
+        self.assertEqual(main['open_orders'], 2)
+
+        self.assertEqual(rows["Запасной"]['low_stock_skus'], 1)
+        self.assertEqual(rows["Запасной"]['open_orders'], 1)
+        self.assertEqual(
+            {key: rows["Пустой"][key] for key in ('sku_count', 'total_units', 'low_stock_skus', 'open_orders')},
+            {'sku_count': 0, 'total_units': 0, 'low_stock_skus': 0, 'open_orders': 0},
+        )
+        self.assertEqual(Decimal(rows["Пустой"]['stock_value']), 0)
+
+    def test_low_stock_threshold(self):
+        rows = {row['name']: row for row in self.client.get(self.url, {'low_stock': 0}).json()}
+        self.assertEqual(rows["Основной"]['low_stock_skus'], 1)
+        self.assertEqual(self.client.get(self.url, {'low_stock': -1}).status_code, 400)
+
+    def test_stock_listing_pages_by_product(self):
+        url = f'/api/warehouses/warehouse/{self.main.id}/stock'
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            # Проверка склада и страница с товарами, без запроса на каждую строку
+            with self.assertNumQueries(2):
+                response = self.client.get(url, params)
+            seen += response.json()
+            cursor = response.get('X-Next-Cursor')
+            if response['X-Has-More'] == 'false':
+                break
+
+        self.assertEqual([row['product_id'] for row in seen], [p.id for p in self.products])
+        self.assertEqual(seen[3]['name'], "Товар 3")
+        self.assertEqual(Decimal(seen[3]['value']), Decimal('300.00'))
+        self.assertEqual([row['low_stock'] for row in seen], [False, True, True, False, True])
+
+    def test_stock_listing_low_stock_only_and_errors(self):
+        url = f'/api/warehouses/warehouse/{self.main.id}/stock'
+        rows = self.client.get(url, {'low_stock_only': True}).json()
+        self.assertEqual([row['quantity'] for row in rows], [5, 0, 1])
+        self.assertEqual(self.client.get(url, {'limit': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/api/warehouses/warehouse/999999/stock').status_code, 404)
@@ -0,0 +1,73 @@
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from orderApp.models import Order
+from productApp.models import Stock
+from warehouseApp.models import Warehouse
+
+# Остаток не больше порога считается низким, нулевой — тоже
+LOW_STOCK_THRESHOLD = 10
+# Заказы, товар по которым ещё не покинул склад
+OPEN_ORDER_STATUSES = ('new', 'processing')
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def warehouse_summaries(low_stock=LOW_STOCK_THRESHOLD):
+    """
+    Сводка по всем складам одним запросом: GROUP BY по остаткам с JOIN товаров
+    и коррелированный подзапрос открытых заказов (JOIN заказов размножил бы строки остатков).
+
+    sku_count — товары с ненулевым остатком, stock_value — Sum(quantity * price).
+    """
+    open_orders = (
+        Order.objects.filter(warehouse=OuterRef('pk'), status__in=OPEN_ORDER_STATUSES)
+        .order_by()
+        .values('warehouse')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    return (
+        Warehouse.objects.order_by('id')
+        .annotate(
+            sku_count=Count('stocks', filter=Q(stocks__quantity__gt=0)),
+            total_units=Coalesce(Sum('stocks__quantity'), 0),
+            stock_value=Coalesce(
+                Sum(F('stocks__quantity') * F('stocks__product__price'), output_field=MONEY),
+                Value(0), output_field=MONEY,
+            ),
+            low_stock_skus=Count('stocks', filter=Q(stocks__quantity__lte=low_stock)),
+            open_orders=Coalesce(Subquery(open_orders, output_field=IntegerField()), 0),
+        )
+        .values(
+            'id', 'name', 'address', 'sku_count', 'total_units', 'stock_value', 'low_stock_skus', 'open_orders',
+        )
+    )
+
+
+def warehouse_stock(warehouse_id, cursor=None, low_stock_only=False, low_stock=LOW_STOCK_THRESHOLD):
+    """
+    Остатки склада по возрастанию id товара с товаром в том же запросе.
+
+    Keyset-пагинация: cursor — id последнего товара предыдущей страницы,
+    порядок совпадает с индексом (warehouse, product).
+    """
+    stocks = Stock.objects.filter(warehouse_id=warehouse_id).select_related('product').order_by('product_id')
+    if cursor is not None:
+        stocks = stocks.filter(product_id__gt=cursor)
+    if low_stock_only:
+        stocks = stocks.filter(quantity__lte=low_stock)
+    return stocks
+
+
+def stock_row(stock, low_stock=LOW_STOCK_THRESHOLD):
+    product = stock.product
+    return {
+        "product_id": product.id,
+        "name": product.name,
+        "product_type": product.product_type,
+        "price": product.price,
+        "quantity": stock.quantity,
+        "value": product.price * stock.quantity,
+        "low_stock": stock.quantity <= low_stock,
+    }